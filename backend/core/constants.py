@@ -1,6 +1,7 @@
 """
 定数定義
 """
+import os
 
 # ゴールアクション（最終結論）のデフォルト値
 DEFAULT_GOAL_ACTIONS = [
@@ -14,3 +15,47 @@ DEFAULT_GOAL_ACTIONS = [
     "H-1Bビザでの申請ができます",
     "J-1ビザの申請ができます",
 ]
+
+# セッションストアの上限
+SESSION_IDLE_TTL_SECONDS = 60 * 60          # 最終アクセスから破棄までの秒数
+SESSION_MAX_COUNT = 2000                    # 保持するセッション数の上限
+SESSION_MAX_BYTES = 64 * 1024 * 1024        # 保持するセッションの合計サイズの上限（概算）
+SESSION_SWEEP_INTERVAL_SECONDS = 60         # 期限切れセッションを掃除する間隔
+
+# セッションストアのバックエンド（"memory" または "sqlite"、環境変数 SESSION_STORE で上書き可）
+SESSION_STORE_BACKEND = "memory"
+SESSION_DB_FILE = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "sessions.sqlite3")
+
+# ステートレス診断の再現キャッシュに保持する回答列の数
+STATELESS_REPLAY_CACHE_SIZE = 4096
+
+# セッション間で共有する推論結果の置換表に保持するステップ数
+TRANSPOSITION_CACHE_SIZE = 20000
+
+# 診断開始テンプレートを保持する初期事実の組み合わせ数
+START_TEMPLATE_CACHE_SIZE = 512
+
+# 前の質問に戻るためのチェックポイントを保存する間隔（回答数）
+GO_BACK_CHECKPOINT_INTERVAL = 4
+
+# 推論ログに保持するイベント数（超えた分は古いものから捨てる）
+REASONING_LOG_MAX_EVENTS = 1000
+
+# 推論ログの取得で1回に返す行数のデフォルト
+REASONING_LOG_PAGE_SIZE = 100
+
+# 質問の決定DAG（services.question_dagでコンパイルする成果物）とコンパイル時のノード数の上限
+QUESTION_DAG_FILE = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "question_dag.json")
+QUESTION_DAG_MAX_NODES = 20000
+
+# 状態空間の探索（services.explorer）の上限
+EXPLORER_MAX_DEPTH = 60                     # 1経路の質問数（超えた経路は打ち切る）
+EXPLORER_MAX_STATES = 1000000               # ワーカーごとにメモする状態数
+EXPLORER_TRUNCATED_SAMPLES = 20             # 報告する打ち切った経路の例の数
+EXPLORER_JOB_HISTORY = 10                   # 保持する探索ジョブの数
+EXPLORER_MAX_WORKERS = 8                    # ワーカープロセス数（省略時はCPU数とこの小さい方）
+
+# 次の質問の選び方（"rules_order" または "decisive"、環境変数 QUESTION_STRATEGY で上書き可）
+QUESTION_STRATEGY = "rules_order"
+# decisiveで回答の確率に使う過去の回答の頻度（{条件: {"yes": 回数, "no": 回数, "unknown": 回数}}、なければ等確率）
+ANSWER_FREQUENCIES_FILE = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "answer_frequencies.json")
@@ -11,6 +11,11 @@ class FactStatus(Enum):
     UNKNOWN = "unknown"
     PENDING = "pending"
 
+    @classmethod
+    def from_answer(cls, answer: str) -> "FactStatus":
+        """回答（"yes"/"no"/"unknown"）をステータスに変換（それ以外はUNKNOWN）"""
+        return {"yes": cls.TRUE, "no": cls.FALSE}.get(answer, cls.UNKNOWN)
+
 
 class RuleStatus(Enum):
     """ルールの評価状態"""
@@ -5,7 +5,7 @@ from typing import List
 from dataclasses import dataclass
 
 
-@dataclass
+@dataclass(slots=True)
 class Rule:
     """ルールクラス
 
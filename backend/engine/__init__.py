@@ -2,5 +2,14 @@
 Engine - 推論エンジンモジュール
 """
 from .inference import InferenceEngine
+from .vectorized import VectorizedRuleEvaluator
+from .batch import diagnose_batch
+from .transposition import TranspositionCache, transposition_cache
 
-__all__ = ["InferenceEngine"]
+__all__ = [
+    "InferenceEngine",
+    "VectorizedRuleEvaluator",
+    "diagnose_batch",
+    "TranspositionCache",
+    "transposition_cache",
+]
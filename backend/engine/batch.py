@@ -0,0 +1,74 @@
+"""
+一括診断 - 複数ケースの非対話評価
+"""
+from typing import Any, Dict, List, Mapping, Sequence
+
+from core import FactStatus, RuleStatus
+from knowledge import KnowledgeBase
+from .working_memory import WorkingMemory, RuleStates
+from .evaluator import RuleEvaluator
+from .questions import QuestionFinder
+from .vectorized import VectorizedRuleEvaluator, CODE_STATUSES
+
+
+# 知識ベースのバージョンごとのベクトル化評価器（最新バージョンの分だけ保持）
+_evaluators: Dict[str, VectorizedRuleEvaluator] = {}
+
+
+def get_vectorized_evaluator(knowledge_base: KnowledgeBase) -> VectorizedRuleEvaluator:
+    """知識ベースに対応するベクトル化評価器を取得（バージョンごとに初回のみ構築）"""
+    evaluator = _evaluators.get(knowledge_base.version)
+    if evaluator is None:
+        evaluator = VectorizedRuleEvaluator(knowledge_base)
+        _evaluators.clear()
+        _evaluators[knowledge_base.version] = evaluator
+    return evaluator
+
+
+def diagnose_batch(
+    knowledge_base: KnowledgeBase,
+    fact_sets: Sequence[Mapping[str, FactStatus]]
+) -> List[Dict[str, Any]]:
+    """事実の組ごとにゴールの状態・導出された事実・次の質問を返す
+
+    全ケースをVectorizedRuleEvaluatorで一度に不動点まで評価し、
+    次の質問だけをケースごとにQuestionFinderで探索する。
+    """
+    vectorized = get_vectorized_evaluator(knowledge_base)
+    findings = vectorized.encode_facts(fact_sets)
+    statuses, hypotheses = vectorized.solve(findings)
+
+    results = []
+    for row, facts in enumerate(fact_sets):
+        working_memory = WorkingMemory(
+            findings=dict(facts),
+            hypotheses=vectorized.decode_facts(hypotheses, row)
+        )
+        rule_states = RuleStates(knowledge_base.rule_by_id)
+        for rule, code in zip(knowledge_base.rules, statuses[row]):
+            status = CODE_STATUSES[int(code)]
+            if status != RuleStatus.PENDING:
+                rule_states[rule.id].status = status
+        evaluator = RuleEvaluator(working_memory, rule_states, knowledge_base)
+        next_question, _ = QuestionFinder(knowledge_base, rule_states, evaluator).next_question()
+
+        goal_statuses = [
+            {
+                "rule_id": goal.id,
+                "visa": goal.action,
+                "status": rule_states.status(goal.id).value
+            }
+            for goal in knowledge_base.goal_rules
+        ]
+        is_complete = next_question is None or all(
+            RuleStatus.is_resolved(rule_states.status(goal.id)) for goal in knowledge_base.goal_rules
+        )
+
+        results.append({
+            "goal_statuses": goal_statuses,
+            "derived_facts": list(working_memory.hypotheses.keys()),
+            "next_question": next_question,
+            "is_complete": is_complete
+        })
+
+    return results
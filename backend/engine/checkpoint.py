@@ -0,0 +1,26 @@
+"""
+チェックポイント - 前の質問に戻るための推論状態の控え
+"""
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, Optional, Tuple
+
+from core import FactStatus, RuleStatus
+
+
+@dataclass(frozen=True)
+class Checkpoint:
+    """回答を適用し終えた時点の推論状態
+
+    所見は回答履歴の先頭から復元できるため保持しない。
+    - statuses: PENDING以外のルールステータス
+    - marked: 質問探索でEVALUATINGにマークしたルール
+    - hypotheses: 仮説（導出順）
+    - lineage: 置換表のキーとなる経緯
+    """
+    statuses: Dict[str, RuleStatus]
+    marked: FrozenSet[str]
+    hypotheses: Tuple[Tuple[str, FactStatus], ...]
+    question: Optional[str]
+    goal_id: Optional[str]
+    evaluated: bool
+    lineage: Optional[Tuple[FrozenSet, Tuple]]
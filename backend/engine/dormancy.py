@@ -0,0 +1,120 @@
+"""
+休眠ルール - 結論の確定したゴールだけを支えるルールの追跡
+"""
+from typing import Dict, List, Set
+
+from core import Rule, FactStatus, RuleStatus
+from knowledge import RuleNetwork
+from .working_memory import WorkingMemory, RuleStates
+from .evaluator import RuleEvaluator
+
+
+class DormantRules:
+    """休眠ルールの集合
+
+    ルールごとに、そのルールを支えとするゴールのうち結論の確定していないものの数を数え
+    （初期値は知識ベースのgoal_ref_count）、0になったルールのうちステータスも確定したものを休眠とする。
+    ルールのactionを参照するルールが支えるゴールはそのルールが支えるゴールに含まれるため、
+    休眠ルールの結果を使うのは休眠ルールだけになる。休眠ルールはステータスもactionの仮説も
+    以降変わらないため、ソルバーが評価しなくても推論・表示は変わらない。
+    ステータスが確定していないルールは、支えるゴールが確定した後も条件が回答されれば評価する。
+
+    導出条件は直接質問されることがあり、その回答は後から導出された仮説で上書きされるため、
+    解決済みのゴールでもステータスが変わりうる。ゴールの結論は、以降変わらない条件の値
+    （回答済みの基本条件と、導出ルールがすべて確定して値の決まった導出条件）で決まったときに確定とする。
+    - 確定は回答を重ねても覆らないため、確定したルール・ゴールは調べ直さない
+    - ルールの状態や所見を丸ごと入れ替えた場合はreset()で数え直す
+    """
+    __slots__ = (
+        "network", "working_memory", "rule_states", "evaluator",
+        "dormant", "_settled", "_settled_goals", "_remaining", "_unsupported"
+    )
+
+    def __init__(
+        self,
+        network: RuleNetwork,
+        working_memory: WorkingMemory,
+        rule_states: RuleStates,
+        evaluator: RuleEvaluator
+    ):
+        self.network = network
+        self.working_memory = working_memory
+        self.rule_states = rule_states
+        self.evaluator = evaluator
+        self.reset()
+
+    def __contains__(self, rule_id: str) -> bool:
+        return rule_id in self.dormant
+
+    def __len__(self) -> int:
+        return len(self.dormant)
+
+    def reset(self):
+        """現在の状態から数え直す"""
+        self.dormant: Set[str] = set()
+        # ステータスが以降変わらないルール
+        self._settled: Set[str] = set()
+        self._settled_goals: Set[str] = set()
+        # 数を減らしたルールだけを持つ（それ以外はgoal_ref_countのまま）
+        self._remaining: Dict[str, int] = {}
+        # 支えるゴールがすべて確定したが、ステータスが確定していないルール
+        self._unsupported: Set[str] = set()
+        self.update()
+
+    def update(self) -> List[str]:
+        """新たに結論の確定したゴールの分を数え、新たに休眠したルールを返す"""
+        newly_dormant: List[str] = []
+        for goal in self.network.goal_rules:
+            if goal.id in self._settled_goals:
+                continue
+            if not RuleStatus.is_resolved(self.rule_states.status(goal.id)) or not self._is_settled(goal):
+                continue
+            self._settled_goals.add(goal.id)
+            for rule in self.network.get_support_rules(goal):
+                remaining = self._remaining.get(rule.id, self.network.goal_ref_count[rule.id]) - 1
+                self._remaining[rule.id] = remaining
+                if remaining == 0:
+                    self._unsupported.add(rule.id)
+
+        for rule_id in [r for r in self._unsupported if self._is_settled(self.network.rule_by_id[r])]:
+            self._unsupported.discard(rule_id)
+            self.dormant.add(rule_id)
+            newly_dormant.append(rule_id)
+        return newly_dormant
+
+    def _is_settled(self, rule: Rule) -> bool:
+        """ルールのステータスが以降変わらないか
+
+        解決済みで、ANDルールはFALSE、ORルールはTRUEに確定した条件が1つあるか、
+        すべての条件の値が確定していれば確定。
+        """
+        if rule.id in self._settled:
+            return True
+        if not RuleStatus.is_resolved(self.rule_states.status(rule.id)):
+            return False
+        decisive = FactStatus.TRUE if rule.is_or_rule else FactStatus.FALSE
+        settled = True
+        for cond in rule.conditions:
+            if not self._is_settled_condition(cond):
+                settled = False
+            elif self.evaluator.get_effective_value(cond) == decisive:
+                settled = True
+                break
+        if settled:
+            self._settled.add(rule.id)
+        return settled
+
+    def _is_settled_condition(self, condition: str) -> bool:
+        """条件の値が以降変わらないか
+
+        導出条件は、回答も「はい」「いいえ」の仮説もなければ、後から直接質問されて値が変わりうる。
+        """
+        answered = self.working_memory.findings.get(condition) in (
+            FactStatus.TRUE, FactStatus.FALSE, FactStatus.UNKNOWN
+        )
+        if condition not in self.network.derived_conditions:
+            return answered
+        hypothesis = self.working_memory.hypotheses.get(condition)
+        if not answered and hypothesis not in (FactStatus.TRUE, FactStatus.FALSE):
+            return False
+        return all(self._is_settled(rule) for rule in self.network.get_deriving_rules(condition))
@@ -1,10 +1,11 @@
 """
 ルール評価ロジック
 """
-from typing import Dict, List, Optional
+from typing import List, Optional, Tuple
 
 from core import Rule, FactStatus, RuleStatus
-from .working_memory import WorkingMemory, RuleState
+from knowledge import RuleNetwork
+from .working_memory import WorkingMemory, RuleStates
 
 
 class RuleEvaluator:
@@ -13,14 +14,13 @@ class RuleEvaluator:
     def __init__(
         self,
         working_memory: WorkingMemory,
-        rule_states: Dict[str, RuleState],
-        derived_conditions: set,
-        rules: List[Rule]
+        rule_states: RuleStates,
+        network: RuleNetwork
     ):
         self.working_memory = working_memory
         self.rule_states = rule_states
-        self.derived_conditions = derived_conditions
-        self.rules = rules
+        self.network = network
+        self.derived_conditions = network.derived_conditions
 
     def get_effective_value(self, condition: str) -> Optional[FactStatus]:
         """条件の実効値を取得
@@ -42,27 +42,38 @@ class RuleEvaluator:
             return hypo_val
         return None
 
-    def get_deriving_rules(self, condition: str) -> List[Rule]:
-        """条件を導出するルールを取得"""
-        return [r for r in self.rules if r.action == condition]
+    def get_deriving_rules(self, condition: str) -> Tuple[Rule, ...]:
+        """条件を導出するルールを取得（ルールネットワークの索引を参照）"""
+        return self.network.get_deriving_rules(condition)
 
     def evaluate_all_rules(self):
         """全ルールを評価してステータスを更新"""
-        for rule_id, state in self.rule_states.items():
-            self._evaluate_single_rule(state)
+        for rule_id in self.rule_states:
+            self.evaluate_rule(rule_id)
 
-    def _evaluate_single_rule(self, state: RuleState):
-        """単一ルールを評価"""
-        rule = state.rule
+    def evaluate_rule(self, rule_id: str) -> bool:
+        """単一ルールを評価し、ステータスが変化したかを返す
 
+        ステータスが変化した場合だけルールの状態を作成する（PENDINGのままのルールは状態を持たない）。
+        """
+        prev_status = self.rule_states.status(rule_id)
+        status = self._evaluate_single_rule(self.network.rule_by_id[rule_id], prev_status)
+        if status == prev_status:
+            return False
+        self.rule_states[rule_id].status = status
+        return True
+
+    def _evaluate_single_rule(self, rule: Rule, status: RuleStatus) -> RuleStatus:
+        """単一ルールを評価し、新しいステータスを返す（決まらなければstatusのまま）"""
         all_true = True
         any_true = False
         any_false = False
         has_unknown = False
+        values = []
 
         for cond in rule.conditions:
             val = self.get_effective_value(cond)
-            state.checked_conditions[cond] = val if val else FactStatus.PENDING
+            values.append(val)
 
             if val == FactStatus.TRUE:
                 any_true = True
@@ -76,21 +87,24 @@ class RuleEvaluator:
                 all_true = False
 
         if rule.is_or_rule:
-            self._evaluate_or_rule(state, any_true)
-        else:
-            self._evaluate_and_rule(state, all_true, any_false, has_unknown)
+            return self._evaluate_or_rule(rule, status, any_true, values)
+        return self._evaluate_and_rule(rule, status, all_true, any_false, has_unknown)
 
-    def _evaluate_or_rule(self, state: RuleState, any_true: bool):
+    def _evaluate_or_rule(
+        self,
+        rule: Rule,
+        status: RuleStatus,
+        any_true: bool,
+        values: List[Optional[FactStatus]]
+    ) -> RuleStatus:
         """ORルールを評価"""
         if any_true:
-            state.status = RuleStatus.FIRED
-            return
+            return RuleStatus.FIRED
 
         all_resolved_negative = True
         has_any_unknown = False
 
-        for cond in state.rule.conditions:
-            val = state.checked_conditions.get(cond)
+        for cond, val in zip(rule.conditions, values):
             if val == FactStatus.TRUE:
                 all_resolved_negative = False
                 break
@@ -99,7 +113,7 @@ class RuleEvaluator:
                 if cond in self.derived_conditions:
                     deriving_rules = self.get_deriving_rules(cond)
                     for dr in deriving_rules:
-                        if not RuleStatus.is_resolved(self.rule_states[dr.id].status):
+                        if not RuleStatus.is_resolved(self.rule_states.status(dr.id)):
                             all_resolved_negative = False
                             break
                     if not all_resolved_negative:
@@ -109,18 +123,27 @@ class RuleEvaluator:
                 break
 
         if all_resolved_negative:
-            state.status = RuleStatus.UNCERTAIN if has_any_unknown else RuleStatus.BLOCKED
+            return RuleStatus.UNCERTAIN if has_any_unknown else RuleStatus.BLOCKED
+        return status
 
-    def _evaluate_and_rule(self, state: RuleState, all_true: bool, any_false: bool, has_unknown: bool):
+    def _evaluate_and_rule(
+        self,
+        rule: Rule,
+        status: RuleStatus,
+        all_true: bool,
+        any_false: bool,
+        has_unknown: bool
+    ) -> RuleStatus:
         """ANDルールを評価"""
         if all_true:
-            state.status = RuleStatus.FIRED
-        elif any_false:
-            state.status = RuleStatus.BLOCKED
-        elif has_unknown:
+            return RuleStatus.FIRED
+        if any_false:
+            return RuleStatus.BLOCKED
+        if has_unknown:
             all_answered = all(
                 self.get_effective_value(cond) not in (None, FactStatus.PENDING)
-                for cond in state.rule.conditions
+                for cond in rule.conditions
             )
             if all_answered:
-                state.status = RuleStatus.UNCERTAIN
+                return RuleStatus.UNCERTAIN
+        return status
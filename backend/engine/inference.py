@@ -1,12 +1,21 @@
 """
 推論エンジン - バックワードチェイニング実装
 """
-from typing import Dict, List, Optional, Set, Any
+from collections import ChainMap
+from typing import Any, Callable, Dict, FrozenSet, List, Optional, Sequence, Set, Tuple
 
 from core import Rule, FactStatus, RuleStatus
-from knowledge import get_all_rules, get_goal_rules, get_derived_conditions
-from .working_memory import WorkingMemory, RuleState
+from core.constants import GO_BACK_CHECKPOINT_INTERVAL
+from knowledge import get_knowledge_base
+from .working_memory import WorkingMemory, RuleStates
+from .checkpoint import Checkpoint
+from .reasoning_log import ReasoningLog, LOG_START, LOG_ANSWER, LOG_BACK, LOG_TEXT
 from .evaluator import RuleEvaluator
+from .solver import FixpointSolver
+from .dormancy import DormantRules
+from .questions import QuestionFinder
+from .ordering import RULES_ORDER, resolve_strategy, get_ordering
+from .transposition import TranspositionEntry, transposition_cache
 
 
 class InferenceEngine:
@@ -16,64 +25,176 @@ class InferenceEngine:
     バックワードチェイニングによる推論を実装。
     """
 
-    MAX_EVALUATION_ITERATIONS = 10
-    MAX_PROPAGATION_ITERATIONS = 100
-
     FACT_STATUS_DISPLAY = {
         FactStatus.TRUE: "true",
         FactStatus.FALSE: "false",
         FactStatus.UNKNOWN: "unknown",
     }
 
-    def __init__(self):
+    # 回答履歴のステータス → 回答（戻った後に回答を適用し直す際の推論ログ用）
+    STATUS_ANSWERS = {FactStatus.TRUE: "yes", FactStatus.FALSE: "no", FactStatus.UNKNOWN: "unknown"}
+
+    # 簡易形式の応答での条件の値の1文字表現（未確認は"-"）
+    CONDITION_VALUE_CODES = {FactStatus.TRUE: "t", FactStatus.FALSE: "f", FactStatus.UNKNOWN: "u"}
+
+    # 直列化時・簡易形式の応答でのルールステータスの1文字表現（値の頭文字はすべて異なる）
+    RULE_STATUS_CODES = {status: status.value[0] for status in RuleStatus}
+    CODE_RULE_STATUSES = {code: status for status, code in RULE_STATUS_CODES.items()}
+
+    def __init__(
+        self,
+        incremental: bool = True,
+        use_transposition: bool = True,
+        question_strategy: Optional[str] = None
+    ):
+        self.incremental = incremental
+        self.use_transposition = use_transposition
+        # 質問の順序（省略時は環境変数 QUESTION_STRATEGY。rules_orderならorderingはNone）
+        self.question_strategy = resolve_strategy(question_strategy)
+        self.ordering = get_ordering(self.question_strategy)
         self.working_memory = WorkingMemory()
-        self.rules = get_all_rules()
-        self.rule_states: Dict[str, RuleState] = {}
+        # 知識ベースはコピーせず参照する（再読み込み後も開始時のスナップショットで推論する）
+        self.knowledge_base = get_knowledge_base()
+        self.rules = self.knowledge_base.rules
+        # ルールの状態は辿ったルールの分だけ作成する
+        self.rule_states = RuleStates(self.knowledge_base.rule_by_id)
         self.current_question: Optional[str] = None
         self.current_goal: Optional[Rule] = None
-        self.derived_conditions = get_derived_conditions()
-        self.reasoning_log: List[str] = []
-
-        for rule in self.rules:
-            self.rule_states[rule.id] = RuleState(rule=rule)
-
+        self.derived_conditions = self.knowledge_base.derived_conditions
+        self.reasoning_log = ReasoningLog()
+        # 状態の連番（開始・回答・戻るのたびに増える。差分応答の基準の確認に使う）
+        self.sequence = 0
+        # 全ルールを起点に不動点まで評価済みか（以降は差分伝播で済む）
+        self._evaluated = False
+        # 置換表のキーとなる経緯: (一から評価した時点の所見, その後の回答列)。不明ならNone
+        self._lineage: Optional[Tuple[FrozenSet, Tuple]] = None
+        # 置換表から復元した診断結果（該当ビザ・条件付きビザ）
+        self._cached_visas: Optional[Tuple[List, List]] = None
+        # 診断開始時の回答履歴の長さ（開始時点のチェックポイントの位置）。作り直せなくなったらNone
+        self._start_length: Optional[int] = None
+        # 回答履歴の先頭にある問診票の初期事実の数（開始より前に戻ると減る）。不明ならNone
+        self._initial_length: Optional[int] = None
+        # 回答履歴の長さ → その時点のチェックポイント（開始時と一定回答数ごと）
+        self._checkpoints: Dict[int, Checkpoint] = {}
+
+        self._build_components()
+
+    def _build_components(self):
+        """作業記憶とルールの状態を共有する評価器・ソルバー・質問探索を構築"""
         self.evaluator = RuleEvaluator(
             self.working_memory,
             self.rule_states,
-            self.derived_conditions,
-            self.rules
+            self.knowledge_base
+        )
+        self.dormant_rules = DormantRules(
+            self.knowledge_base,
+            self.working_memory,
+            self.rule_states,
+            self.evaluator
+        )
+        self.solver = FixpointSolver(
+            self.working_memory,
+            self.rule_states,
+            self.knowledge_base,
+            self.evaluator,
+            self.reasoning_log,
+            self.dormant_rules
+        )
+        self.question_finder = QuestionFinder(
+            self.knowledge_base,
+            self.rule_states,
+            self.evaluator,
+            self.ordering
         )
 
+    @property
+    def start_length(self) -> Optional[int]:
+        """診断開始時の回答履歴の長さ（開始時点のチェックポイントの位置）。不明ならNone"""
+        return self._start_length
+
+    @property
+    def initial_length(self) -> Optional[int]:
+        """回答履歴の先頭にある問診票の初期事実の数。不明ならNone"""
+        return self._initial_length
+
+    def fork(self) -> "InferenceEngine":
+        """現在の状態を共有する子エンジンを作成（コピーオンライト）
+
+        子の所見・仮説は親の上に重ねた層に書き込み、ルールの状態は子が最初に参照したときに複製する。
+        子を使う間は親を変更しないこと。
+        子は仮定の所見を伝播して結果を調べるためのもので、置換表・チェックポイント・戻る操作は使わない。
+        """
+        child = InferenceEngine.__new__(InferenceEngine)
+        child.incremental = self.incremental
+        child.use_transposition = False
+        child.ordering = self.ordering
+        child.question_strategy = self.question_strategy
+        child.working_memory = WorkingMemory(
+            findings=ChainMap({}, self.working_memory.findings),
+            hypotheses=ChainMap({}, self.working_memory.hypotheses),
+            answer_history=list(self.working_memory.answer_history)
+        )
+        child.knowledge_base = self.knowledge_base
+        child.rules = self.rules
+        child.rule_states = RuleStates(self.knowledge_base.rule_by_id, parent=self.rule_states)
+        child.current_question = self.current_question
+        child.current_goal = self.current_goal
+        child.derived_conditions = self.derived_conditions
+        child.reasoning_log = ReasoningLog()
+        child.sequence = self.sequence
+        child._evaluated = self._evaluated
+        child._lineage = None
+        child._cached_visas = None
+        child._start_length = None
+        child._initial_length = self._initial_length
+        child._checkpoints = {}
+        child._build_components()
+        return child
+
+    def assume(self, findings: Sequence[Tuple[str, FactStatus]]):
+        """所見を追加して不動点まで伝播（質問は探さない）"""
+        for cond, status in findings:
+            self.working_memory.put_finding(cond, status)
+        if self.incremental and self._evaluated:
+            self._solve_incremental([cond for cond, _ in findings])
+        else:
+            self._solve_all()
+
     def start_consultation(self) -> Optional[str]:
         """診断を開始"""
-        self.reasoning_log.append("診断を開始します。全ゴールルールを並行評価します。")
-        return self._get_next_question()
-
-    def answer_question(self, condition: str, answer: str) -> Dict[str, Any]:
-        """質問に回答"""
-        status = {"yes": FactStatus.TRUE, "no": FactStatus.FALSE}.get(answer, FactStatus.UNKNOWN)
-        self.working_memory.put_finding(condition, status)
-        self.reasoning_log.append(f"回答: 「{condition}」→ {answer}")
-
-        for _ in range(self.MAX_EVALUATION_ITERATIONS):
-            prev_hypotheses = dict(self.working_memory.hypotheses)
-            prev_statuses = {rid: s.status for rid, s in self.rule_states.items()}
-
-            self.evaluator.evaluate_all_rules()
-            self._propagate_inferences()
-
-            if (self.working_memory.hypotheses == prev_hypotheses and
-                all(self.rule_states[rid].status == prev_statuses[rid] for rid in self.rule_states)):
-                break
-
-        next_q = self._get_next_question()
+        self.reasoning_log.record(LOG_START)
+        self._lineage = (frozenset(self.working_memory.findings.items()), ())
+        question = self._advance(None)
+        self.sequence += 1
+        self._start_length = self._initial_length = len(self.working_memory.answer_history)
+        self._checkpoints[self._start_length] = self._make_checkpoint()
+        return question
+
+    def answer_question(
+        self,
+        condition: str,
+        answer: str,
+        compact: bool = False,
+        since_sequence: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """質問に回答
+
+        compactなら条件・ルールをカタログのIDで参照する形式で返す。
+        since_sequenceがこの回答前の状態の連番と一致すれば、表示情報は変化した分だけを返す
+        （一致しなければ全体を返す）。
+        """
+        base = self._delta_base(since_sequence)
+        next_q = self._apply_answer(condition, FactStatus.from_answer(answer), answer)
+        self.sequence += 1
         is_complete = next_q is None or self._is_diagnosis_complete()
 
         result = {
-            "next_question": next_q,
+            "next_question": self.get_condition_ref(next_q, compact),
             "is_complete": is_complete,
-            "derived_facts": list(self.working_memory.hypotheses.keys()),
-            "rules_status": self.get_rules_display_info()
+            "derived_facts": [self.get_condition_ref(c, compact) for c in self.working_memory.hypotheses],
+            **self.get_display_fields(compact, base),
+            **self._sequence_fields(since_sequence, base),
+            "rule_visits": self.solver.last_visit_count
         }
 
         if is_complete:
@@ -81,164 +202,134 @@ class InferenceEngine:
 
         return result
 
-    def _get_next_question(self) -> Optional[str]:
-        """次の質問を取得"""
-        goal_rules = get_goal_rules()
-
-        for goal_rule in goal_rules:
-            if self.rule_states[goal_rule.id].status in (RuleStatus.BLOCKED, RuleStatus.FIRED):
-                continue
-
-            question = self._find_next_question_for_rule(goal_rule)
-            if question:
-                self.current_question = question
-                self.current_goal = goal_rule
-                return question
-
-        self.current_goal = None
-        return None
-
-    def _find_next_question_for_rule(self, rule: Rule, visited: Set[str] = None) -> Optional[str]:
-        """ルールの条件を確認し、次の質問を見つける"""
-        if visited is None:
-            visited = set()
-
-        if rule.id in visited:
-            return None
-        visited.add(rule.id)
-
-        if self.rule_states[rule.id].status in (RuleStatus.BLOCKED, RuleStatus.FIRED):
-            return None
+    def _apply_answer(self, condition: str, status: FactStatus, answer: str) -> Optional[str]:
+        """回答を作業記憶に追加して推論を進め、次の質問を返す"""
+        self.working_memory.put_finding(condition, status)
+        self.question_finder.invalidate((condition,))
+        self.reasoning_log.record(LOG_ANSWER, condition, answer)
+
+        if not self._evaluated:
+            self._lineage = (frozenset(self.working_memory.findings.items()), ())
+        elif self._lineage is not None:
+            base, answers = self._lineage
+            self._lineage = (base, answers + ((condition, status),))
+
+        if self.incremental and self._evaluated:
+            question = self._advance(lambda: self._solve_incremental([condition]))
+        else:
+            question = self._advance(self._solve_all)
+
+        length = len(self.working_memory.answer_history)
+        if (
+            self._start_length is not None
+            and (length - self._start_length) % GO_BACK_CHECKPOINT_INTERVAL == 0
+        ):
+            self._checkpoints[length] = self._make_checkpoint()
+        return question
+
+    def _solve_all(self):
+        """全ルールを起点に不動点まで評価"""
+        self.solver.solve()
+        self._evaluated = True
+        self.question_finder.reset()
+
+    def _solve_incremental(self, conditions: List[str]):
+        """値が変化した条件を起点に不動点まで伝播"""
+        self.solver.solve(conditions)
+        self.question_finder.invalidate(self.solver.changed_conditions, self.solver.changed_rules)
+
+    def _advance(self, solve: Optional[Callable[[], None]]) -> Optional[str]:
+        """推論を進めて次の質問を取得（同じ経緯の結果が置換表にあれば再利用）
+
+        solveがNoneの場合は評価せずに質問だけを探す（診断開始時）。
+        """
+        self._cached_visas = None
+        key = None
+        if self.use_transposition and self._lineage is not None:
+            base, answers = self._lineage
+            evaluated = self._evaluated or solve is not None
+            key = (
+                self.knowledge_base.version, self.incremental, evaluated, base, answers,
+                self.ordering.key if self.ordering else None
+            )
+            entry = transposition_cache.get(key)
+            if entry is not None:
+                self._apply_transposition(entry)
+                if evaluated:
+                    self._evaluated = True
+                return entry.question
+
+        log_start = self.reasoning_log.total
+        if solve is not None:
+            solve()
+        question = self._get_next_question()
+
+        if key is not None:
+            transposition_cache.put(key, self._make_transposition(question, log_start))
+        return question
+
+    def _make_transposition(self, question: Optional[str], log_start: int) -> TranspositionEntry:
+        """現在の状態を置換表のエントリにする"""
+        applicable_visas = conditional_visas = None
+        if question is None or self._is_diagnosis_complete():
+            applicable_visas, conditional_visas = self._collect_visas()
+        return TranspositionEntry(
+            resolved={
+                rule_id: status
+                for rule_id, status in self.rule_states.snapshot().items()
+                if RuleStatus.is_resolved(status)
+            },
+            marked=frozenset(self.question_finder.marked),
+            hypotheses=tuple(self.working_memory.hypotheses.items()),
+            log=self.reasoning_log.since(log_start),
+            question=question,
+            goal_id=self.current_goal.id if self.current_goal else None,
+            applicable_visas=applicable_visas,
+            conditional_visas=conditional_visas
+        )
 
-        # このルールを評価中にマーク
-        if self.rule_states[rule.id].status == RuleStatus.PENDING:
-            self.rule_states[rule.id].status = RuleStatus.EVALUATING
+    def _apply_transposition(self, entry: TranspositionEntry):
+        """置換表のエントリを現在の状態に反映（評価と質問探索の代わり）"""
+        changed_rules = []
+        for rule_id, status in entry.resolved.items():
+            if self.rule_states.status(rule_id) != status:
+                changed_rules.append(rule_id)
+                self.rule_states[rule_id].status = status
+        for rule_id in entry.marked:
+            if rule_id not in entry.resolved and self.rule_states.status(rule_id) == RuleStatus.PENDING:
+                self.rule_states[rule_id].status = RuleStatus.EVALUATING
+
+        hypotheses = self.working_memory.hypotheses
+        previous = dict(hypotheses)
+        hypotheses.clear()
+        hypotheses.update(entry.hypotheses)
+        self.question_finder.invalidate(
+            [cond for cond in hypotheses.keys() | previous.keys() if hypotheses.get(cond) != previous.get(cond)],
+            changed_rules
+        )
+        self.reasoning_log.extend(entry.log)
+        self.dormant_rules.update()
+        self.solver.last_visit_count = 0
 
-        for cond in rule.conditions:
-            val = self.evaluator.get_effective_value(cond)
-
-            if val is None or val == FactStatus.PENDING:
-                return cond
-
-            elif val == FactStatus.UNKNOWN and cond in self.derived_conditions:
-                deriving_rules = self.evaluator.get_deriving_rules(cond)
-                for dr in deriving_rules:
-                    if self.rule_states[dr.id].status not in (RuleStatus.BLOCKED, RuleStatus.FIRED):
-                        sub_question = self._find_next_question_for_rule(dr, visited.copy())
-                        if sub_question:
-                            return sub_question
-
-            elif val == FactStatus.FALSE:
-                if not rule.is_or_rule:
-                    return None
-
-            elif val == FactStatus.TRUE:
-                if rule.is_or_rule:
-                    return None
-
-        return None
-
-    def _propagate_inferences(self):
-        """発火したルールから仮説を導出"""
-        for _ in range(self.MAX_PROPAGATION_ITERATIONS):
-            changed = False
-            for state in self.rule_states.values():
-                if state.status == RuleStatus.FIRED:
-                    action = state.rule.action
-                    if self.working_memory.get_value(action) != FactStatus.TRUE:
-                        self.working_memory.put_hypothesis(action, FactStatus.TRUE)
-                        self.reasoning_log.append(f"導出: 「{action}」（ルールが発火）")
-                        changed = True
-                        self._update_dependent_rules(action, FactStatus.TRUE)
-
-                    # ANDルールが発火した場合、UNKNOWNだった上流条件もTRUEとして導出
-                    if not state.rule.is_or_rule:
-                        for cond in state.rule.conditions:
-                            finding_val = self.working_memory.findings.get(cond)
-                            hypo_val = self.working_memory.hypotheses.get(cond)
-                            if finding_val == FactStatus.UNKNOWN and hypo_val != FactStatus.TRUE:
-                                self.working_memory.put_hypothesis(cond, FactStatus.TRUE)
-                                self.reasoning_log.append(f"推論: 「{cond}」→ true（発火ルールの上流条件）")
-                                changed = True
-                                self._update_dependent_rules(cond, FactStatus.TRUE)
-
-                elif state.status == RuleStatus.BLOCKED:
-                    # BLOCKEDのみFALSEを伝播（UNCERTAINは伝播しない）
-                    action = state.rule.action
-                    if not state.rule.is_or_rule:
-                        can_derive = any(
-                            s.rule.action == action and s.status not in (RuleStatus.BLOCKED,)
-                            for s in self.rule_states.values()
-                        )
-                        if not can_derive and self.working_memory.get_value(action) != FactStatus.FALSE:
-                            self.working_memory.put_hypothesis(action, FactStatus.FALSE)
-                            changed = True
-                            self._update_dependent_rules(action, FactStatus.FALSE)
-
-            # UNCERTAINルールのactionにUNKNOWNを伝播
-            # 条件: 同一actionの全ルールが解決済みで、FIREDなし、UNCERTAINあり
-            changed = self._propagate_uncertain_actions() or changed
-
-            if not changed:
-                break
-
-    def _propagate_uncertain_actions(self) -> bool:
-        """UNCERTAINルールのactionにUNKNOWNを伝播"""
-        changed = False
-        processed_actions: Set[str] = set()
-
-        for state in self.rule_states.values():
-            action = state.rule.action
-            if action in processed_actions:
-                continue
-            processed_actions.add(action)
-
-            # このactionを導出する全ルールを取得
-            rules_for_action = [
-                s for s in self.rule_states.values()
-                if s.rule.action == action
-            ]
+        if entry.question:
+            self.current_question = entry.question
+        self.current_goal = self.knowledge_base.rule_by_id[entry.goal_id] if entry.goal_id else None
+        if entry.applicable_visas is not None:
+            self._cached_visas = (entry.applicable_visas, entry.conditional_visas)
 
-            # 全ルールが解決済みかチェック
-            all_resolved = all(
-                RuleStatus.is_resolved(s.status) for s in rules_for_action
-            )
-            if not all_resolved:
-                continue
-
-            # FIREDがあればTRUEは既に伝播済み
-            has_fired = any(s.status == RuleStatus.FIRED for s in rules_for_action)
-            if has_fired:
-                continue
-
-            # 全てBLOCKEDならFALSEは既に伝播済み
-            all_blocked = all(s.status == RuleStatus.BLOCKED for s in rules_for_action)
-            if all_blocked:
-                continue
-
-            # FIREDなし、全てBLOCKEDではない（UNCERTAINあり）→ UNKNOWN
-            has_uncertain = any(s.status == RuleStatus.UNCERTAIN for s in rules_for_action)
-            if has_uncertain:
-                current_val = self.working_memory.get_value(action)
-                if current_val not in (FactStatus.TRUE, FactStatus.FALSE, FactStatus.UNKNOWN):
-                    self.working_memory.put_hypothesis(action, FactStatus.UNKNOWN)
-                    self.reasoning_log.append(f"推論: 「{action}」→ unknown（ルールが不確定）")
-                    changed = True
-                    self._update_dependent_rules(action, FactStatus.UNKNOWN)
-
-        return changed
-
-    def _update_dependent_rules(self, condition: str, status: FactStatus):
-        """条件のステータス変更に応じて依存ルールを更新"""
-        for state in self.rule_states.values():
-            if condition in state.rule.conditions:
-                state.checked_conditions[condition] = status
+    def _get_next_question(self) -> Optional[str]:
+        """次の質問を取得"""
+        question, goal_rule = self.question_finder.next_question()
+        if question:
+            self.current_question = question
+        self.current_goal = goal_rule
+        return question
 
     def _is_diagnosis_complete(self) -> bool:
         """診断完了かチェック"""
         return all(
-            RuleStatus.is_resolved(self.rule_states[g.id].status)
-            for g in get_goal_rules()
+            RuleStatus.is_resolved(self.rule_states.status(g.id))
+            for g in self.knowledge_base.goal_rules
         )
 
     def _get_unknown_answered_conditions(self) -> List[str]:
@@ -250,37 +341,44 @@ class InferenceEngine:
 
     def _generate_result(self) -> Dict[str, Any]:
         """診断結果を生成"""
+        if self._cached_visas is not None:
+            applicable_visas, conditional_visas = self._cached_visas
+        else:
+            applicable_visas, conditional_visas = self._collect_visas()
+
+        return {
+            "applicable_visas": applicable_visas,
+            "conditional_visas": conditional_visas,
+            "unknown_conditions": self._get_unknown_answered_conditions()
+        }
+
+    def _collect_visas(self) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """該当するビザと、「わからない」の回答次第で該当しうるビザを収集"""
         applicable_visas = []
         conditional_visas = []
 
         # 「わからない」と回答された質問を取得
         unknown_answered = self._get_unknown_answered_conditions()
 
-        for goal_rule in get_goal_rules():
-            state = self.rule_states.get(goal_rule.id)
-
-            if state:
-                if state.status == RuleStatus.FIRED:
-                    applicable_visas.append({
+        for goal_rule in self.knowledge_base.goal_rules:
+            status = self.rule_states.status(goal_rule.id)
+
+            if status == RuleStatus.FIRED:
+                applicable_visas.append({
+                    "visa": goal_rule.action,
+                    "rule_id": goal_rule.id
+                })
+            elif status != RuleStatus.BLOCKED:
+                # このビザに関連する下位条件（導出不可な質問）のみ抽出
+                relevant_unknowns = self._get_relevant_leaf_conditions(goal_rule, unknown_answered)
+                if relevant_unknowns:
+                    conditional_visas.append({
                         "visa": goal_rule.action,
-                        "rule_id": goal_rule.id
+                        "rule_id": goal_rule.id,
+                        "unknown_conditions": relevant_unknowns
                     })
-                elif state.status != RuleStatus.BLOCKED:
-                    # このビザに関連する下位条件（導出不可な質問）のみ抽出
-                    relevant_unknowns = self._get_relevant_leaf_conditions(goal_rule, unknown_answered)
-                    if relevant_unknowns:
-                        conditional_visas.append({
-                            "visa": goal_rule.action,
-                            "rule_id": goal_rule.id,
-                            "unknown_conditions": relevant_unknowns
-                        })
 
-        return {
-            "applicable_visas": applicable_visas,
-            "conditional_visas": conditional_visas,
-            "unknown_conditions": unknown_answered,
-            "reasoning_log": self.reasoning_log
-        }
+        return applicable_visas, conditional_visas
 
     def _get_relevant_leaf_conditions(self, rule: Rule, unknown_conditions: List[str]) -> List[str]:
         """ルールに関連する下位条件（葉ノード）のみを取得"""
@@ -311,94 +409,339 @@ class InferenceEngine:
 
     def get_rules_display_info(self) -> List[Dict[str, Any]]:
         """推論画面表示用のルール情報を取得"""
-        result = []
-
-        # 元のルール順序でインデックスを取得
-        rule_index_map = {r.id: idx for idx, r in enumerate(self.rules)}
-
-        for state in self.rule_states.values():
-            rule = state.rule
-            conditions_info = [
-                {
-                    "text": cond,
-                    "status": self.FACT_STATUS_DISPLAY.get(
-                        self.evaluator.get_effective_value(cond), "unchecked"
-                    ),
-                    "is_derived": cond in self.derived_conditions
-                }
-                for cond in rule.conditions
-            ]
+        # rules.json順
+        return [self._rule_display_info(rule) for rule in self.knowledge_base.display_rules]
+
+    def _rule_display_info(self, rule: Rule) -> Dict[str, Any]:
+        """推論画面表示用の1ルール分の情報"""
+        conditions_info = [
+            {
+                "text": cond,
+                "status": self.FACT_STATUS_DISPLAY.get(
+                    self.evaluator.get_effective_value(cond), "unchecked"
+                ),
+                "is_derived": cond in self.derived_conditions
+            }
+            for cond in rule.conditions
+        ]
 
-            result.append({
-                "id": rule.id,
-                "index": rule_index_map.get(rule.id, 0),
-                "action": rule.action,
-                "conditions": conditions_info,
-                "conclusion": rule.action,
-                "status": state.status.value,
-                "is_and_rule": not rule.is_or_rule,
-                "operator": "AND" if not rule.is_or_rule else "OR"
-            })
-
-        # rules.json順でソート
-        result.sort(key=lambda r: r["index"])
-        return result
+        return {
+            "id": rule.id,
+            "index": self.knowledge_base.rule_index.get(rule.id, 0),
+            "action": rule.action,
+            "conditions": conditions_info,
+            "conclusion": rule.action,
+            "status": self.rule_states.status(rule.id).value,
+            "is_and_rule": not rule.is_or_rule,
+            "operator": "AND" if not rule.is_or_rule else "OR"
+        }
 
-    def go_back(self, steps: int = 1) -> Dict[str, Any]:
-        """前の質問に戻る"""
-        if len(self.working_memory.answer_history) < steps:
-            steps = len(self.working_memory.answer_history)
+    def get_compact_display_info(self) -> Dict[str, Any]:
+        """推論画面表示用の情報を、カタログ（services.catalog）のIDで参照する形式で取得
 
-        if steps > 0:
-            target_idx = len(self.working_memory.answer_history) - steps
-            if target_idx >= 0:
-                target_cond = self.working_memory.answer_history[target_idx][0]
-                asked_conditions = [
-                    cond for cond, _ in self.working_memory.answer_history[:target_idx + 1]
-                ]
+        - rules_status: カタログのルール順に、ステータスを1文字ずつ並べた文字列
+        - condition_values: カタログの条件順に、値を1文字ずつ並べた文字列（未確認は"-"）
+        - catalog_version: 参照するカタログ（知識ベース）のバージョン
+        """
+        rules_status, condition_values = self._display_codes()
+        return {
+            "rules_status": rules_status,
+            "condition_values": condition_values,
+            "catalog_version": self.knowledge_base.version
+        }
 
-                self.working_memory.clear_after(target_cond)
+    def _display_codes(self) -> Tuple[str, str]:
+        """ルールステータスと条件の値を、カタログ順に1文字ずつ並べた文字列"""
+        kb = self.knowledge_base
+        return (
+            "".join(
+                self.RULE_STATUS_CODES[self.rule_states.status(rule.id)] for rule in kb.display_rules
+            ),
+            "".join(
+                self.CONDITION_VALUE_CODES.get(self.evaluator.get_effective_value(cond), "-")
+                for cond in kb.conditions
+            )
+        )
 
-                for state in self.rule_states.values():
-                    state.status = RuleStatus.PENDING
-                    state.checked_conditions.clear()
+    def get_display_fields(self, compact: bool, base: Optional[Tuple[str, str]] = None) -> Dict[str, Any]:
+        """応答に含める推論画面表示用の情報
+
+        baseに直前の状態の_display_codes()を指定した場合は、変化した分だけを返す。
+        - rules_status_delta: 通常形式では変化したルール（ステータスか条件の値）の表示情報、
+          簡易形式では変化したルールの [カタログの位置, ステータス] の組
+        - condition_values_delta: 簡易形式で、値が変化した条件の [ID, 値] の組
+        """
+        if base is None:
+            if compact:
+                return self.get_compact_display_info()
+            return {"rules_status": self.get_rules_display_info()}
+
+        kb = self.knowledge_base
+        rules_status, condition_values = self._display_codes()
+        changed_rules = [i for i, code in enumerate(rules_status) if code != base[0][i]]
+        changed_conditions = [i for i, code in enumerate(condition_values) if code != base[1][i]]
+        if compact:
+            return {
+                "rules_status_delta": [[i, rules_status[i]] for i in changed_rules],
+                "condition_values_delta": [[i, condition_values[i]] for i in changed_conditions],
+                "catalog_version": kb.version
+            }
+
+        changed_texts = {kb.conditions[i] for i in changed_conditions}
+        changed = set(changed_rules)
+        changed.update(
+            i for i, rule in enumerate(kb.display_rules)
+            if not changed_texts.isdisjoint(rule.conditions)
+        )
+        return {
+            "rules_status_delta": [
+                self._rule_display_info(kb.display_rules[i]) for i in sorted(changed)
+            ]
+        }
 
-                self.evaluator.evaluate_all_rules()
-                self._propagate_inferences()
+    def _delta_base(self, since_sequence: Optional[int]) -> Optional[Tuple[str, str]]:
+        """クライアントの状態（since_sequence）が現在の状態なら、差分の基準を取得"""
+        if since_sequence is None or since_sequence != self.sequence:
+            return None
+        return self._display_codes()
+
+    def _sequence_fields(self, since_sequence: Optional[int], base) -> Dict[str, Any]:
+        """応答に含める状態の連番（差分を要求された場合は差分で返したか）"""
+        fields: Dict[str, Any] = {"sequence": self.sequence}
+        if since_sequence is not None:
+            fields["delta"] = base is not None
+        return fields
+
+    def get_condition_ref(self, condition: Optional[str], compact: bool):
+        """応答に含める条件（compactならカタログのID。カタログにない初期事実は文字列のまま）"""
+        if not compact or condition is None:
+            return condition
+        return self.knowledge_base.condition_ids.get(condition, condition)
+
+    def go_back(
+        self,
+        steps: int = 1,
+        compact: bool = False,
+        since_sequence: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """前の質問に戻る（compact・since_sequenceはanswer_questionと同じ）
+
+        戻り先以前で最も近いチェックポイントの状態に戻し、そこから戻り先までの回答だけを適用し直す。
+        戻り先の状態は、最初からその位置まで回答したときの状態と一致する。
+        """
+        base = self._delta_base(since_sequence)
+        history = self.working_memory.answer_history
+        steps = min(steps, len(history))
+        self.sequence += 1
 
-                # 戻った位置から再度質問を取得（ルールのEVALUATINGマークも行われる）
-                self._get_next_question()
+        if steps > 0:
+            target = len(history) - steps
+            replayed = history[:target]
+            # 推論ログは取り消さず、適用し直した分のイベントは残さない
+            log = self.reasoning_log.save()
+            for length in [n for n in self._checkpoints if n > target]:
+                del self._checkpoints[length]
+
+            length = self._restore_checkpoint(target)
+            if length is None:
+                # 問診票の初期事実まで戻る場合は、残った所見で一から評価し直す
+                self._reevaluate(target)
+            else:
+                for cond, status in replayed[length:]:
+                    self._apply_answer(cond, status, self.STATUS_ANSWERS[status])
+            self.reasoning_log.restore(log)
+            self.reasoning_log.record(LOG_BACK, None, steps)
 
         return {
-            "current_question": self.current_question,
-            "answered_questions": [
-                {"condition": c, "answer": s.value}
-                for c, s in self.working_memory.answer_history
-            ],
-            "rules_status": self.get_rules_display_info()
+            "current_question": self.get_condition_ref(self.current_question, compact),
+            "answered_questions": self.get_answered_questions(compact),
+            **self.get_display_fields(compact, base),
+            **self._sequence_fields(since_sequence, base)
         }
 
+    def get_answered_questions(self, compact: bool) -> List[Dict[str, Any]]:
+        """回答済みの質問と回答"""
+        return [
+            {"condition": self.get_condition_ref(c, compact), "answer": s.value}
+            for c, s in self.working_memory.answer_history
+        ]
+
+    def _make_checkpoint(self) -> Checkpoint:
+        """現在の状態をチェックポイントにする"""
+        return Checkpoint(
+            statuses=self.rule_states.snapshot(),
+            marked=frozenset(self.question_finder.marked),
+            hypotheses=tuple(self.working_memory.hypotheses.items()),
+            question=self.current_question,
+            goal_id=self.current_goal.id if self.current_goal else None,
+            evaluated=self._evaluated,
+            lineage=self._lineage
+        )
+
+    def _restore_checkpoint(self, target: int) -> Optional[int]:
+        """回答履歴の長さtarget以前で最も近いチェックポイントに戻し、その長さを返す
+
+        直列化から復元したエンジンはチェックポイントを持たないため、開始時点のものを作り直す。
+        診断開始より前に戻る場合（または開始時点が不明な場合）はNoneを返す。
+        """
+        length = max((n for n in self._checkpoints if n <= target), default=None)
+        if length is None:
+            if self._start_length is None or self._start_length > target:
+                return None
+            length = self._start_length
+            self._checkpoints[length] = self._rebuild_start_checkpoint()
+        checkpoint = self._checkpoints[length]
+
+        wm = self.working_memory
+        del wm.answer_history[length:]
+        wm.findings.clear()
+        wm.findings.update(wm.answer_history)
+        wm.hypotheses.clear()
+        wm.hypotheses.update(checkpoint.hypotheses)
+        self.rule_states.restore(checkpoint.statuses)
+        self.dormant_rules.reset()
+        self.question_finder.reset()
+        self.question_finder.marked = set(checkpoint.marked)
+
+        self.current_question = checkpoint.question
+        self.current_goal = self.knowledge_base.rule_by_id[checkpoint.goal_id] if checkpoint.goal_id else None
+        self._evaluated = checkpoint.evaluated
+        self._lineage = checkpoint.lineage
+        self._cached_visas = None
+        return length
+
+    def _rebuild_start_checkpoint(self) -> Checkpoint:
+        """問診票の初期事実だけを適用した開始時点のチェックポイントを作り直す"""
+        engine = InferenceEngine(
+            incremental=self.incremental,
+            use_transposition=self.use_transposition,
+            question_strategy=self.question_strategy
+        )
+        for cond, status in self.working_memory.answer_history[:self._start_length]:
+            engine.working_memory.put_finding(cond, status)
+        engine.start_consultation()
+        return engine._checkpoints[self._start_length]
+
+    def _reevaluate(self, target: int):
+        """回答履歴をtargetの長さまで取り消し、残った所見で一から評価し直す"""
+        target_cond = self.working_memory.answer_history[target][0]
+        self.working_memory.clear_after(target_cond)
+
+        self.rule_states.restore({})
+        self.dormant_rules.reset()
+
+        # 残った所見で一から評価し直し、戻った位置から再度質問を取得
+        # （ルールのEVALUATINGマークも行われる）
+        self._lineage = (frozenset(self.working_memory.findings.items()), ())
+        self._evaluated = False
+        self._advance(self._solve_all)
+
+        # 以降はここを起点に戻る（開始時点は作り直せなくなる）
+        self._start_length = None
+        if self._initial_length is not None:
+            self._initial_length = min(self._initial_length, len(self.working_memory.answer_history))
+        self._checkpoints = {len(self.working_memory.answer_history): self._make_checkpoint()}
+
     def restart(self) -> Optional[str]:
         """最初からやり直し"""
-        self.__init__()
+        self.__init__(
+            incremental=self.incremental,
+            use_transposition=self.use_transposition,
+            question_strategy=self.question_strategy
+        )
         return self.start_consultation()
 
-    def get_current_state(self) -> Dict[str, Any]:
-        """現在の状態を取得"""
+    def get_current_state(self, compact: bool = False) -> Dict[str, Any]:
+        """現在の状態を取得（compactなら条件・ルールをカタログのIDで参照する形式で返す）"""
         is_complete = self.current_question is None or self._is_diagnosis_complete()
 
         result = {
-            "current_question": self.current_question,
-            "answered_questions": [
-                {"condition": c, "answer": s.value}
-                for c, s in self.working_memory.answer_history
-            ],
-            "rules_status": self.get_rules_display_info(),
-            "derived_facts": list(self.working_memory.hypotheses.keys()),
-            "is_complete": is_complete
+            "current_question": self.get_condition_ref(self.current_question, compact),
+            "answered_questions": self.get_answered_questions(compact),
+            **self.get_display_fields(compact),
+            "derived_facts": [self.get_condition_ref(c, compact) for c in self.working_memory.hypotheses],
+            "is_complete": is_complete,
+            "sequence": self.sequence
         }
 
         if is_complete:
             result["diagnosis_result"] = self._generate_result()
 
         return result
+
+    def to_state(self) -> Dict[str, Any]:
+        """セッション保存用にエンジンの状態を直列化（JSONに変換可能なdict）
+
+        所見は回答履歴から復元できるため履歴だけを保存し、
+        ルールステータスは知識ベースのルール順に1文字ずつ並べた文字列にする。
+        """
+        wm = self.working_memory
+        return {
+            "v": self.knowledge_base.version,
+            "inc": self.incremental,
+            "qo": self.question_strategy,
+            "ev": self._evaluated,
+            "a": [[cond, status.value] for cond, status in wm.answer_history],
+            "h": [[cond, status.value] for cond, status in wm.hypotheses.items()],
+            "s": "".join(
+                self.RULE_STATUS_CODES[self.rule_states.status(rule.id)] for rule in self.rules
+            ),
+            "q": self.current_question,
+            "g": self.current_goal.id if self.current_goal else None,
+            # 置換表の経緯は「一から評価した時点の回答履歴の長さ」で表せる
+            "ln": (
+                len(wm.answer_history) - len(self._lineage[1])
+                if self._lineage is not None else None
+            ),
+            "n0": self._start_length,
+            "ni": self._initial_length,
+            "seq": self.sequence,
+            "log": [list(event) for event in self.reasoning_log],
+            "lt": self.reasoning_log.total
+        }
+
+    @classmethod
+    def from_state(cls, state: Dict[str, Any]) -> "InferenceEngine":
+        """to_stateで直列化した状態からエンジンを復元
+
+        公開中の知識ベースのバージョンが保存時と異なる場合は、
+        回答履歴を現在の知識ベースに適用し直して状態を再計算する。
+        """
+        # 質問の順序を保存していない旧形式のセッションはrules_orderで作成されたもの
+        engine = cls(incremental=state["inc"], question_strategy=state.get("qo", RULES_ORDER))
+        wm = engine.working_memory
+        for cond, value in state["a"]:
+            wm.put_finding(cond, FactStatus(value))
+        # 旧形式のセッションの推論ログは整形済みの行のリスト
+        engine.reasoning_log.extend(
+            (LOG_TEXT, event, None) if isinstance(event, str) else tuple(event)
+            for event in state["log"]
+        )
+        engine.reasoning_log.total = state.get("lt", engine.reasoning_log.total)
+        engine.sequence = state.get("seq", 0)
+        # 初期事実の数を保存していない旧形式のセッションは、開始時点の位置で代用する
+        engine._initial_length = state.get("ni", state.get("n0"))
+
+        if state["v"] != engine.knowledge_base.version:
+            if state["ev"]:
+                engine._solve_all()
+                engine._lineage = (frozenset(wm.findings.items()), ())
+            engine._get_next_question()
+            return engine
+
+        if state.get("ln") is not None:
+            base = dict(wm.answer_history[:state["ln"]])
+            engine._lineage = (frozenset(base.items()), tuple(wm.answer_history[state["ln"]:]))
+
+        for cond, value in state["h"]:
+            wm.put_hypothesis(cond, FactStatus(value))
+        pending = cls.RULE_STATUS_CODES[RuleStatus.PENDING]
+        for rule, code in zip(engine.rules, state["s"]):
+            if code != pending:
+                engine.rule_states[rule.id].status = cls.CODE_RULE_STATUSES[code]
+        engine.dormant_rules.reset()
+        engine._evaluated = state["ev"]
+        engine._start_length = state.get("n0")
+        engine.current_question = state["q"]
+        engine.current_goal = engine.knowledge_base.rule_by_id[state["g"]] if state["g"] else None
+        return engine
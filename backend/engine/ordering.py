@@ -0,0 +1,123 @@
+"""
+質問の順序 - 次の質問の候補から1つを選ぶ戦略
+"""
+import hashlib
+import json
+import os
+from typing import Dict, List, Optional, Tuple
+
+from core import Rule, FactStatus
+from core.constants import QUESTION_STRATEGY, ANSWER_FREQUENCIES_FILE
+from .evaluator import RuleEvaluator
+
+
+# 戦略名
+# - rules_order: ゴールルールをrules.json順に辿り、最初に値が決まっていない条件を質問する
+# - decisive: 候補の条件のうち、回答で決着するルール・ゴールが最も多い条件を質問する
+RULES_ORDER = "rules_order"
+DECISIVE = "decisive"
+QUESTION_STRATEGIES = (RULES_ORDER, DECISIVE)
+
+# 決着するルールがゴールの場合の重み（ゴールはルール1つ分に加えて数える）
+_GOAL_WEIGHT = 2.0
+
+
+class AnswerFrequencies:
+    """条件ごとの過去の回答の頻度
+
+    JSONファイル {条件: {"yes": 回数, "no": 回数, "unknown": 回数}} から読み込む。
+    回答の確率は加算スムージング（各回答に1を足す）で求めるため、記録のない条件は等確率になる。
+    """
+
+    def __init__(self, counts: Dict[str, Dict[str, int]]):
+        self._probabilities: Dict[str, Tuple[float, float]] = {}
+        for cond, answers in counts.items():
+            yes, no, unknown = (int(answers.get(key, 0)) for key in ("yes", "no", "unknown"))
+            total = yes + no + unknown + 3
+            self._probabilities[cond] = ((yes + 1) / total, (no + 1) / total)
+        payload = json.dumps(counts, ensure_ascii=False, sort_keys=True).encode("utf-8")
+        self.digest = hashlib.sha256(payload).hexdigest()[:16]
+
+    @classmethod
+    def load(cls, path: str = ANSWER_FREQUENCIES_FILE) -> Optional["AnswerFrequencies"]:
+        """ファイルから読み込む（存在しなければNone）"""
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def probabilities(self, condition: str) -> Tuple[float, float]:
+        """「はい」「いいえ」と回答される確率"""
+        return self._probabilities.get(condition, (1 / 3, 1 / 3))
+
+
+class DecisiveOrdering:
+    """回答で決着するルールの多さで候補の条件を選ぶ戦略
+
+    候補の条件を未決着で参照しているルールごとに、「はい」「いいえ」それぞれの回答で
+    そのルールが発火・ブロックに決まるかを調べ、回答の確率で重み付けして合計する。
+    ゴールルールの決着は_GOAL_WEIGHTで重く数える。同点ならrules_orderで先に見つかった条件を選ぶ。
+    frequenciesを省略した場合、回答の確率は「はい」「いいえ」「わからない」の等確率とする。
+    """
+
+    def __init__(self, frequencies: Optional[AnswerFrequencies] = None):
+        self.frequencies = frequencies
+        # 置換表のキーに含める識別子（頻度が変われば選ぶ質問も変わる）
+        self.key = (DECISIVE, frequencies.digest if frequencies else None)
+
+    def choose(
+        self,
+        candidates: Dict[str, List[Rule]],
+        evaluator: RuleEvaluator
+    ) -> Optional[str]:
+        """候補の条件（条件 → その条件を未決着で参照するルール、探索順）から質問を選ぶ"""
+        best, best_score = None, -1.0
+        for cond, rules in candidates.items():
+            p_yes, p_no = self.frequencies.probabilities(cond) if self.frequencies else (1 / 3, 1 / 3)
+            score = sum(
+                (_GOAL_WEIGHT if rule.is_goal_action else 1.0)
+                * (p_yes * self._decides(rule, cond, FactStatus.TRUE, evaluator)
+                   + p_no * self._decides(rule, cond, FactStatus.FALSE, evaluator))
+                for rule in rules
+            )
+            if score > best_score:
+                best, best_score = cond, score
+        return best
+
+    @staticmethod
+    def _decides(rule: Rule, cond: str, value: FactStatus, evaluator: RuleEvaluator) -> bool:
+        """condがvalueになるとルールが発火・ブロックに決まるか"""
+        decisive = FactStatus.TRUE if rule.is_or_rule else FactStatus.FALSE
+        if value == decisive:
+            return True
+        return all(
+            other == cond or evaluator.get_effective_value(other) == value
+            for other in rule.conditions
+        )
+
+
+# 戦略名 → 戦略（rules_orderは探索順のまま最初の候補を選ぶためNone）
+_orderings: Dict[str, Optional[DecisiveOrdering]] = {}
+
+
+def resolve_strategy(name: Optional[str] = None) -> str:
+    """戦略名を確定（省略時は環境変数 QUESTION_STRATEGY、なければ定数QUESTION_STRATEGY）
+
+    Raises:
+        ValueError: 未対応の戦略名の場合
+    """
+    name = name or os.environ.get("QUESTION_STRATEGY", QUESTION_STRATEGY)
+    if name not in QUESTION_STRATEGIES:
+        raise ValueError(f"未対応の質問の順序です: {name}")
+    return name
+
+
+def get_ordering(name: Optional[str] = None) -> Optional[DecisiveOrdering]:
+    """戦略名から戦略を取得（名前の省略・検証はresolve_strategyと同じ）
+
+    decisiveは回答の頻度ファイル（ANSWER_FREQUENCIES_FILE）があれば重み付けする。
+    """
+    name = resolve_strategy(name)
+    if name not in _orderings:
+        _orderings[name] = DecisiveOrdering(AnswerFrequencies.load()) if name == DECISIVE else None
+    return _orderings[name]
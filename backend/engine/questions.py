@@ -0,0 +1,174 @@
+"""
+質問探索 - バックワードチェイニングによる次の質問の決定
+"""
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+from core import Rule, FactStatus, RuleStatus
+from knowledge import RuleNetwork
+from .working_memory import RuleStates
+from .evaluator import RuleEvaluator
+from .ordering import DecisiveOrdering
+
+
+class QuestionFinder:
+    """次の質問を探索するクラス
+
+    ゴールルールをrules.json順に辿り、最初に値が決まっていない条件を質問とする。
+    UNKNOWNと回答された導出条件は、その導出ルールの条件を辿って質問を探す。
+    orderingを指定した場合は、値が決まっていない条件をすべて候補として集め、orderingに選ばせる。
+
+    「このルール以下に質問はない」という探索結果を、そのとき辿ったルールとともに覚えておき、
+    以降の探索では辿り直さない。導出グラフは非循環（check_rules_integrityで保証）のため、
+    探索結果はルール以下の条件の値とルールのステータスだけで決まる。
+    - 値・ステータスが変化した場合はinvalidate()で、その条件まで辿りうるルールの結果を捨てる
+    - 状態を丸ごと入れ替えた場合はreset()で状態の版を進め、すべての結果を無効にする
+    """
+
+    def __init__(
+        self,
+        network: RuleNetwork,
+        rule_states: RuleStates,
+        evaluator: RuleEvaluator,
+        ordering: Optional[DecisiveOrdering] = None
+    ):
+        self.network = network
+        self.rule_states = rule_states
+        self.evaluator = evaluator
+        self.ordering = ordering
+        # 直近の探索で辿った未解決ルール（EVALUATINGにマークしたルール）
+        self.marked: Set[str] = set()
+        # 状態の版（reset()のたびに増える）
+        self.version = 0
+        # ルールID → (状態の版, 辿ったルール)。そのルール以下に質問がなかったことを表す
+        self._no_question: Dict[str, Tuple[int, FrozenSet[str]]] = {}
+
+    def reset(self):
+        """状態を丸ごと入れ替えた後に呼び、覚えた探索結果をすべて無効にする"""
+        self.version += 1
+
+    def invalidate(self, conditions: Iterable[str] = (), rule_ids: Iterable[str] = ()):
+        """値が変化した条件・ステータスが変化したルールまで辿りうるルールの探索結果を捨てる"""
+        memo = self._no_question
+        if not memo:
+            return
+        closure = self.network.dependent_closure
+        for rule_id in rule_ids:
+            memo.pop(rule_id, None)
+            for dependent in closure.get(self.network.rule_by_id[rule_id].action, ()):
+                memo.pop(dependent, None)
+        for cond in conditions:
+            for dependent in closure.get(cond, ()):
+                memo.pop(dependent, None)
+
+    def next_question(self) -> Tuple[Optional[str], Optional[Rule]]:
+        """次の質問と、その質問を必要とするゴールルールを返す"""
+        self.marked = set()
+        if self.ordering is not None:
+            return self._choose_question()
+
+        for goal_rule in self.network.goal_rules:
+            if self.rule_states.status(goal_rule.id) in (RuleStatus.BLOCKED, RuleStatus.FIRED):
+                continue
+
+            question = self.find_for_rule(goal_rule)
+            if question:
+                return question, goal_rule
+
+        return None, None
+
+    def _choose_question(self) -> Tuple[Optional[str], Optional[Rule]]:
+        """未解決のゴールから辿れる候補の条件を集め、orderingで選ぶ"""
+        candidates: Dict[str, List[Rule]] = {}
+        goal_of: Dict[str, Rule] = {}
+        for goal_rule in self.network.goal_rules:
+            if self.rule_states.status(goal_rule.id) in (RuleStatus.BLOCKED, RuleStatus.FIRED):
+                continue
+
+            self.find_for_rule(goal_rule, candidates=candidates)
+            for cond in candidates:
+                goal_of.setdefault(cond, goal_rule)
+
+        question = self.ordering.choose(candidates, self.evaluator)
+        return question, goal_of.get(question)
+
+    def find_for_rule(
+        self,
+        rule: Rule,
+        visited: Set[str] = None,
+        candidates: Optional[Dict[str, List[Rule]]] = None
+    ) -> Optional[str]:
+        """ルールの条件を確認し、次の質問を見つける（visitedは探索中の経路上のルール）
+
+        candidatesを指定した場合は最初の質問で止めず、値が決まっていない条件すべてを
+        その条件を参照するルールとともにcandidatesに追加する（戻り値は最初の候補）。
+        """
+        if visited is None:
+            visited = set()
+
+        if rule.id in visited:
+            return None
+
+        if self.rule_states.status(rule.id) in (RuleStatus.BLOCKED, RuleStatus.FIRED):
+            return None
+
+        known = self._no_question.get(rule.id)
+        if known is not None and known[0] == self.version:
+            self.marked.update(known[1])
+            return None
+
+        # このルール以下で辿ったルールを別に集めて、質問がなければ覚えておく
+        outer_marked = self.marked
+        self.marked = set()
+        visited.add(rule.id)
+        try:
+            question = self._find_in_conditions(rule, visited, candidates)
+        finally:
+            visited.discard(rule.id)
+            marked = self.marked
+            self.marked = outer_marked
+            self.marked.update(marked)
+        if question is None:
+            self._no_question[rule.id] = (self.version, frozenset(marked))
+        return question
+
+    def _find_in_conditions(
+        self,
+        rule: Rule,
+        visited: Set[str],
+        candidates: Optional[Dict[str, List[Rule]]] = None
+    ) -> Optional[str]:
+        """ルールを評価中にマークし、条件を順に確認して質問を見つける"""
+        self.marked.add(rule.id)
+        if self.rule_states.status(rule.id) == RuleStatus.PENDING:
+            self.rule_states[rule.id].status = RuleStatus.EVALUATING
+
+        found = None
+        for cond in rule.conditions:
+            val = self.evaluator.get_effective_value(cond)
+
+            if val is None or val == FactStatus.PENDING:
+                if candidates is None:
+                    return cond
+                rules = candidates.setdefault(cond, [])
+                if rule not in rules:
+                    rules.append(rule)
+                found = found or cond
+
+            elif val == FactStatus.UNKNOWN and cond in self.network.derived_conditions:
+                deriving_rules = self.evaluator.get_deriving_rules(cond)
+                for dr in deriving_rules:
+                    if self.rule_states.status(dr.id) not in (RuleStatus.BLOCKED, RuleStatus.FIRED):
+                        sub_question = self.find_for_rule(dr, visited, candidates)
+                        if sub_question and candidates is None:
+                            return sub_question
+                        found = found or sub_question
+
+            elif val == FactStatus.FALSE:
+                if not rule.is_or_rule:
+                    return found
+
+            elif val == FactStatus.TRUE:
+                if rule.is_or_rule:
+                    return found
+
+        return found
@@ -0,0 +1,96 @@
+"""
+推論ログ - 推論の経過を構造化したイベントのリングバッファ
+"""
+from collections import deque
+from itertools import islice
+from typing import Any, Iterable, Iterator, List, Optional, Tuple
+
+from core.constants import REASONING_LOG_MAX_EVENTS
+
+
+# イベント種別（直列化するため1文字にする）
+LOG_START = "s"      # 診断開始
+LOG_ANSWER = "a"     # 回答（値は回答）
+LOG_DERIVED = "d"    # actionの導出（ルールが発火）
+LOG_UPSTREAM = "t"   # 発火ルールの上流条件をtrueと推論
+LOG_UNKNOWN = "u"    # actionをunknownと推論（ルールが不確定）
+LOG_BACK = "b"       # 前の質問に戻った（値は戻った質問数）
+LOG_TEXT = "x"       # 整形済みの行（旧形式のセッションから引き継いだもの）
+
+# (種別, 条件, 値)
+LogEvent = Tuple[str, Optional[str], Any]
+
+# イベント種別 → 表示用の文（{0}は条件、{1}は値）
+_TEMPLATES = {
+    LOG_START: "診断を開始します。全ゴールルールを並行評価します。",
+    LOG_ANSWER: "回答: 「{0}」→ {1}",
+    LOG_DERIVED: "導出: 「{0}」（ルールが発火）",
+    LOG_UPSTREAM: "推論: 「{0}」→ true（発火ルールの上流条件）",
+    LOG_UNKNOWN: "推論: 「{0}」→ unknown（ルールが不確定）",
+    LOG_BACK: "{1}問前に戻りました。",
+    LOG_TEXT: "{0}",
+}
+
+
+class ReasoningLog:
+    """推論ログ
+
+    推論中はイベントのタプルを記録するだけで、文への整形は表示するときに行う。
+    上限を超えると古いイベントから捨てる。位置は診断開始からの通し番号で、
+    捨てたイベントの分もtotalに数える。
+    """
+    __slots__ = ("_events", "total")
+
+    def __init__(
+        self,
+        events: Iterable[LogEvent] = (),
+        total: Optional[int] = None,
+        max_events: int = REASONING_LOG_MAX_EVENTS
+    ):
+        self._events: "deque[LogEvent]" = deque(events, maxlen=max_events)
+        self.total = len(self._events) if total is None else total
+
+    def __len__(self) -> int:
+        return len(self._events)
+
+    def __iter__(self) -> Iterator[LogEvent]:
+        return iter(self._events)
+
+    @property
+    def first(self) -> int:
+        """保持している最も古いイベントの位置"""
+        return self.total - len(self._events)
+
+    def record(self, event: str, subject: Optional[str] = None, value: Any = None):
+        """イベントを記録"""
+        self._events.append((event, subject, value))
+        self.total += 1
+
+    def extend(self, events: Iterable[LogEvent]):
+        """記録済みのイベントをまとめて追加"""
+        for event in events:
+            self._events.append(event)
+            self.total += 1
+
+    def since(self, position: int) -> Tuple[LogEvent, ...]:
+        """位置position以降のイベント（捨てた分は含まない）"""
+        return tuple(islice(self._events, max(position - self.first, 0), None))
+
+    def save(self) -> Tuple[Tuple[LogEvent, ...], int]:
+        """現在の内容を控える"""
+        return tuple(self._events), self.total
+
+    def restore(self, saved: Tuple[Tuple[LogEvent, ...], int]):
+        """saveで控えた内容に戻す"""
+        events, self.total = saved
+        self._events.clear()
+        self._events.extend(events)
+
+    def render(self, offset: int = 0, limit: Optional[int] = None) -> List[str]:
+        """位置offsetからlimit件のイベントを表示用の文にする"""
+        start = max(offset - self.first, 0)
+        stop = None if limit is None else start + max(limit, 0)
+        return [
+            _TEMPLATES[event].format(subject, value)
+            for event, subject, value in islice(self._events, start, stop)
+        ]
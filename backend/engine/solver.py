@@ -0,0 +1,155 @@
+"""
+不動点ソルバー - 三値（TRUE/FALSE/UNKNOWN）の推論伝播
+"""
+import heapq
+from typing import Iterable, List, Optional, Set, Tuple
+
+from core import FactStatus, RuleStatus
+from knowledge import RuleNetwork
+from .working_memory import WorkingMemory, RuleStates
+from .evaluator import RuleEvaluator
+from .dormancy import DormantRules
+from .reasoning_log import ReasoningLog, LOG_DERIVED, LOG_UPSTREAM, LOG_UNKNOWN
+
+
+# ワークリストの要素種別（同順位ではルール評価をaction伝播より先に行う）
+_EVALUATE = 0
+_PROPAGATE = 1
+
+
+class FixpointSolver:
+    """不動点ソルバー
+
+    導出グラフ（check_rules_integrityにより非循環が保証される）の位相順位を
+    優先度とするワークリストで、ルール評価と仮説の伝播を行う。
+    - ルールは参照する導出条件のすべての導出ルールより後に評価される
+    - actionの仮説は、それを導出する全ルールの評価が済んでから一度だけ伝播される
+    - 1回の解決で新たに導出された仮説は位相順位の順に作業記憶へ追加される
+      （derived_factsの並び。全ルールを反復していた頃はルールの並び順だった）
+    変化した条件の依存ルールだけを積むため、処理量は影響を受ける部分グラフに比例し、
+    反復回数の上限なしで必ず停止する。
+    休眠ルール（dormant_rules）は積まず、不動点に達した後に休眠ルールを更新する。
+    """
+
+    def __init__(
+        self,
+        working_memory: WorkingMemory,
+        rule_states: RuleStates,
+        network: RuleNetwork,
+        evaluator: RuleEvaluator,
+        reasoning_log: ReasoningLog,
+        dormant_rules: DormantRules
+    ):
+        self.working_memory = working_memory
+        self.rule_states = rule_states
+        self.network = network
+        self.evaluator = evaluator
+        self.reasoning_log = reasoning_log
+        self.dormant_rules = dormant_rules
+        self.last_visit_count = 0
+        self.total_visit_count = 0
+        # 直近のsolveで値が変化した条件（起点の条件を含む）・ステータスが変化したルール
+        self.changed_conditions: List[str] = []
+        self.changed_rules: List[str] = []
+
+    def solve(self, conditions: Optional[Iterable[str]] = None) -> int:
+        """不動点まで伝播し、評価したルール数を返す
+
+        conditionsを指定した場合はその条件を参照するルールだけを起点にする。
+        省略した場合は全ルールを起点にする。
+        """
+        agenda: List[Tuple[int, int, int, str]] = []
+        queued: Set[Tuple[int, str]] = set()
+        self.changed_conditions = changed_conditions = []
+        self.changed_rules = changed_rules = []
+
+        dormant = self.dormant_rules
+
+        def push(kind: int, rank: int, key: str):
+            if (kind, key) in queued or (kind == _EVALUATE and key in dormant):
+                return
+            queued.add((kind, key))
+            index = self.network.rule_index.get(key, 0) if kind == _EVALUATE else 0
+            heapq.heappush(agenda, (rank * 2 + kind, index, kind, key))
+
+        def enqueue_dependents(condition: str):
+            for rule in self.network.get_dependent_rules(condition):
+                push(_EVALUATE, self.network.rule_rank[rule.id], rule.id)
+
+        if conditions is None:
+            for rule in self.network.rules:
+                push(_EVALUATE, self.network.rule_rank[rule.id], rule.id)
+        else:
+            for condition in conditions:
+                changed_conditions.append(condition)
+                enqueue_dependents(condition)
+
+        visits = 0
+        while agenda:
+            _, _, kind, key = heapq.heappop(agenda)
+            queued.discard((kind, key))
+
+            if kind == _EVALUATE:
+                visits += 1
+                if self.evaluator.evaluate_rule(key):
+                    changed_rules.append(key)
+                    action = self.network.rule_by_id[key].action
+                    push(_PROPAGATE, self.network.action_rank[action], action)
+                    # ORルールの評価は導出ルールの解決状況に依存するため、actionの参照元も再評価する
+                    enqueue_dependents(action)
+            else:
+                for condition in self._propagate_action(key):
+                    changed_conditions.append(condition)
+                    enqueue_dependents(condition)
+
+        dormant.update()
+        self.last_visit_count = visits
+        self.total_visit_count += visits
+        return visits
+
+    def _propagate_action(self, action: str) -> List[str]:
+        """actionを導出するルールのステータスから仮説を導出し、変化した条件を返す"""
+        changed: List[str] = []
+        wm = self.working_memory
+        deriving = [(r, self.rule_states.status(r.id)) for r in self.network.get_deriving_rules(action)]
+
+        for rule, status in deriving:
+            if status == RuleStatus.FIRED:
+                if (wm.get_value(action) != FactStatus.TRUE and
+                        wm.hypotheses.get(action) != FactStatus.TRUE):
+                    self._derive(action, FactStatus.TRUE, changed)
+                    self.reasoning_log.record(LOG_DERIVED, action)
+
+                # ANDルールが発火した場合、UNKNOWNだった上流条件もTRUEとして導出
+                if not rule.is_or_rule:
+                    for cond in rule.conditions:
+                        if (wm.findings.get(cond) == FactStatus.UNKNOWN and
+                                wm.hypotheses.get(cond) != FactStatus.TRUE):
+                            self._derive(cond, FactStatus.TRUE, changed)
+                            self.reasoning_log.record(LOG_UPSTREAM, cond)
+
+        # BLOCKEDのみFALSEを伝播（UNCERTAINは伝播しない）
+        blocked_and_rule = any(
+            status == RuleStatus.BLOCKED and not rule.is_or_rule for rule, status in deriving
+        )
+        can_derive = any(status != RuleStatus.BLOCKED for _, status in deriving)
+        if blocked_and_rule and not can_derive:
+            if (wm.get_value(action) != FactStatus.FALSE and
+                    wm.hypotheses.get(action) != FactStatus.FALSE):
+                self._derive(action, FactStatus.FALSE, changed)
+            return changed
+
+        # 同一actionの全ルールが解決済みで、FIREDなし、UNCERTAINあり → UNKNOWN
+        if (all(RuleStatus.is_resolved(status) for _, status in deriving) and
+                not any(status == RuleStatus.FIRED for _, status in deriving) and
+                any(status == RuleStatus.UNCERTAIN for _, status in deriving)):
+            if wm.get_value(action) not in (FactStatus.TRUE, FactStatus.FALSE, FactStatus.UNKNOWN):
+                self._derive(action, FactStatus.UNKNOWN, changed)
+                self.reasoning_log.record(LOG_UNKNOWN, action)
+
+        return changed
+
+    def _derive(self, condition: str, status: FactStatus, changed: List[str]):
+        """仮説を追加し、変化した条件として記録"""
+        self.working_memory.put_hypothesis(condition, status)
+        changed.append(condition)
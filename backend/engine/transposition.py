@@ -0,0 +1,85 @@
+"""
+置換表 - セッションをまたいで共有する推論結果のキャッシュ
+"""
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple
+
+from core import FactStatus, RuleStatus
+from core.constants import TRANSPOSITION_CACHE_SIZE
+from .reasoning_log import LogEvent
+
+
+@dataclass(frozen=True)
+class TranspositionEntry:
+    """1つの推論ステップ（回答・開始・戻る）の結果
+
+    - resolved: 解決済みルールのステータス（未解決ルールは含まない）
+    - marked: 質問探索でEVALUATINGにマークしたルール
+    - hypotheses: 仮説（導出順）
+    - log: このステップで推論ログに記録されたイベント
+    - applicable_visas / conditional_visas: 診断完了時の結果（未完了ならNone）
+    """
+    resolved: Dict[str, RuleStatus]
+    marked: FrozenSet[str]
+    hypotheses: Tuple[Tuple[str, FactStatus], ...]
+    log: Tuple[LogEvent, ...]
+    question: Optional[str]
+    goal_id: Optional[str]
+    applicable_visas: Optional[List[Dict[str, Any]]] = None
+    conditional_visas: Optional[List[Dict[str, Any]]] = None
+
+
+class TranspositionCache:
+    """推論結果の置換表（LRU）
+
+    キーは (知識ベースのバージョン, 差分伝播の有無, 評価済みか, 基準の所見, 基準以降の回答列, 質問の順序)。
+    推論エンジンの状態は、全ルールを一から評価した時点の所見の集合と、
+    その後に差分伝播で適用した回答の順序で決まるため、これが同じセッションは同じ結果になる。
+    """
+
+    def __init__(self, max_entries: int = TRANSPOSITION_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[tuple, TranspositionEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, key: tuple) -> Optional[TranspositionEntry]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry
+
+    def put(self, key: tuple, entry: TranspositionEntry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._hits = 0
+            self._misses = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """保持数とヒット率を取得"""
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "entries": len(self._entries),
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": self._hits / lookups if lookups else 0.0
+            }
+
+
+# すべての推論エンジンで共有する置換表
+transposition_cache = TranspositionCache()
@@ -0,0 +1,271 @@
+"""
+ベクトル化ルール評価 - NumPyによる複数ケースの一括評価
+"""
+from typing import Dict, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+from core import FactStatus, RuleStatus
+from knowledge import RuleNetwork
+
+
+# 事実状態のビットマスク（0は作業記憶に値がないことを表す）
+TRUE_BIT = 1
+FALSE_BIT = 2
+UNKNOWN_BIT = 4
+PENDING_BIT = 8
+
+FACT_CODES: Dict[FactStatus, int] = {
+    FactStatus.TRUE: TRUE_BIT,
+    FactStatus.FALSE: FALSE_BIT,
+    FactStatus.UNKNOWN: UNKNOWN_BIT,
+    FactStatus.PENDING: PENDING_BIT,
+}
+CODE_FACTS: Dict[int, FactStatus] = {code: status for status, code in FACT_CODES.items()}
+
+# ルールステータスのコード
+STATUS_CODES: Dict[RuleStatus, int] = {
+    RuleStatus.PENDING: 0,
+    RuleStatus.EVALUATING: 1,
+    RuleStatus.FIRED: 2,
+    RuleStatus.BLOCKED: 3,
+    RuleStatus.UNCERTAIN: 4,
+}
+CODE_STATUSES: Dict[int, RuleStatus] = {code: status for status, code in STATUS_CODES.items()}
+
+_FIRED = STATUS_CODES[RuleStatus.FIRED]
+_BLOCKED = STATUS_CODES[RuleStatus.BLOCKED]
+_UNCERTAIN = STATUS_CODES[RuleStatus.UNCERTAIN]
+
+
+def _segment_sum(values: np.ndarray, indptr: np.ndarray) -> np.ndarray:
+    """列方向の区間和（空区間は0）"""
+    cumulative = np.zeros((values.shape[0], values.shape[1] + 1), dtype=np.int32)
+    np.cumsum(values, axis=1, out=cumulative[:, 1:])
+    return cumulative[:, indptr[1:]] - cumulative[:, indptr[:-1]]
+
+
+class VectorizedRuleEvaluator:
+    """ベクトル化ルール評価クラス
+
+    RuleEvaluatorの一括評価用バックエンド。N件のケースの事実状態を (N, 条件数) の
+    ビットマスク配列、ルールを疎な条件接続行列（CSR形式）として保持し、
+    全ANDルール・ORルールを少数のベクトル演算で評価する。
+    評価結果はRuleEvaluator/FixpointSolverのRuleStatusの意味論（UNCERTAINを含む）と一致する。
+    """
+
+    def __init__(self, network: RuleNetwork):
+        self.network = network
+        rules = network.rules
+
+        # 条件の列番号（導出条件を含む全条件）
+        conditions: List[str] = list(network.rules_by_condition)
+        for rule in rules:
+            if rule.action not in network.rules_by_condition:
+                conditions.append(rule.action)
+        self.conditions: Tuple[str, ...] = tuple(conditions)
+        self.condition_index: Dict[str, int] = {c: i for i, c in enumerate(self.conditions)}
+        self.is_derived = np.array([c in network.derived_conditions for c in self.conditions])
+
+        # 疎な条件接続行列（CSR形式）
+        indptr = [0]
+        indices: List[int] = []
+        for rule in rules:
+            indices.extend(self.condition_index[c] for c in rule.conditions)
+            indptr.append(len(indices))
+        self.indptr = np.array(indptr, dtype=np.int64)
+        self.indices = np.array(indices, dtype=np.int64)
+        self.rule_of_incidence = np.repeat(np.arange(len(rules)), np.diff(self.indptr))
+        self.condition_count = np.diff(self.indptr)
+        self.is_or = np.array([r.is_or_rule for r in rules], dtype=bool)
+
+        # action単位のグループ（actionの列番号でソートしたルール順）
+        action_columns = np.array([self.condition_index[r.action] for r in rules], dtype=np.int64)
+        self.action_order = np.argsort(action_columns, kind="stable")
+        sorted_columns = action_columns[self.action_order]
+        group_starts = np.flatnonzero(np.r_[True, sorted_columns[1:] != sorted_columns[:-1]])
+        self.action_indptr = np.r_[group_starts, len(rules)].astype(np.int64)
+        self.action_columns = sorted_columns[group_starts]
+        self.action_group_of_rule = np.empty(len(rules), dtype=np.int64)
+        self.action_group_of_rule[self.action_order] = np.repeat(
+            np.arange(len(group_starts)), np.diff(self.action_indptr)
+        )
+
+        # 位相順位ごとのルール・actionグループ
+        rule_ranks = np.array([network.rule_rank[r.id] for r in rules], dtype=np.int64)
+        action_ranks = np.array(
+            [network.action_rank[self.conditions[c]] for c in self.action_columns], dtype=np.int64
+        )
+        max_rank = int(max(rule_ranks.max(initial=0), action_ranks.max(initial=0)))
+        self.rules_by_rank = [np.flatnonzero(rule_ranks == r) for r in range(max_rank + 1)]
+        self.actions_by_rank = [np.flatnonzero(action_ranks == r) for r in range(max_rank + 1)]
+
+    # ========== エンコード / デコード ==========
+
+    def encode_facts(self, fact_sets: Sequence[Mapping[str, FactStatus]]) -> np.ndarray:
+        """事実の辞書のリストを (N, 条件数) のビットマスク配列に変換（未知の条件は無視）"""
+        codes = np.zeros((len(fact_sets), len(self.conditions)), dtype=np.uint8)
+        for row, facts in enumerate(fact_sets):
+            for condition, status in facts.items():
+                column = self.condition_index.get(condition)
+                if column is not None:
+                    codes[row, column] = FACT_CODES[status]
+        return codes
+
+    def initial_statuses(self, case_count: int) -> np.ndarray:
+        """全ルールがPENDINGのステータス配列を生成"""
+        return np.zeros((case_count, len(self.network.rules)), dtype=np.uint8)
+
+    def decode_statuses(self, statuses: np.ndarray, row: int) -> Dict[str, RuleStatus]:
+        """1ケース分のステータス配列をルールID → RuleStatusに変換"""
+        return {
+            rule.id: CODE_STATUSES[int(code)]
+            for rule, code in zip(self.network.rules, statuses[row])
+        }
+
+    def decode_facts(self, codes: np.ndarray, row: int) -> Dict[str, FactStatus]:
+        """1ケース分のビットマスク配列を条件 → FactStatusに変換（値のない条件は除く）"""
+        return {
+            self.conditions[column]: CODE_FACTS[int(codes[row, column])]
+            for column in np.flatnonzero(codes[row])
+        }
+
+    # ========== 評価 ==========
+
+    def effective_values(self, findings: np.ndarray, hypotheses: np.ndarray) -> np.ndarray:
+        """条件の実効値（RuleEvaluator.get_effective_valueと同じ優先順位、値なしはPENDING）"""
+        hypo_decisive = self.is_derived & ((hypotheses == TRUE_BIT) | (hypotheses == FALSE_BIT))
+        values = np.where(findings != 0, findings, hypotheses)
+        values = np.where(hypo_decisive, hypotheses, values)
+        return np.where(values == 0, PENDING_BIT, values).astype(np.uint8)
+
+    def evaluate_all_rules(
+        self,
+        findings: np.ndarray,
+        hypotheses: np.ndarray,
+        statuses: np.ndarray,
+        rule_subset: Optional[np.ndarray] = None
+    ) -> np.ndarray:
+        """全ルール（またはrule_subset）を一括評価し、更新後のステータス配列を返す
+
+        結論が出ないルールは元のステータスを保持する（RuleEvaluatorと同じ）。
+        """
+        values = self.effective_values(findings, hypotheses)
+        gathered = values[:, self.indices]
+        is_true = gathered == TRUE_BIT
+        is_false = gathered == FALSE_BIT
+        is_unknown = gathered == UNKNOWN_BIT
+        is_pending = gathered == PENDING_BIT
+
+        # ORルール: UNKNOWNの導出条件は、導出ルールがすべて解決済みでなければ判定保留
+        unresolved = (statuses != _FIRED) & (statuses != _BLOCKED) & (statuses != _UNCERTAIN)
+        unresolved_by_action = _segment_sum(
+            unresolved[:, self.action_order], self.action_indptr
+        ) > 0
+        condition_unresolved = np.zeros(values.shape, dtype=bool)
+        condition_unresolved[:, self.action_columns] = unresolved_by_action
+        unknown_undecided = is_unknown & self.is_derived[self.indices] & condition_unresolved[:, self.indices]
+
+        n_true = _segment_sum(is_true, self.indptr)
+        n_false = _segment_sum(is_false, self.indptr)
+        n_unknown = _segment_sum(is_unknown, self.indptr)
+        n_pending = _segment_sum(is_pending, self.indptr)
+        n_undecided = _segment_sum(unknown_undecided, self.indptr)
+
+        and_status = np.select(
+            [n_true == self.condition_count, n_false > 0, (n_unknown > 0) & (n_pending == 0)],
+            [_FIRED, _BLOCKED, _UNCERTAIN],
+            default=-1
+        )
+        or_negative = (n_pending == 0) & (n_undecided == 0)
+        or_status = np.select(
+            [n_true > 0, or_negative & (n_unknown > 0), or_negative],
+            [_FIRED, _UNCERTAIN, _BLOCKED],
+            default=-1
+        )
+        new_status = np.where(self.is_or, or_status, and_status)
+        if rule_subset is not None:
+            mask = np.zeros(len(self.network.rules), dtype=bool)
+            mask[rule_subset] = True
+            new_status = np.where(mask, new_status, -1)
+        return np.where(new_status >= 0, new_status, statuses).astype(np.uint8)
+
+    def propagate(
+        self,
+        findings: np.ndarray,
+        hypotheses: np.ndarray,
+        statuses: np.ndarray,
+        action_subset: Optional[np.ndarray] = None
+    ) -> np.ndarray:
+        """ルールステータスから仮説を導出し、更新後の仮説配列を返す（FixpointSolverと同じ規則）"""
+        hypotheses = hypotheses.copy()
+        ordered = statuses[:, self.action_order]
+        fired = _segment_sum(ordered == _FIRED, self.action_indptr) > 0
+        not_blocked = _segment_sum(ordered != _BLOCKED, self.action_indptr) > 0
+        blocked_and = _segment_sum(
+            (ordered == _BLOCKED) & ~self.is_or[self.action_order], self.action_indptr
+        ) > 0
+        unresolved = _segment_sum(
+            (ordered != _FIRED) & (ordered != _BLOCKED) & (ordered != _UNCERTAIN), self.action_indptr
+        ) > 0
+        uncertain = _segment_sum(ordered == _UNCERTAIN, self.action_indptr) > 0
+
+        groups = np.arange(len(self.action_columns)) if action_subset is None else action_subset
+        columns = self.action_columns[groups]
+        finding = findings[:, columns]
+        hypo = hypotheses[:, columns]
+        current = np.where(finding != 0, finding, hypo)
+        fired, not_blocked = fired[:, groups], not_blocked[:, groups]
+        blocked_and, unresolved, uncertain = blocked_and[:, groups], unresolved[:, groups], uncertain[:, groups]
+
+        derive_true = fired & (current != TRUE_BIT) & (hypo != TRUE_BIT)
+        derive_false = (
+            blocked_and & ~not_blocked & (current != FALSE_BIT) & (hypo != FALSE_BIT)
+        )
+        derive_unknown = ~unresolved & ~fired & uncertain & (current == 0)
+        hypo = np.where(derive_true, TRUE_BIT, hypo)
+        hypo = np.where(derive_false, FALSE_BIT, hypo)
+        hypo = np.where(derive_unknown, UNKNOWN_BIT, hypo)
+        hypotheses[:, columns] = hypo
+
+        # ANDルールが発火した場合、UNKNOWNだった上流条件もTRUEとして導出
+        fired_and = (statuses == _FIRED) & ~self.is_or
+        if action_subset is not None:
+            in_subset = np.zeros(len(self.action_columns), dtype=bool)
+            in_subset[action_subset] = True
+            fired_and &= in_subset[self.action_group_of_rule]
+        upstream = fired_and[:, self.rule_of_incidence]
+        upstream &= (findings[:, self.indices] == UNKNOWN_BIT)
+        if upstream.any():
+            marked = np.zeros(hypotheses.shape, dtype=bool)
+            rows, incidences = np.nonzero(upstream)
+            marked[rows, self.indices[incidences]] = True
+            hypotheses = np.where(marked, TRUE_BIT, hypotheses).astype(np.uint8)
+        return hypotheses
+
+    def solve(
+        self,
+        findings: np.ndarray,
+        hypotheses: Optional[np.ndarray] = None,
+        statuses: Optional[np.ndarray] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """不動点まで評価と伝播を繰り返し、(ステータス, 仮説) を返す
+
+        位相順位ごとにルールを評価し、同じ順位のactionを伝播する（FixpointSolverと同じ順序）。
+        上流条件の導出で下位の値が変わった場合だけ、全順位をもう一巡する。
+        """
+        case_count = findings.shape[0]
+        if hypotheses is None:
+            hypotheses = np.zeros_like(findings)
+        if statuses is None:
+            statuses = self.initial_statuses(case_count)
+
+        while True:
+            prev_hypotheses, prev_statuses = hypotheses, statuses
+            for rank_rules, rank_actions in zip(self.rules_by_rank, self.actions_by_rank):
+                if len(rank_rules):
+                    statuses = self.evaluate_all_rules(findings, hypotheses, statuses, rank_rules)
+                if len(rank_actions):
+                    hypotheses = self.propagate(findings, hypotheses, statuses, rank_actions)
+            if np.array_equal(hypotheses, prev_hypotheses) and np.array_equal(statuses, prev_statuses):
+                return statuses, hypotheses
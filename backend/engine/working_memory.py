@@ -1,13 +1,15 @@
 """
 作業記憶 - 診断中の状態管理
 """
-from typing import Dict, List, Optional, Tuple
+import sys
+from collections.abc import Mapping
+from typing import Dict, Iterator, List, Optional, Tuple
 from dataclasses import dataclass, field
 
 from core import Rule, FactStatus, RuleStatus
 
 
-@dataclass
+@dataclass(slots=True)
 class WorkingMemory:
     """作業記憶クラス
 
@@ -29,7 +31,8 @@ class WorkingMemory:
         return None
 
     def put_finding(self, condition: str, value: FactStatus):
-        """利用者の回答を作業記憶に追加"""
+        """利用者の回答を作業記憶に追加（条件の文字列は知識ベースのものと共有する）"""
+        condition = sys.intern(condition)
         self.findings[condition] = value
         self.answer_history.append((condition, value))
 
@@ -54,9 +57,65 @@ class WorkingMemory:
             self.hypotheses.clear()
 
 
-@dataclass
+@dataclass(slots=True)
 class RuleState:
     """ルールの評価状態"""
     rule: Rule
     status: RuleStatus = RuleStatus.PENDING
-    checked_conditions: Dict[str, FactStatus] = field(default_factory=dict)
+
+
+class RuleStates(Mapping):
+    """ルールID → 評価状態
+
+    状態はステータスを書き込むときに作成し、読むだけならstatus()を使う。
+    1セッションが保持する状態はステータスの変わったルールの分だけになる（それ以外はPENDING）。
+    parentを指定すると親の状態を共有し、参照されたルールだけを複製する（コピーオンライト）。
+    """
+    __slots__ = ("_rules", "_parent", "_states")
+
+    def __init__(self, rules: Mapping, parent: Optional["RuleStates"] = None):
+        self._rules = rules
+        self._parent = parent
+        self._states: Dict[str, RuleState] = {}
+
+    def __getitem__(self, rule_id: str) -> RuleState:
+        state = self._states.get(rule_id)
+        if state is None:
+            state = RuleState(rule=self._rules[rule_id], status=self.status(rule_id))
+            self._states[rule_id] = state
+        return state
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._rules)
+
+    def __len__(self) -> int:
+        return len(self._rules)
+
+    def status(self, rule_id: str) -> RuleStatus:
+        """ルールのステータスを取得（状態は作成しない）"""
+        state = self._states.get(rule_id)
+        if state is not None:
+            return state.status
+        if self._parent is not None:
+            return self._parent.status(rule_id)
+        return RuleStatus.PENDING
+
+    def snapshot(self) -> Dict[str, RuleStatus]:
+        """PENDING以外のステータスを取得"""
+        statuses = self._parent.snapshot() if self._parent is not None else {}
+        statuses.update((rule_id, state.status) for rule_id, state in self._states.items())
+        return {
+            rule_id: status for rule_id, status in statuses.items()
+            if status != RuleStatus.PENDING
+        }
+
+    def restore(self, statuses: Mapping) -> None:
+        """snapshotで取得したステータスに戻す（含まれないルールはPENDING）"""
+        self._parent = None
+        self._states.clear()
+        for rule_id, status in statuses.items():
+            self[rule_id].status = status
+
+    def created_count(self) -> int:
+        """作成済みの状態の数"""
+        return len(self._states)
@@ -1,22 +1,30 @@
 """
 Knowledge - 知識ベースモジュール
 """
+from .network import RuleNetwork
+from .knowledge_base import KnowledgeBase
 from .store import (
     RULES,
     get_all_rules,
     get_goal_rules,
     get_all_base_conditions,
     get_derived_conditions,
+    get_knowledge_base,
+    get_reload_stats,
     reload_rules,
     save_rules,
 )
 
 __all__ = [
     "RULES",
+    "RuleNetwork",
+    "KnowledgeBase",
     "get_all_rules",
     "get_goal_rules",
     "get_all_base_conditions",
     "get_derived_conditions",
+    "get_knowledge_base",
+    "get_reload_stats",
     "reload_rules",
     "save_rules",
 ]
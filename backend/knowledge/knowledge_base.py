@@ -0,0 +1,75 @@
+"""
+知識ベーススナップショット - 不変のコンパイル済み知識ベース
+"""
+import hashlib
+import json
+from types import MappingProxyType
+from typing import Dict, List, Sequence, Tuple
+
+from core import Rule
+from .network import RuleNetwork
+
+
+# 構築後に読み取り専用ビューへ差し替える索引
+_FROZEN_INDEXES = (
+    "rule_index",
+    "rule_by_id",
+    "condition_ids",
+    "rules_by_condition",
+    "rules_by_action",
+    "support_rules_by_goal",
+    "goal_ref_count",
+    "dependent_closure",
+    "rule_rank",
+    "action_rank",
+)
+
+
+def compute_version(rules: Sequence[Rule]) -> str:
+    """ルール内容（rules.json順を含む）からバージョンIDを計算"""
+    payload = json.dumps(
+        [
+            [list(r.conditions), r.action, r.is_or_rule, r.is_goal_action]
+            for r in rules
+        ],
+        ensure_ascii=False,
+        separators=(",", ":")
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+class KnowledgeBase(RuleNetwork):
+    """不変の知識ベーススナップショット
+
+    ロードごとに一度だけ構築し、以降は変更しない。
+    推論エンジンはコピーせずに参照を保持するため、再読み込みで新しい
+    スナップショットが公開されても進行中のセッションは元のスナップショットで推論を続ける。
+    - version: ルール内容のハッシュ（同じ内容なら同じ値）
+    - rule_ids: rules.json順のルールID
+    - display_rules: 推論画面の表示順のルール（actionが重複する場合は後のルール）
+    - conditions / condition_ids: 条件・actionの文字列と整数ID（rules.json順の初出順）
+    """
+
+    def __init__(self, rules: List[Rule]):
+        super().__init__(rules)
+        self.version: str = compute_version(self.rules)
+        self.rule_ids: Tuple[str, ...] = tuple(r.id for r in self.rules)
+        self.display_rules: Tuple[Rule, ...] = tuple(
+            sorted(self.rule_by_id.values(), key=lambda r: self.rule_index[r.id])
+        )
+        self.condition_ids: Dict[str, int] = {}
+        for rule in self.rules:
+            for text in (*rule.conditions, rule.action):
+                self.condition_ids.setdefault(text, len(self.condition_ids))
+        self.conditions: Tuple[str, ...] = tuple(self.condition_ids)
+        for name in _FROZEN_INDEXES:
+            setattr(self, name, MappingProxyType(getattr(self, name)))
+        self._frozen = True
+
+    def __setattr__(self, name, value):
+        if getattr(self, "_frozen", False):
+            raise AttributeError(f"KnowledgeBase is immutable: {name}")
+        super().__setattr__(name, value)
+
+    def __repr__(self) -> str:
+        return f"KnowledgeBase(version={self.version!r}, rules={len(self.rules)})"
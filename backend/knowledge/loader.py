@@ -3,6 +3,7 @@
 """
 import os
 import json
+import sys
 from typing import List
 
 from core import Rule
@@ -24,20 +25,39 @@ def load_rules_from_json() -> List[Rule]:
     Raises:
         RuleLoadError: ルールファイルが存在しない、または読み込みに失敗した場合
     """
+    return parse_rules_json(read_rules_file())
+
+
+def read_rules_file() -> bytes:
+    """ルールファイルの内容をそのまま読み込む
+
+    Raises:
+        RuleLoadError: ルールファイルが存在しない場合
+    """
     if not os.path.exists(RULES_FILE):
         raise RuleLoadError(f"ルールファイルが見つかりません: {RULES_FILE}")
 
-    with open(RULES_FILE, 'r', encoding='utf-8') as f:
-        data = json.load(f)
+    with open(RULES_FILE, 'rb') as f:
+        return f.read()
+
+
+def parse_rules_json(content: bytes) -> List[Rule]:
+    """ルールファイルの内容からルールを構築
+
+    Raises:
+        RuleLoadError: 必須フィールドがない、またはルールが定義されていない場合
+    """
+    data = json.loads(content.decode('utf-8'))
 
     rules = []
     for idx, r in enumerate(data.get("rules", [])):
         if "conditions" not in r or "action" not in r:
             raise RuleLoadError(f"ルール {idx+1} に必須フィールドがありません")
 
+        # 条件・actionの文字列はintern化し、セッションの作業記憶と同じオブジェクトを共有する
         rule = Rule(
-            conditions=r["conditions"],
-            action=r["action"],
+            conditions=[sys.intern(c) for c in r["conditions"]],
+            action=sys.intern(r["action"]),
             is_or_rule=r.get("is_or_rule", False),
             is_goal_action=r.get("is_goal_action", False)
         )
@@ -0,0 +1,143 @@
+"""
+ルールネットワーク - コンパイル済みの索引
+"""
+from typing import Dict, FrozenSet, List, Tuple
+
+from core import Rule
+
+
+class RuleNetwork:
+    """コンパイル済みルールネットワーク
+
+    知識ベースのロード時に一度だけ構築し、推論中の線形探索を索引参照に置き換える。
+    - rules_by_condition: 条件 → その条件を参照するルール
+    - rules_by_action: action → そのactionを導出するルール
+    - support_rules_by_goal: ゴールルールID → ゴールを支える（導出木に含まれる）ルール
+    - goal_ref_count: ルールID → そのルールを支えとするゴールの数
+    - dependent_closure: 条件 → その条件を参照するルールと、そのactionを辿って上流にあるルールのID
+    - rule_by_id: ルールID → ルール
+    - rule_rank / action_rank: 導出グラフ上の位相順位（葉に近いほど小さい）
+    """
+
+    def __init__(self, rules: List[Rule]):
+        self.rules: Tuple[Rule, ...] = tuple(rules)
+        self.rule_index: Dict[str, int] = {r.id: idx for idx, r in enumerate(self.rules)}
+        self.rule_by_id: Dict[str, Rule] = {r.id: r for r in self.rules}
+
+        rules_by_condition: Dict[str, List[Rule]] = {}
+        rules_by_action: Dict[str, List[Rule]] = {}
+        for rule in self.rules:
+            rules_by_action.setdefault(rule.action, []).append(rule)
+            for cond in rule.conditions:
+                dependents = rules_by_condition.setdefault(cond, [])
+                if not dependents or dependents[-1] is not rule:
+                    dependents.append(rule)
+
+        self.rules_by_condition: Dict[str, Tuple[Rule, ...]] = {
+            cond: tuple(rs) for cond, rs in rules_by_condition.items()
+        }
+        self.rules_by_action: Dict[str, Tuple[Rule, ...]] = {
+            action: tuple(rs) for action, rs in rules_by_action.items()
+        }
+
+        self.goal_rules: Tuple[Rule, ...] = tuple(r for r in self.rules if r.is_goal_action)
+        self.derived_conditions: FrozenSet[str] = frozenset(self.rules_by_action)
+        self.base_conditions: FrozenSet[str] = frozenset(
+            cond for cond in self.rules_by_condition if cond not in self.derived_conditions
+        )
+
+        self.support_rules_by_goal: Dict[str, Tuple[Rule, ...]] = {
+            goal.id: self._collect_support_rules(goal) for goal in self.goal_rules
+        }
+        self.goal_ref_count: Dict[str, int] = {}
+        for support_rules in self.support_rules_by_goal.values():
+            for rule in support_rules:
+                self.goal_ref_count[rule.id] = self.goal_ref_count.get(rule.id, 0) + 1
+
+        self.dependent_closure: Dict[str, FrozenSet[str]] = {}
+        self._compute_dependent_closure()
+
+        self.rule_rank: Dict[str, int] = {}
+        self.action_rank: Dict[str, int] = {}
+        self._compute_ranks()
+
+    def get_deriving_rules(self, condition: str) -> Tuple[Rule, ...]:
+        """条件を導出するルールを取得"""
+        return self.rules_by_action.get(condition, ())
+
+    def get_dependent_rules(self, condition: str) -> Tuple[Rule, ...]:
+        """条件を参照するルールを取得"""
+        return self.rules_by_condition.get(condition, ())
+
+    def get_support_rules(self, goal_rule: Rule) -> Tuple[Rule, ...]:
+        """ゴールルールを支えるルール（ゴール自身を含む）を取得"""
+        return self.support_rules_by_goal.get(goal_rule.id, ())
+
+    def _collect_support_rules(self, goal_rule: Rule) -> Tuple[Rule, ...]:
+        """ゴールから導出木を辿り、支えるルールを収集（循環があっても停止する）"""
+        collected: List[Rule] = []
+        seen = set()
+        stack = [goal_rule]
+        while stack:
+            rule = stack.pop()
+            if id(rule) in seen:
+                continue
+            seen.add(id(rule))
+            collected.append(rule)
+            for cond in rule.conditions:
+                stack.extend(self.rules_by_action.get(cond, ()))
+        collected.sort(key=lambda r: self.rule_index[r.id])
+        return tuple(collected)
+
+    def _compute_dependent_closure(self):
+        """条件ごとに、その条件の値で質問探索の結果が変わりうるルールを収集（循環があっても停止する）"""
+        on_path = set()
+
+        def closure_of(condition: str) -> FrozenSet[str]:
+            if condition in self.dependent_closure:
+                return self.dependent_closure[condition]
+            if condition in on_path:
+                return frozenset()
+            on_path.add(condition)
+            rule_ids = set()
+            for rule in self.rules_by_condition.get(condition, ()):
+                rule_ids.add(rule.id)
+                rule_ids.update(closure_of(rule.action))
+            on_path.discard(condition)
+            self.dependent_closure[condition] = frozenset(rule_ids)
+            return self.dependent_closure[condition]
+
+        for condition in self.rules_by_condition:
+            closure_of(condition)
+        for action in self.rules_by_action:
+            closure_of(action)
+
+    def _compute_ranks(self):
+        """導出グラフの位相順位を計算
+
+        基本条件だけを参照するルールは0、それ以外は参照する導出条件の順位+1。
+        actionの順位はそれを導出するルールの最大順位。循環がある場合は後退辺を無視する。
+        """
+        on_path = set()
+
+        def rank_of_action(action: str) -> int:
+            if action in self.action_rank:
+                return self.action_rank[action]
+            if action in on_path:
+                return -1
+            on_path.add(action)
+            rank = max(rank_of_rule(r) for r in self.rules_by_action[action])
+            on_path.discard(action)
+            self.action_rank[action] = rank
+            return rank
+
+        def rank_of_rule(rule: Rule) -> int:
+            rank = 0
+            for cond in rule.conditions:
+                if cond in self.rules_by_action:
+                    rank = max(rank, rank_of_action(cond) + 1)
+            self.rule_rank[rule.id] = max(rank, self.rule_rank.get(rule.id, 0))
+            return rank
+
+        for action in self.rules_by_action:
+            rank_of_action(action)
@@ -1,14 +1,53 @@
 """
 ルールストア - ルールの保存・取得機能
 """
-from typing import List
+import hashlib
+import os
+from typing import Dict, List, Optional, Tuple
 
 from core import Rule
-from .loader import load_rules_from_json, save_rules_to_json
+from .loader import RULES_FILE, read_rules_file, parse_rules_json, save_rules_to_json
+from .knowledge_base import KnowledgeBase
 
 
-# グローバルルールストア（初回アクセス時にロード）
-RULES: List[Rule] = load_rules_from_json()
+# 最後に読み込んだrules.jsonの (mtime_ns, size) と内容のハッシュ
+_file_signature: Optional[Tuple[int, int]] = None
+_file_digest: Optional[str] = None
+
+# 再読み込みの統計
+# - reloads: 実際にパースしてスナップショットを公開した回数
+# - cache_hits: mtime・サイズが一致し、ファイルを開かずに済んだ回数
+# - unchanged_content: mtime・サイズは変わったが内容が同じでパースを省いた回数
+_reload_stats: Dict[str, int] = {"reloads": 0, "cache_hits": 0, "unchanged_content": 0}
+
+
+def _read_signature() -> Optional[Tuple[int, int]]:
+    """rules.jsonの (mtime_ns, size) を取得（存在しなければNone）"""
+    try:
+        stat = os.stat(RULES_FILE)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _load_knowledge_base(
+    signature: Optional[Tuple[int, int]],
+    content: bytes
+) -> KnowledgeBase:
+    """rules.jsonの内容からスナップショットを構築し、ファイルの状態を記録"""
+    global _file_signature, _file_digest
+    knowledge_base = KnowledgeBase(parse_rules_json(content))
+    _file_signature = signature
+    _file_digest = hashlib.sha256(content).hexdigest()
+    _reload_stats["reloads"] += 1
+    return knowledge_base
+
+
+# 公開中の知識ベーススナップショット（ロードごとに差し替える）
+_knowledge_base: KnowledgeBase = _load_knowledge_base(_read_signature(), read_rules_file())
+
+# グローバルルールストア（ルール編集用。公開中のスナップショットと同じルールを指す）
+RULES: List[Rule] = list(_knowledge_base.rules)
 
 
 def get_all_rules() -> List[Rule]:
@@ -16,39 +55,60 @@ def get_all_rules() -> List[Rule]:
     return RULES.copy()
 
 
+def get_knowledge_base() -> KnowledgeBase:
+    """公開中の知識ベーススナップショットを取得"""
+    return _knowledge_base
+
+
 def get_goal_rules() -> List[Rule]:
     """ゴールルール（最終結論を導くルール）を取得（rules.json順）"""
-    return [r for r in RULES if r.is_goal_action]
+    return list(_knowledge_base.goal_rules)
 
 
 def get_all_base_conditions() -> set:
     """全ての基本条件（他のルールの結論ではないもの）を取得"""
-    all_conditions = set()
-    all_actions = {r.action for r in RULES}
-
-    for rule in RULES:
-        for cond in rule.conditions:
-            if cond not in all_actions:
-                all_conditions.add(cond)
-
-    return all_conditions
+    return set(_knowledge_base.base_conditions)
 
 
 def get_derived_conditions() -> set:
     """導出可能な条件（他のルールの結論であるもの）を取得"""
-    return {r.action for r in RULES}
+    return set(_knowledge_base.derived_conditions)
 
 
-def reload_rules() -> List[Rule]:
+def get_reload_stats() -> Dict[str, int]:
+    """再読み込みの統計（実際の再読み込み回数とキャッシュヒット数）を取得"""
+    return dict(_reload_stats)
+
+
+def reload_rules(force: bool = False) -> List[Rule]:
     """ルールを再読み込み（編集後に呼び出す）
 
-    注意: リストをin-place更新することで、
+    rules.jsonのmtime・サイズが前回と同じならファイルを開かずに済ませ、
+    変わっていても内容のハッシュが同じならパースを省く。
+    force=Trueの場合は常に読み込み直す。
+
+    新しいスナップショットを構築してから一度の代入で公開するため、
+    構築中や読み込み失敗時も公開中のスナップショットは変わらない。
+    旧スナップショットを参照している進行中のセッションにも影響しない。
+
+    注意: RULESはin-place更新することで、
     他モジュールからimportされた参照も最新データを指すようになる
     """
-    global RULES
-    new_rules = load_rules_from_json()
-    RULES.clear()
-    RULES.extend(new_rules)
+    global _knowledge_base, _file_signature
+    signature = _read_signature()
+    if not force and signature is not None and signature == _file_signature:
+        _reload_stats["cache_hits"] += 1
+        return RULES
+
+    content = read_rules_file()
+    if not force and hashlib.sha256(content).hexdigest() == _file_digest:
+        _file_signature = signature
+        _reload_stats["unchanged_content"] += 1
+        return RULES
+
+    knowledge_base = _load_knowledge_base(signature, content)
+    _knowledge_base = knowledge_base
+    RULES[:] = knowledge_base.rules
     return RULES
 
 
@@ -59,4 +119,5 @@ def save_rules(rules_data: dict) -> None:
         例外が発生した場合はそのまま伝播
     """
     save_rules_to_json(rules_data)
-    reload_rules()
+    # 同じ時刻・同じサイズの書き込みでも取りこぼさないよう必ず読み込み直す
+    reload_rules(force=True)
@@ -1,18 +1,42 @@
 """
 ビザ選定エキスパートシステム - FastAPI メインアプリケーション
 """
+import asyncio
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
+from core.constants import SESSION_SWEEP_INTERVAL_SECONDS
+from services.session_store import session_store
+
 from routes.consultation import router as consultation_router
 from routes.rules import router as rules_router
 from routes.conditions import router as conditions_router
 from routes.questionnaire import router as questionnaire_router
 
+
+async def _sweep_sessions_periodically():
+    """期限切れセッションを定期的に破棄"""
+    while True:
+        await asyncio.sleep(SESSION_SWEEP_INTERVAL_SECONDS)
+        session_store.sweep()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    sweeper = asyncio.create_task(_sweep_sessions_periodically())
+    try:
+        yield
+    finally:
+        sweeper.cancel()
+
+
 app = FastAPI(
     title="ビザ選定エキスパートシステム",
     description="オブジェクト指向設計によるビザ選定支援システム",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # CORS設定
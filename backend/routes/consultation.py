@@ -1,28 +1,43 @@
 """
 診断関連のAPIエンドポイント
 """
-from typing import Dict
-from fastapi import APIRouter, HTTPException
-
-from engine import InferenceEngine
-from knowledge import reload_rules
-from schemas import StartRequest, AnswerRequest, GoBackRequest
+from typing import Optional, Tuple
+
+from fastapi import APIRouter, Header, HTTPException
+from fastapi.responses import Response
+
+from core import FactStatus
+from core.constants import REASONING_LOG_PAGE_SIZE
+from engine import InferenceEngine, diagnose_batch, transposition_cache
+from knowledge import reload_rules, get_knowledge_base
+from schemas import (
+    StartRequest, AnswerRequest, GoBackRequest, BatchRequest, WhatIfRequest,
+    StatelessStartRequest, StatelessAnswerRequest, StatelessGoBackRequest
+)
+from services.catalog import get_catalog_body
+from services.question_dag import QuestionDag, get_question_dag
 from services.validation import check_rules_integrity
+from services.session_store import session_store
+from services.start_templates import start_templates
+from services.whatif import find_answer_changes
+from services.stateless import (
+    ANSWER_CODES, CODE_ANSWERS, InvalidTokenError, KnowledgeBaseMismatchError,
+    encode_token, decode_token, replay_cache
+)
 
 router = APIRouter(prefix="/api/consultation", tags=["consultation"])
 
-# セッション管理（実運用ではRedisなどを使用）
-sessions: Dict[str, InferenceEngine] = {}
-
-
-@router.post("/start")
-async def start_consultation(request: StartRequest):
-    """診断を開始"""
-    from core import FactStatus
+# 推論画面表示用の項目（簡易形式ではrules_statusに加えて条件の値とカタログのバージョン、
+# 差分応答では変化した分と、状態の連番・差分で返したかを返す）
+_DISPLAY_KEYS = (
+    "rules_status", "condition_values", "rules_status_delta", "condition_values_delta",
+    "catalog_version", "sequence", "delta"
+)
 
+def _ensure_rules_valid():
+    """ルールを再読み込みし、整合性チェックでエラーがあれば診断を開始できない"""
     reload_rules()
 
-    # 整合性チェック - エラーがあれば診断を開始できない
     issues = check_rules_integrity()
     if issues:
         issue_messages = [i["message"] for i in issues]
@@ -34,44 +49,76 @@ async def start_consultation(request: StartRequest):
             }
         )
 
-    engine = InferenceEngine()
 
-    # 問診票からのinitial_factsを適用
-    if request.initial_facts:
-        for fact in request.initial_facts:
-            status = FactStatus.TRUE if fact.value else FactStatus.FALSE
-            engine.working_memory.put_finding(fact.fact_name, status)
+def _display_fields(result: dict) -> dict:
+    """エンジンの結果から推論画面表示用の項目を取り出す"""
+    return {key: result[key] for key in _DISPLAY_KEYS if key in result}
 
-    first_question = engine.start_consultation()
 
-    sessions[request.session_id] = engine
+def _get_session(session_id: str) -> InferenceEngine:
+    """セッションを取得（存在しないか期限切れなら404）"""
+    engine = session_store.get(session_id)
+    if engine is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return engine
+
+
+@router.post("/start")
+async def start_consultation(request: StartRequest):
+    """診断を開始"""
+    _ensure_rules_valid()
+
+    # 問診票からのinitial_factsごとに評価済みのテンプレートを複製する
+    initial_facts = tuple((f.fact_name, f.value) for f in request.initial_facts)
+    template = start_templates.get(get_knowledge_base(), initial_facts)
+
+    session_store.put(request.session_id, template.new_engine())
+
+    return Response(
+        content=template.response_body(request.session_id, request.compact),
+        media_type="application/json"
+    )
+
+
+@router.post("/batch")
+async def batch_diagnosis(request: BatchRequest):
+    """複数の事実の組を一括で診断（セッションを作らない）"""
+    _ensure_rules_valid()
+
+    fact_sets = [
+        {fact.fact_name: FactStatus.from_answer(fact.answer) for fact in case.facts}
+        for case in request.cases
+    ]
+    knowledge_base = get_knowledge_base()
+    results = diagnose_batch(knowledge_base, fact_sets)
 
     return {
-        "session_id": request.session_id,
-        "current_question": first_question,
-        "rules_status": engine.get_rules_display_info(),
-        "is_complete": first_question is None,
-        "applied_initial_facts": [f.fact_name for f in request.initial_facts] if request.initial_facts else []
+        "knowledge_base_version": knowledge_base.version,
+        "count": len(results),
+        "results": [
+            {"case_id": case.case_id, **result}
+            for case, result in zip(request.cases, results)
+        ]
     }
 
 
 @router.post("/answer")
 async def answer_question(request: AnswerRequest):
     """質問に回答"""
-    if request.session_id not in sessions:
-        raise HTTPException(status_code=404, detail="Session not found")
-
-    engine = sessions[request.session_id]
+    engine = _get_session(request.session_id)
 
     if not engine.current_question:
         raise HTTPException(status_code=400, detail="No current question")
 
-    result = engine.answer_question(engine.current_question, request.answer)
+    result = engine.answer_question(
+        engine.current_question, request.answer, request.compact, request.since_sequence
+    )
+    session_store.put(request.session_id, engine)
 
     response = {
         "session_id": request.session_id,
         "current_question": result["next_question"],
-        "rules_status": result["rules_status"],
+        **_display_fields(result),
         "derived_facts": result["derived_facts"],
         "is_complete": result["is_complete"]
     }
@@ -85,17 +132,26 @@ async def answer_question(request: AnswerRequest):
 @router.post("/back")
 async def go_back(request: GoBackRequest):
     """前の質問に戻る"""
-    if request.session_id not in sessions:
-        raise HTTPException(status_code=404, detail="Session not found")
-
-    engine = sessions[request.session_id]
-    result = engine.go_back(request.steps)
+    engine = _get_session(request.session_id)
+    result = engine.go_back(request.steps, request.compact, request.since_sequence)
+    session_store.put(request.session_id, engine)
 
     return {
         "session_id": request.session_id,
         "current_question": result["current_question"],
         "answered_questions": result["answered_questions"],
-        "rules_status": result["rules_status"]
+        **_display_fields(result)
+    }
+
+
+@router.post("/whatif")
+async def what_if(request: WhatIfRequest):
+    """回答を1つだけ変えると新たに該当するビザを取得"""
+    engine = _get_session(request.session_id)
+
+    return {
+        "session_id": request.session_id,
+        "changes": find_answer_changes(engine, request.visa)
     }
 
 
@@ -105,26 +161,201 @@ async def restart_consultation(request: StartRequest):
     engine = InferenceEngine()
     first_question = engine.start_consultation()
 
-    sessions[request.session_id] = engine
+    session_store.put(request.session_id, engine)
 
     return {
         "session_id": request.session_id,
-        "current_question": first_question,
-        "rules_status": engine.get_rules_display_info(),
-        "is_complete": first_question is None
+        "current_question": engine.get_condition_ref(first_question, request.compact),
+        **engine.get_display_fields(request.compact),
+        "is_complete": first_question is None,
+        "knowledge_base_version": engine.knowledge_base.version,
+        "sequence": engine.sequence
     }
 
 
 @router.get("/state/{session_id}")
-async def get_state(session_id: str):
+async def get_state(session_id: str, compact: bool = False):
     """現在の状態を取得"""
-    if session_id not in sessions:
-        raise HTTPException(status_code=404, detail="Session not found")
-
-    engine = sessions[session_id]
-    state = engine.get_current_state()
+    engine = _get_session(session_id)
+    state = engine.get_current_state(compact)
 
     return {
         "session_id": session_id,
         **state
     }
+
+
+@router.get("/log/{session_id}")
+async def get_reasoning_log(session_id: str, offset: int = 0, limit: int = REASONING_LOG_PAGE_SIZE):
+    """推論ログを取得
+
+    offsetは診断開始からの通し位置。保持する上限を超えて捨てた分は返さず、
+    その場合のoffsetは保持している最も古い位置に読み替える。
+    """
+    engine = _get_session(session_id)
+    log = engine.reasoning_log
+    offset = max(offset, log.first)
+
+    return {
+        "session_id": session_id,
+        "offset": offset,
+        "total": log.total,
+        "entries": log.render(offset, limit)
+    }
+
+
+def _decode_token(token: str):
+    """トークンを検証して (バージョン, 初期事実, 回答列) を取り出す（不正なら400）"""
+    try:
+        return decode_token(token)
+    except InvalidTokenError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def _find_in_dag(version: str, initial_facts, answers: str) -> Tuple[Optional[QuestionDag], Optional[int]]:
+    """コンパイル済みの決定DAGから回答列の状態のノードを探す（なければ推論エンジンで処理する）"""
+    dag = get_question_dag(get_knowledge_base())
+    if dag is None or dag.version != version:
+        return None, None
+    return dag, dag.find(initial_facts, answers)
+
+
+def _replay(version: str, initial_facts, answers: str) -> InferenceEngine:
+    """回答列を再現したエンジンを取得（ルールが更新されていれば409）"""
+    try:
+        return replay_cache.replay(version, initial_facts, answers)
+    except InvalidTokenError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except KnowledgeBaseMismatchError as e:
+        raise HTTPException(
+            status_code=409,
+            detail={
+                "error": "ルールが更新されたため診断を続行できません。最初からやり直してください",
+                "knowledge_base_version": str(e)
+            }
+        )
+
+
+@router.post("/stateless/start")
+async def start_stateless_consultation(request: StatelessStartRequest):
+    """サーバーにセッションを持たない診断を開始（状態は返却するトークンに含める）"""
+    _ensure_rules_valid()
+
+    knowledge_base = get_knowledge_base()
+    version = knowledge_base.version
+    initial_facts = tuple((f.fact_name, f.value) for f in request.initial_facts)
+    dag, index = _find_in_dag(version, initial_facts, "")
+    if index is not None:
+        first_question = dag.question(index)
+        display = dag.display_fields(index, request.compact)
+    else:
+        engine = _replay(version, initial_facts, "")
+        first_question = engine.current_question
+        display = engine.get_display_fields(request.compact)
+
+    condition_ids = knowledge_base.condition_ids if request.compact else {}
+    return {
+        "token": encode_token(version, initial_facts, ""),
+        "current_question": condition_ids.get(first_question, first_question),
+        **display,
+        "is_complete": first_question is None,
+        "knowledge_base_version": version,
+        "applied_initial_facts": [condition_ids.get(name, name) for name, _ in initial_facts]
+    }
+
+
+@router.post("/stateless/answer")
+async def answer_stateless_question(request: StatelessAnswerRequest):
+    """トークンの回答列を再現してから質問に回答"""
+    version, initial_facts, answers = _decode_token(request.token)
+    code = ANSWER_CODES.get(request.answer, ANSWER_CODES["unknown"])
+
+    dag, index = _find_in_dag(version, initial_facts, answers + code)
+    if index is not None:
+        answers += code
+        result = dag.answer_result(index, initial_facts, answers, request.compact)
+    else:
+        engine = _replay(version, initial_facts, answers)
+
+        if not engine.current_question:
+            raise HTTPException(status_code=400, detail="No current question")
+
+        result = engine.answer_question(engine.current_question, CODE_ANSWERS[code], request.compact)
+        answers += code
+        replay_cache.remember(engine, initial_facts, answers)
+
+    response = {
+        "token": encode_token(version, initial_facts, answers),
+        "current_question": result["next_question"],
+        **_display_fields(result),
+        "derived_facts": result["derived_facts"],
+        "is_complete": result["is_complete"]
+    }
+
+    if result["is_complete"]:
+        response["diagnosis_result"] = result.get("diagnosis_result")
+
+    return response
+
+
+@router.post("/stateless/back")
+async def go_back_stateless(request: StatelessGoBackRequest):
+    """トークンの回答列を短くして前の質問に戻る"""
+    version, initial_facts, answers = _decode_token(request.token)
+
+    steps = min(max(request.steps, 0), len(answers))
+    answers = answers[:len(answers) - steps]
+
+    # 診断完了の状態では推論エンジンの現在の質問が直前の質問のまま残るため、DAGは未完了の状態だけに使う
+    dag, index = _find_in_dag(version, initial_facts, answers)
+    answered = None
+    if index is not None and not dag.is_complete(index):
+        answered = dag.answered_questions(initial_facts, answers, request.compact)
+    if answered is not None:
+        question = dag.question(index)
+        if request.compact:
+            question = get_knowledge_base().condition_ids[question]
+        display = dag.display_fields(index, request.compact)
+    else:
+        engine = _replay(version, initial_facts, answers)
+        question = engine.get_condition_ref(engine.current_question, request.compact)
+        answered = engine.get_answered_questions(request.compact)
+        display = engine.get_display_fields(request.compact)
+
+    return {
+        "token": encode_token(version, initial_facts, answers),
+        "current_question": question,
+        "answered_questions": answered,
+        **display
+    }
+
+
+@router.get("/catalog")
+async def get_catalog(if_none_match: Optional[str] = Header(None)):
+    """簡易形式（compact）の応答で参照するルール・条件のカタログを取得
+
+    ETagは知識ベースのバージョンで、変わっていなければ304を返す。
+    """
+    reload_rules()
+    knowledge_base = get_knowledge_base()
+    etag = f'"{knowledge_base.version}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if if_none_match == etag:
+        return Response(status_code=304, headers=headers)
+
+    return Response(
+        content=get_catalog_body(knowledge_base),
+        media_type="application/json",
+        headers=headers
+    )
+
+
+@router.get("/sessions/stats")
+async def get_session_stats():
+    """セッションストアの保持数と破棄の統計、各キャッシュの統計を取得"""
+    return {
+        **session_store.stats(),
+        "replay_cache": replay_cache.stats(),
+        "start_templates": start_templates.stats(),
+        "transposition_cache": transposition_cache.stats()
+    }
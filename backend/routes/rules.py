@@ -6,11 +6,15 @@ import io
 from fastapi import APIRouter, HTTPException, UploadFile, File
 from fastapi.responses import StreamingResponse
 
+from core import Rule
+from core.constants import EXPLORER_MAX_WORKERS
 from knowledge import (
-    get_all_rules, RULES, save_rules, reload_rules
+    get_all_rules, RULES, save_rules, reload_rules, get_reload_stats, get_knowledge_base
 )
-from schemas import RuleRequest, DeleteRequest, ReorderRequest, ImportApplyRequest
-from services.validation import check_rules_integrity
+from schemas import RuleRequest, DeleteRequest, ReorderRequest, ImportApplyRequest, ExploreRequest
+from services.explorer import exploration_jobs
+from services.question_dag import questionnaire_roots
+from services.validation import check_rules_integrity, get_validation_state, validate_rule_edit
 from services.rule_helpers import (
     rules_to_dict_list, build_rules_data, request_to_dict
 )
@@ -46,6 +50,7 @@ async def create_rule(rule: RuleRequest):
     insert_after: 挿入位置（0=先頭、N=N番目の後、None=末尾）
     """
     reload_rules()
+    previous = get_validation_state()
     rules_data = build_rules_data(RULES)
     new_rule = request_to_dict(rule)
 
@@ -62,7 +67,8 @@ async def create_rule(rule: RuleRequest):
         rules_data["rules"].append(new_rule)
 
     save_rules(rules_data)
-    return {"status": "created", "action": rule.action, "position": insert_index}
+    state = validate_rule_edit(previous, None, Rule(**new_rule))
+    return {"status": "created", "action": rule.action, "position": insert_index, "issues": state.issues}
 
 
 @router.put("/rules")
@@ -77,11 +83,14 @@ async def update_rule(rule: RuleRequest):
         raise HTTPException(status_code=404, detail="Rule not found at specified index")
 
     # インデックス位置のルールだけを更新
+    previous = get_validation_state()
+    old_rule = RULES[rule.index]
     rules_data = build_rules_data(RULES)
     rules_data["rules"][rule.index] = request_to_dict(rule)
 
     save_rules(rules_data)
-    return {"status": "updated", "action": rule.action, "index": rule.index}
+    state = validate_rule_edit(previous, old_rule, Rule(**request_to_dict(rule)))
+    return {"status": "updated", "action": rule.action, "index": rule.index, "issues": state.issues}
 
 
 @router.post("/rules/delete")
@@ -93,12 +102,15 @@ async def delete_rule(request: DeleteRequest):
         raise HTTPException(status_code=404, detail="Rule not found at specified index")
 
     # インデックス位置のルールだけを削除
+    previous = get_validation_state()
+    old_rule = RULES[request.index]
     rules_data = build_rules_data(RULES)
     deleted_action = rules_data["rules"][request.index]["action"]
     del rules_data["rules"][request.index]
 
     save_rules(rules_data)
-    return {"status": "deleted", "index": request.index, "action": deleted_action}
+    state = validate_rule_edit(previous, old_rule, None)
+    return {"status": "deleted", "index": request.index, "action": deleted_action, "issues": state.issues}
 
 
 @router.post("/rules/reorder")
@@ -119,11 +131,54 @@ async def reorder_rules(request: ReorderRequest):
 
 @router.post("/rules/reload")
 async def reload_all_rules():
-    """ルールをJSONファイルから再読み込み"""
-    reload_rules()
+    """ルールをJSONファイルから再読み込み（キャッシュを使わず必ず読み込み直す）"""
+    reload_rules(force=True)
     return {"status": "reloaded", "count": len(RULES)}
 
 
+@router.get("/rules/reload/stats")
+async def get_rules_reload_stats():
+    """ルール再読み込みの統計（実際の再読み込み回数とキャッシュヒット数）を取得"""
+    return {
+        "knowledge_base_version": get_knowledge_base().version,
+        **get_reload_stats()
+    }
+
+
+@router.post("/rules/explore")
+async def start_exploration(request: ExploreRequest):
+    """公開中のルールのすべての診断経路を辿る探索をバックグラウンドで開始"""
+    if request.workers is not None and not 1 <= request.workers <= EXPLORER_MAX_WORKERS:
+        raise HTTPException(status_code=400, detail=f"workers は 1〜{EXPLORER_MAX_WORKERS} で指定してください")
+    for name in ("max_depth", "max_states"):
+        value = getattr(request, name)
+        if value is not None and value < 1:
+            raise HTTPException(status_code=400, detail=f"{name} は 1 以上で指定してください")
+    reload_rules()
+    options = {
+        "roots": questionnaire_roots() if request.questionnaire else [()],
+        "workers": request.workers
+    }
+    if request.max_depth is not None:
+        options["max_depth"] = request.max_depth
+    if request.max_states is not None:
+        options["max_states"] = request.max_states
+
+    job = exploration_jobs.start(**options)
+    if job is None:
+        raise HTTPException(status_code=409, detail="実行中の探索があります")
+    return {"job_id": job["job_id"], "status": job["status"]}
+
+
+@router.get("/rules/explore/{job_id}")
+async def get_exploration(job_id: str):
+    """探索の状態と結果（経路数・ゴールごとの質問数・到達しないゴール・打ち切った経路）を取得"""
+    job = exploration_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {key: value for key, value in job.items() if key != "options"}
+
+
 @router.get("/rules/export")
 async def export_rules_csv():
     """ルールをCSV形式でエクスポート"""
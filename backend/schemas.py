@@ -15,16 +15,57 @@ class InitialFact(BaseModel):
 class StartRequest(BaseModel):
     session_id: str
     initial_facts: List[InitialFact] = []
+    compact: bool = False  # 条件・ルールをカタログのIDで参照する簡易形式で返す
 
 
 class AnswerRequest(BaseModel):
     session_id: str
     answer: str  # "yes", "no", "unknown"
+    compact: bool = False
+    since_sequence: Optional[int] = None  # 保持している状態の連番（一致すれば変化した分だけを返す）
 
 
 class GoBackRequest(BaseModel):
     session_id: str
     steps: int = 1
+    compact: bool = False
+    since_sequence: Optional[int] = None
+
+
+class WhatIfRequest(BaseModel):
+    session_id: str
+    visa: Optional[str] = None  # 指定したビザが該当するようになる変更だけを返す
+
+
+class StatelessStartRequest(BaseModel):
+    initial_facts: List[InitialFact] = []
+    compact: bool = False
+
+
+class StatelessAnswerRequest(BaseModel):
+    token: str
+    answer: str  # "yes", "no", "unknown"
+    compact: bool = False
+
+
+class StatelessGoBackRequest(BaseModel):
+    token: str
+    steps: int = 1
+    compact: bool = False
+
+
+class BatchFact(BaseModel):
+    fact_name: str
+    answer: str  # "yes", "no", "unknown"
+
+
+class BatchCase(BaseModel):
+    case_id: Optional[str] = None
+    facts: List[BatchFact] = []
+
+
+class BatchRequest(BaseModel):
+    cases: List[BatchCase]
 
 
 # ========== ルール管理関連 ==========
@@ -48,3 +89,10 @@ class ReorderRequest(BaseModel):
 
 class ImportApplyRequest(BaseModel):
     rules: List[dict]
+
+
+class ExploreRequest(BaseModel):
+    workers: Optional[int] = None  # プロセス数（1〜EXPLORER_MAX_WORKERS、省略時はCPU数）
+    max_depth: Optional[int] = None  # 1経路の質問数の上限（1以上）
+    max_states: Optional[int] = None  # ワーカーごとにメモする状態数の上限（1以上）
+    questionnaire: bool = True  # 問診票の初期事実の組ごとに辿る（Falseなら初期事実なしだけ）
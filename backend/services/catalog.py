@@ -0,0 +1,58 @@
+"""
+カタログ - 簡易形式の応答で参照するルール・条件のIDと文字列の対応
+"""
+import json
+from typing import Any, Dict
+
+from engine import InferenceEngine
+from knowledge import KnowledgeBase
+
+
+# 知識ベースのバージョン → カタログのJSON（最新バージョンの分だけ保持）
+_catalog_cache: Dict[str, bytes] = {}
+
+
+def build_catalog(knowledge_base: KnowledgeBase) -> Dict[str, Any]:
+    """知識ベースのカタログを構築
+
+    - conditions: 条件・actionの文字列（位置が条件のID）
+    - rules: 推論画面の表示順のルール（位置が簡易形式のrules_statusの文字の位置）
+    - rule_status_codes / condition_value_codes: 簡易形式の1文字表現
+    """
+    ids = knowledge_base.condition_ids
+    return {
+        "knowledge_base_version": knowledge_base.version,
+        "conditions": [
+            {"text": text, "is_derived": text in knowledge_base.derived_conditions}
+            for text in knowledge_base.conditions
+        ],
+        "rules": [
+            {
+                "index": knowledge_base.rule_index[rule.id],
+                "action": ids[rule.action],
+                "conditions": [ids[cond] for cond in rule.conditions],
+                "is_and_rule": not rule.is_or_rule,
+                "operator": "AND" if not rule.is_or_rule else "OR"
+            }
+            for rule in knowledge_base.display_rules
+        ],
+        "rule_status_codes": {
+            code: status.value for status, code in InferenceEngine.RULE_STATUS_CODES.items()
+        },
+        "condition_value_codes": {
+            **{code: status.value for status, code in InferenceEngine.CONDITION_VALUE_CODES.items()},
+            "-": "unchecked"
+        }
+    }
+
+
+def get_catalog_body(knowledge_base: KnowledgeBase) -> bytes:
+    """カタログのJSONを取得（バージョンごとに一度だけ構築）"""
+    body = _catalog_cache.get(knowledge_base.version)
+    if body is None:
+        body = json.dumps(
+            build_catalog(knowledge_base), ensure_ascii=False, separators=(",", ":")
+        ).encode("utf-8")
+        _catalog_cache.clear()
+        _catalog_cache[knowledge_base.version] = body
+    return body
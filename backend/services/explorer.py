@@ -0,0 +1,282 @@
+"""
+状態空間の探索 - ルールを公開する前に、すべての診断経路を推論エンジンで辿って網羅的に集計する
+
+実行: python -m services.explorer [--workers N] [--max-depth N] [--max-states N]
+"""
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from core import RuleStatus
+from core.constants import (
+    EXPLORER_MAX_DEPTH,
+    EXPLORER_MAX_STATES,
+    EXPLORER_TRUNCATED_SAMPLES,
+    EXPLORER_JOB_HISTORY,
+    EXPLORER_MAX_WORKERS,
+)
+from engine import InferenceEngine
+from knowledge import get_knowledge_base
+from .question_dag import ANSWER_CODES, InitialFacts, questionnaire_roots
+from .start_templates import StartTemplate
+
+
+_CODE_ANSWERS = {"y": "yes", "n": "no", "u": "unknown"}
+
+# どのゴールも発火せずに完了した経路の集計キー
+NO_GOAL = ""
+
+# 部分木の集計: (経路数, 質問数の合計, 質問数の最大, 打ち切った経路数, ゴール → [経路数, 質問数の合計, 質問数の最大])
+Stats = Tuple[int, int, int, int, Dict[str, List[int]]]
+
+
+def _leaf_stats(engine: InferenceEngine) -> Stats:
+    """完了した状態（以降の質問数0）の集計"""
+    fired = [
+        goal.action for goal in engine.knowledge_base.goal_rules
+        if engine.rule_states.status(goal.id) == RuleStatus.FIRED
+    ]
+    return 1, 0, 0, 0, {goal: [1, 0, 0] for goal in (fired or [NO_GOAL])}
+
+
+def _accumulate(total: List[Any], stats: Stats, asked: int = 1):
+    """部分木の集計を、その手前で質問をasked個加えて集計totalに足し込む"""
+    paths, questions, longest, truncated, goals = stats
+    total[0] += paths
+    total[1] += questions + paths * asked
+    if paths:
+        total[2] = max(total[2], longest + asked)
+    total[3] += truncated
+    for goal, (goal_paths, goal_questions, goal_longest) in goals.items():
+        entry = total[4].setdefault(goal, [0, 0, 0])
+        entry[0] += goal_paths
+        entry[1] += goal_questions + goal_paths * asked
+        entry[2] = max(entry[2], goal_longest + asked)
+
+
+def _state_digest(engine: InferenceEngine) -> bytes:
+    """以降の推論が同じになる状態を同一視するキー（メモの大きさを抑えるためハッシュにする）"""
+    wm = engine.working_memory
+    payload = repr((
+        sorted((cond, status.value) for cond, status in wm.findings.items()),
+        [(cond, status.value) for cond, status in wm.hypotheses.items()],
+        engine.to_state()["s"],
+        engine.current_question,
+        engine._evaluated
+    ))
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).digest()
+
+
+class _Explorer:
+    """1つの部分木を深さ優先で辿る（同じ状態の部分木の集計はメモから再利用する）
+
+    - max_depth: 1経路の質問数の上限（超えた経路は打ち切る）
+    - max_states: メモする状態数の上限（超えた後に初めて出会った状態は辿らずに打ち切る）
+    打ち切りを含む部分木の集計は深さによって変わるためメモしない。
+    """
+
+    def __init__(self, max_depth: int, max_states: int):
+        self.max_depth = max_depth
+        self.max_states = max_states
+        self.memo: Dict[bytes, Stats] = {}
+        self.truncated_samples: List[str] = []
+
+    def visit(self, state: Dict[str, Any], answers: str) -> Stats:
+        total: List[Any] = [0, 0, 0, 0, {}]
+        for code in ANSWER_CODES:
+            engine = InferenceEngine.from_state(state)
+            result = engine.answer_question(engine.current_question, _CODE_ANSWERS[code])
+            key = _state_digest(engine)
+            stats = self.memo.get(key)
+            if stats is None:
+                if result["is_complete"]:
+                    stats = _leaf_stats(engine)
+                elif len(answers) + 1 >= self.max_depth or len(self.memo) >= self.max_states:
+                    stats = (0, 0, 0, 1, {})
+                    if len(self.truncated_samples) < EXPLORER_TRUNCATED_SAMPLES:
+                        self.truncated_samples.append(answers + code)
+                else:
+                    stats = self.visit(engine.to_state(), answers + code)
+                if not stats[3]:
+                    self.memo[key] = stats
+            _accumulate(total, stats)
+        return total[0], total[1], total[2], total[3], total[4]
+
+
+def _explore_subtree(
+    state: Dict[str, Any],
+    answers: str,
+    max_depth: int,
+    max_states: int
+) -> Dict[str, Any]:
+    """ワーカープロセスで1つの部分木を辿る"""
+    explorer = _Explorer(max_depth, max_states)
+    stats = explorer.visit(state, answers)
+    return {
+        "knowledge_base_version": get_knowledge_base().version,
+        "stats": stats,
+        "states": len(explorer.memo),
+        "truncated_samples": explorer.truncated_samples
+    }
+
+
+def explore_rule_base(
+    roots: Sequence[InitialFacts] = ((),),
+    workers: Optional[int] = None,
+    max_depth: int = EXPLORER_MAX_DEPTH,
+    max_states: int = EXPLORER_MAX_STATES
+) -> Dict[str, Any]:
+    """初期事実の組ごとに、診断開始から完了までのすべての経路を辿って集計
+
+    最初の回答で分けた部分木をプロセスプールで並行に辿る。同じ状態はワーカーごとにメモするため、
+    statesはワーカー間で重複して数えた延べ数になる。max_statesもワーカーごとの上限。
+    ワーカー数はEXPLORER_MAX_WORKERSまで。APIサーバーのスレッドから呼ばれるため、
+    ワーカーはforkではなくspawnで起動する（ロックやイベントループを複製しない）。
+    - paths: 完了までの異なる回答列の数
+    - goals: ゴールごとの、そのゴールが発火して完了した経路数と質問数の最大・平均
+      （どのゴールも発火しない経路は no_goal に集計）
+    - unreachable_goals: どの経路でも発火しないゴール（打ち切った経路があれば、その先で発火しうるためNone）
+    - truncated_paths: 上限で打ち切った経路数（truncated_samplesはその回答列の例）
+    """
+    started = time.monotonic()
+    knowledge_base = get_knowledge_base()
+
+    total: List[Any] = [0, 0, 0, 0, {}]
+    states = 0
+    truncated_samples: List[Dict[str, Any]] = []
+    workers = min(workers or os.cpu_count() or 1, EXPLORER_MAX_WORKERS)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        futures = []
+        for initial_facts in roots:
+            state = StartTemplate(tuple(initial_facts)).state
+            if not state["q"]:
+                # 診断開始時点で完了している場合は質問数0の経路が1つ
+                _accumulate(total, _leaf_stats(InferenceEngine.from_state(state)), 0)
+                continue
+            for code in ANSWER_CODES:
+                engine = InferenceEngine.from_state(state)
+                result = engine.answer_question(engine.current_question, _CODE_ANSWERS[code])
+                if result["is_complete"]:
+                    _accumulate(total, _leaf_stats(engine))
+                    continue
+                future = pool.submit(_explore_subtree, engine.to_state(), code, max_depth, max_states)
+                futures.append((initial_facts, future))
+
+        for initial_facts, future in futures:
+            outcome = future.result()
+            if outcome["knowledge_base_version"] != knowledge_base.version:
+                raise RuntimeError("探索中にルールが更新されました")
+            _accumulate(total, outcome["stats"])
+            states += outcome["states"]
+            truncated_samples.extend(
+                {"initial_facts": [[name, value] for name, value in initial_facts], "answers": answers}
+                for answers in outcome["truncated_samples"]
+            )
+
+    paths, questions, longest, truncated, goals = total
+
+    def summary(goal_paths: int, goal_questions: int, goal_longest: int) -> Dict[str, Any]:
+        return {
+            "paths": goal_paths,
+            "max_questions": goal_longest,
+            "mean_questions": goal_questions / goal_paths if goal_paths else 0.0
+        }
+
+    return {
+        "knowledge_base_version": knowledge_base.version,
+        "roots": len(roots),
+        "paths": paths,
+        "states": states,
+        "max_questions": longest,
+        "mean_questions": questions / paths if paths else 0.0,
+        "goals": {
+            goal.action: summary(*goals.get(goal.action, (0, 0, 0)))
+            for goal in knowledge_base.goal_rules
+        },
+        "no_goal": summary(*goals.get(NO_GOAL, (0, 0, 0))),
+        "unreachable_goals": [
+            goal.action for goal in knowledge_base.goal_rules if goal.action not in goals
+        ] if not truncated else None,
+        "truncated_paths": truncated,
+        "truncated_samples": truncated_samples[:EXPLORER_TRUNCATED_SAMPLES],
+        "max_depth": max_depth,
+        "max_states": max_states,
+        "elapsed_seconds": time.monotonic() - started
+    }
+
+
+class ExplorationJobs:
+    """状態空間の探索をバックグラウンドで実行するジョブ（直近のものだけ保持）
+
+    探索はCPUを占有するため、同時に実行するのは1つだけにする。
+    """
+
+    def __init__(self, max_jobs: int = EXPLORER_JOB_HISTORY):
+        self.max_jobs = max_jobs
+        self._jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def start(self, **options) -> Optional[Dict[str, Any]]:
+        """探索を開始してジョブを返す（実行中のジョブがあればNone）"""
+        with self._lock:
+            if any(job["status"] == "running" for job in self._jobs.values()):
+                return None
+            job = {
+                "job_id": uuid.uuid4().hex,
+                "status": "running",
+                "options": options,
+                "started_at": time.time(),
+                "finished_at": None,
+                "result": None,
+                "error": None
+            }
+            self._jobs[job["job_id"]] = job
+            while len(self._jobs) > self.max_jobs:
+                self._jobs.popitem(last=False)
+
+        threading.Thread(target=self._run, args=(job,), daemon=True).start()
+        return dict(job)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """ジョブの状態と結果を取得（存在しなければNone）"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def _run(self, job: Dict[str, Any]):
+        try:
+            result = explore_rule_base(**job["options"])
+            status, error = "completed", None
+        except Exception as e:
+            result, status, error = None, "failed", str(e)
+        with self._lock:
+            job.update(status=status, result=result, error=error, finished_at=time.time())
+
+
+# アプリケーション全体で共有する探索ジョブ
+exploration_jobs = ExplorationJobs()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ルールのすべての診断経路を辿って集計する")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--max-depth", type=int, default=EXPLORER_MAX_DEPTH)
+    parser.add_argument("--max-states", type=int, default=EXPLORER_MAX_STATES)
+    parser.add_argument("--empty-only", action="store_true", help="初期事実なしの診断だけを辿る")
+    args = parser.parse_args()
+
+    roots = [()] if args.empty_only else questionnaire_roots()
+    report = explore_rule_base(roots, args.workers, args.max_depth, args.max_states)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,345 @@
+"""
+質問の決定DAG - 回答列から次の質問と診断結果を引く、事前にコンパイルした表
+
+推論エンジンは知識ベースと回答列が同じなら同じ結果になるため、
+到達しうる状態をあらかじめ辿っておけば、回答ごとの推論を表引きに置き換えられる。
+コンパイル: python -m services.question_dag [--max-nodes N]
+"""
+import argparse
+import json
+import os
+import threading
+from collections import deque
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from core import FactStatus
+from core.constants import QUESTION_DAG_FILE, QUESTION_DAG_MAX_NODES
+from engine import InferenceEngine
+from engine.ordering import RULES_ORDER, resolve_strategy
+from knowledge import KnowledgeBase, get_knowledge_base
+
+
+InitialFacts = Tuple[Tuple[str, bool], ...]
+
+# 回答の1文字表現（services.statelessのトークンと同じ）と、DAGの辺の並び
+ANSWER_CODES = ("y", "n", "u")
+_CODE_ANSWERS = {"y": "yes", "n": "no", "u": "unknown"}
+
+# 簡易形式の条件の値 → 通常形式の表示
+_CONDITION_VALUE_DISPLAY = {
+    **{code: status.value for status, code in InferenceEngine.CONDITION_VALUE_CODES.items()},
+    "-": "unchecked"
+}
+
+# 未コンパイルの辺
+_NO_NODE = -1
+
+
+def _facts_key(initial_facts: Sequence[Tuple[str, bool]]) -> str:
+    """初期事実の組をDAGの起点のキーにする"""
+    return json.dumps([[name, int(value)] for name, value in initial_facts], ensure_ascii=False)
+
+
+def questionnaire_initial_facts(questionnaire: Dict[str, Any]) -> List[InitialFacts]:
+    """問診票のすべての経路について、診断開始時に渡される初期事実の組を列挙
+
+    フロントエンドと同じく、同じ事実を再度設定した場合は前のものを除いて末尾に追加する。
+    """
+    questions = {q["id"]: q for q in questionnaire.get("questions", [])}
+    results: List[InitialFacts] = []
+
+    def walk(question_id: Optional[str], facts: InitialFacts, path: Tuple[str, ...]):
+        question = questions.get(question_id)
+        if question is None or question_id in path:
+            if facts not in results:
+                results.append(facts)
+            return
+        for answer in question["answers"]:
+            collected = list(facts)
+            for fact in answer.get("initial_facts", []):
+                collected = [f for f in collected if f[0] != fact["fact_name"]]
+                collected.append((fact["fact_name"], bool(fact["value"])))
+            walk(answer.get("next_question"), tuple(collected), path + (question_id,))
+
+    walk(questionnaire.get("start_question"), (), ())
+    if () not in results:
+        results.append(())
+    return results
+
+
+def questionnaire_roots(path: Optional[str] = None) -> List[InitialFacts]:
+    """問診票のファイル（省略時はbackend/data/questionnaire.json）から初期事実の組を列挙"""
+    path = path or os.path.join(os.path.dirname(QUESTION_DAG_FILE), "questionnaire.json")
+    questionnaire = {}
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            questionnaire = json.load(f)
+    return questionnaire_initial_facts(questionnaire)
+
+
+def _state_key(engine: InferenceEngine) -> tuple:
+    """以降の推論が同じになる状態を同一視するキー"""
+    state = engine.to_state()
+    return (
+        frozenset(engine.working_memory.findings.items()),
+        tuple(engine.working_memory.hypotheses.items()),
+        state["s"],
+        state["q"],
+        state["ev"]
+    )
+
+
+def _make_node(engine: InferenceEngine, question: Optional[str], is_complete: bool) -> list:
+    """エンジンの状態をDAGのノードにする（questionは開始・回答で返された次の質問）
+
+    [質問のID, ルールステータス, 条件の値, 仮説のID, 完了か, 診断結果, [はい, いいえ, わからない]の行き先]
+    ノードは回答の順序が異なる経路で共有されるため、診断結果のunknown_conditions（回答順）は
+    応答時に回答列から並べ直す。
+    """
+    kb = engine.knowledge_base
+    rules_status, condition_values = engine._display_codes()
+    return [
+        engine.get_condition_ref(question, True),
+        rules_status,
+        condition_values,
+        [kb.condition_ids[cond] for cond in engine.working_memory.hypotheses],
+        int(is_complete),
+        engine._generate_result() if is_complete else None,
+        [_NO_NODE] * len(ANSWER_CODES)
+    ]
+
+
+def compile_question_dag(
+    roots: Sequence[InitialFacts],
+    max_nodes: int = QUESTION_DAG_MAX_NODES
+) -> Dict[str, Any]:
+    """公開中の知識ベースについて、初期事実の組ごとに到達しうる状態を幅優先で辿ってDAGにする
+
+    同じ状態に至る回答列は1つのノードを共有する。ノード数がmax_nodesに達したら打ち切り、
+    辿れなかった辺は未コンパイル（推論エンジンで処理する）として残す。
+    完了した状態からの回答も推論エンジンで処理する。
+    """
+    knowledge_base = get_knowledge_base()
+    nodes: List[list] = []
+    index_by_key: Dict[tuple, int] = {}
+    queue: "deque[Tuple[int, Dict[str, Any]]]" = deque()
+
+    def add_node(engine: InferenceEngine, question: Optional[str], is_complete: bool) -> int:
+        key = _state_key(engine)
+        index = index_by_key.get(key)
+        if index is None and len(nodes) < max_nodes:
+            index = index_by_key[key] = len(nodes)
+            nodes.append(_make_node(engine, question, is_complete))
+            if not is_complete:
+                queue.append((index, engine.to_state()))
+        return _NO_NODE if index is None else index
+
+    root_indexes = {}
+    for initial_facts in roots:
+        engine = InferenceEngine()
+        for name, value in initial_facts:
+            engine.working_memory.put_finding(name, FactStatus.TRUE if value else FactStatus.FALSE)
+        question = engine.start_consultation()
+        root_indexes[_facts_key(initial_facts)] = add_node(engine, question, question is None)
+
+    while queue:
+        index, state = queue.popleft()
+        for position, code in enumerate(ANSWER_CODES):
+            engine = InferenceEngine.from_state(state)
+            result = engine.answer_question(engine.current_question, _CODE_ANSWERS[code])
+            nodes[index][6][position] = add_node(engine, result["next_question"], result["is_complete"])
+
+    return {
+        "knowledge_base_version": knowledge_base.version,
+        "question_strategy": resolve_strategy(),
+        "roots": root_indexes,
+        "nodes": nodes
+    }
+
+
+class QuestionDag:
+    """コンパイル済みの決定DAG
+
+    初期事実と回答列（1文字表現）から状態のノードを引き、推論エンジンの応答と同じ項目を組み立てる。
+    見つからない場合（未コンパイルの経路）はNoneを返すので、呼び出し側は推論エンジンで処理する。
+    """
+
+    def __init__(self, knowledge_base: KnowledgeBase, artifact: Dict[str, Any]):
+        self.knowledge_base = knowledge_base
+        self.version: str = artifact["knowledge_base_version"]
+        self._roots: Dict[str, int] = artifact["roots"]
+        self._nodes: List[list] = artifact["nodes"]
+
+    def __len__(self) -> int:
+        return len(self._nodes)
+
+    def find(self, initial_facts: InitialFacts, answers: str) -> Optional[int]:
+        """回答列を辿った先のノードを取得（未コンパイルならNone）"""
+        index = self._roots.get(_facts_key(initial_facts), _NO_NODE)
+        for code in answers:
+            if index == _NO_NODE:
+                return None
+            index = self._nodes[index][6][ANSWER_CODES.index(code)]
+        return None if index == _NO_NODE else index
+
+    def question(self, index: int) -> Optional[str]:
+        """ノードの質問（なければNone）"""
+        question = self._nodes[index][0]
+        return None if question is None else self.knowledge_base.conditions[question]
+
+    def is_complete(self, index: int) -> bool:
+        """ノードが診断完了の状態か"""
+        return bool(self._nodes[index][4])
+
+    def display_fields(self, index: int, compact: bool) -> Dict[str, Any]:
+        """InferenceEngine.get_display_fieldsと同じ推論画面表示用の情報"""
+        kb = self.knowledge_base
+        _, rules_status, condition_values, _, _, _, _ = self._nodes[index]
+        if compact:
+            return {
+                "rules_status": rules_status,
+                "condition_values": condition_values,
+                "catalog_version": kb.version
+            }
+        return {
+            "rules_status": [
+                {
+                    "id": rule.id,
+                    "index": kb.rule_index.get(rule.id, 0),
+                    "action": rule.action,
+                    "conditions": [
+                        {
+                            "text": cond,
+                            "status": _CONDITION_VALUE_DISPLAY[condition_values[kb.condition_ids[cond]]],
+                            "is_derived": cond in kb.derived_conditions
+                        }
+                        for cond in rule.conditions
+                    ],
+                    "conclusion": rule.action,
+                    "status": InferenceEngine.CODE_RULE_STATUSES[code].value,
+                    "is_and_rule": not rule.is_or_rule,
+                    "operator": "AND" if not rule.is_or_rule else "OR"
+                }
+                for rule, code in zip(kb.display_rules, rules_status)
+            ]
+        }
+
+    def answer_result(
+        self,
+        index: int,
+        initial_facts: InitialFacts,
+        answers: str,
+        compact: bool
+    ) -> Dict[str, Any]:
+        """InferenceEngine.answer_questionと同じ形式の結果（回答列answersを適用した後のノード）"""
+        question, _, _, hypotheses, is_complete, diagnosis_result, _ = self._nodes[index]
+        kb = self.knowledge_base
+        result = {
+            "next_question": self.question(index) if not compact or question is None else question,
+            "is_complete": bool(is_complete),
+            "derived_facts": [hypothesis if compact else kb.conditions[hypothesis] for hypothesis in hypotheses],
+            **self.display_fields(index, compact),
+            # 開始で1、以降は回答ごとに1つ増える
+            "sequence": len(answers) + 1
+        }
+        if is_complete:
+            result["diagnosis_result"] = {
+                **diagnosis_result,
+                "unknown_conditions": self._unknown_answered(initial_facts, answers)
+            }
+        return result
+
+    def _unknown_answered(self, initial_facts: InitialFacts, answers: str) -> List[str]:
+        """InferenceEngine._get_unknown_answered_conditionsと同じ「わからない」と回答された質問（所見の追加順）"""
+        findings: Dict[str, str] = {name: "" for name, _ in initial_facts}
+        index = self.find(initial_facts, "")
+        for code in answers:
+            findings[self.question(index)] = code
+            index = self._nodes[index][6][ANSWER_CODES.index(code)]
+        return [name for name, code in findings.items() if code == "u"]
+
+    def answered_questions(
+        self,
+        initial_facts: InitialFacts,
+        answers: str,
+        compact: bool
+    ) -> Optional[List[Dict[str, Any]]]:
+        """InferenceEngine.get_answered_questionsと同じ回答済みの質問（未コンパイルならNone）"""
+        kb = self.knowledge_base
+        answered = [
+            {
+                "condition": kb.condition_ids.get(name, name) if compact else name,
+                "answer": (FactStatus.TRUE if value else FactStatus.FALSE).value
+            }
+            for name, value in initial_facts
+        ]
+        index = self.find(initial_facts, "")
+        for code in answers:
+            if index is None or self._nodes[index][0] is None:
+                return None
+            answered.append({
+                "condition": self._nodes[index][0] if compact else self.question(index),
+                "answer": FactStatus.from_answer(_CODE_ANSWERS[code]).value
+            })
+            index = self._nodes[index][6][ANSWER_CODES.index(code)]
+            if index == _NO_NODE:
+                return None
+        return answered
+
+
+# 読み込んだDAGと、そのキー (ファイルのmtime_ns, size, 知識ベースのバージョン, 質問の順序)
+_loaded: Optional[Tuple[Tuple[int, int, str, str], Optional[QuestionDag]]] = None
+_lock = threading.Lock()
+
+
+def get_question_dag(knowledge_base: KnowledgeBase) -> Optional[QuestionDag]:
+    """公開中の知識ベース用のDAGを取得（ファイルがないか、バージョン・質問の順序が異なればNone）
+
+    ファイル・知識ベースのバージョン・質問の順序のいずれかが変われば読み込み直す。
+    """
+    global _loaded
+    try:
+        stat = os.stat(QUESTION_DAG_FILE)
+    except OSError:
+        return None
+    strategy = resolve_strategy()
+    key = (stat.st_mtime_ns, stat.st_size, knowledge_base.version, strategy)
+
+    with _lock:
+        if _loaded is None or _loaded[0] != key:
+            with open(QUESTION_DAG_FILE, "r", encoding="utf-8") as f:
+                artifact = json.load(f)
+            dag = None
+            # 質問の順序を記録していないDAGはrules_orderでコンパイルしたもの
+            if (
+                artifact.get("knowledge_base_version") == knowledge_base.version
+                and artifact.get("question_strategy", RULES_ORDER) == strategy
+            ):
+                dag = QuestionDag(knowledge_base, artifact)
+            _loaded = (key, dag)
+        return _loaded[1]
+
+
+def save_question_dag(artifact: Dict[str, Any], path: str = QUESTION_DAG_FILE):
+    """コンパイルしたDAGを保存"""
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(artifact, f, ensure_ascii=False, separators=(",", ":"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ルールを質問の決定DAGにコンパイルする")
+    parser.add_argument("--max-nodes", type=int, default=QUESTION_DAG_MAX_NODES)
+    parser.add_argument("--output", default=QUESTION_DAG_FILE)
+    parser.add_argument("--questionnaire", default=None)
+    args = parser.parse_args()
+
+    artifact = compile_question_dag(questionnaire_roots(args.questionnaire), args.max_nodes)
+    save_question_dag(artifact, args.output)
+    print(
+        f"{len(artifact['nodes'])} nodes, {len(artifact['roots'])} roots "
+        f"(knowledge base {artifact['knowledge_base_version']}) -> {args.output}"
+    )
+
+
+if __name__ == "__main__":
+    main()
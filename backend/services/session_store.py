@@ -0,0 +1,333 @@
+"""
+セッションストア - 診断セッション（推論エンジン）の保持と破棄
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional
+
+from core.constants import (
+    SESSION_IDLE_TTL_SECONDS,
+    SESSION_MAX_COUNT,
+    SESSION_MAX_BYTES,
+    SESSION_STORE_BACKEND,
+    SESSION_DB_FILE,
+)
+from engine import InferenceEngine
+
+
+# セッションサイズ見積もりの係数（tracemallocでの実測をもとにした概算）
+_ENGINE_BASE_BYTES = 1024
+_RULE_STATE_BYTES = 100
+_FACT_ENTRY_BYTES = 150
+_LOG_EVENT_BYTES = 72
+
+
+def estimate_engine_size(engine: InferenceEngine) -> int:
+    """推論エンジン1つが占めるメモリ量を概算（バイト）"""
+    wm = engine.working_memory
+    return (
+        _ENGINE_BASE_BYTES
+        + _RULE_STATE_BYTES * engine.rule_states.created_count()
+        + _FACT_ENTRY_BYTES * (len(wm.findings) + len(wm.hypotheses) + len(wm.answer_history))
+        + _LOG_EVENT_BYTES * len(engine.reasoning_log)
+    )
+
+
+def encode_engine(engine: InferenceEngine) -> str:
+    """エンジンの状態をプロセス外に保存できる文字列に変換"""
+    return json.dumps(engine.to_state(), ensure_ascii=False, separators=(",", ":"))
+
+
+def decode_engine(data: str) -> InferenceEngine:
+    """encode_engineで変換した文字列からエンジンを復元"""
+    return InferenceEngine.from_state(json.loads(data))
+
+
+class SessionStore(ABC):
+    """セッションストアの基底クラス
+
+    ルートはget()で取り出したエンジンを変更した後、必ずput()で戻す。
+    プロセス外のバックエンドはencode_engine/decode_engineでエンジンを直列化し、
+    get()のたびに新しいエンジンを返す（Redisなどもこのインターフェースで追加する）。
+    """
+
+    @abstractmethod
+    def get(self, session_id: str) -> Optional[InferenceEngine]:
+        """セッションを取得（存在しないか期限切れならNone）"""
+
+    @abstractmethod
+    def put(self, session_id: str, engine: InferenceEngine) -> None:
+        """セッションを保存（既存なら置き換え）"""
+
+    @abstractmethod
+    def delete(self, session_id: str) -> None:
+        """セッションを削除"""
+
+    @abstractmethod
+    def sweep(self) -> int:
+        """期限切れのセッションを破棄し、破棄した数を返す"""
+
+    @abstractmethod
+    def stats(self) -> Dict[str, int]:
+        """保持数と破棄の統計を取得"""
+
+
+@dataclass
+class _Entry:
+    engine: InferenceEngine
+    size: int
+    last_access: float
+
+
+class MemorySessionStore(SessionStore):
+    """プロセス内メモリのセッションストア
+
+    - idle_ttl: 最終アクセスからこの秒数が経過したセッションを破棄
+    - max_sessions / max_bytes: 超過した場合は最も長く使われていないセッションから破棄（LRU）
+    """
+
+    def __init__(
+        self,
+        idle_ttl: float = SESSION_IDLE_TTL_SECONDS,
+        max_sessions: int = SESSION_MAX_COUNT,
+        max_bytes: int = SESSION_MAX_BYTES,
+        clock=time.monotonic
+    ):
+        self.idle_ttl = idle_ttl
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self._clock = clock
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats: Dict[str, int] = {
+            "hits": 0,
+            "misses": 0,
+            "evicted_ttl": 0,
+            "evicted_count": 0,
+            "evicted_bytes": 0,
+        }
+
+    def get(self, session_id: str) -> Optional[InferenceEngine]:
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+
+            now = self._clock()
+            if now - entry.last_access > self.idle_ttl:
+                self._remove(session_id)
+                self._stats["evicted_ttl"] += 1
+                self._stats["misses"] += 1
+                return None
+
+            entry.last_access = now
+            self._entries.move_to_end(session_id)
+            self._stats["hits"] += 1
+            return entry.engine
+
+    def put(self, session_id: str, engine: InferenceEngine) -> None:
+        with self._lock:
+            self._remove(session_id)
+            entry = _Entry(engine=engine, size=estimate_engine_size(engine), last_access=self._clock())
+            self._entries[session_id] = entry
+            self._bytes += entry.size
+            self._evict_over_budget()
+
+    def delete(self, session_id: str) -> None:
+        with self._lock:
+            self._remove(session_id)
+
+    def sweep(self) -> int:
+        with self._lock:
+            deadline = self._clock() - self.idle_ttl
+            expired = []
+            # LRU順に並んでいるため、期限内のセッションに当たった時点で打ち切れる
+            for session_id, entry in self._entries.items():
+                if entry.last_access >= deadline:
+                    break
+                expired.append(session_id)
+            for session_id in expired:
+                self._remove(session_id)
+            self._stats["evicted_ttl"] += len(expired)
+            return len(expired)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "sessions": len(self._entries),
+                "bytes": self._bytes,
+                **self._stats
+            }
+
+    def _remove(self, session_id: str):
+        entry = self._entries.pop(session_id, None)
+        if entry is not None:
+            self._bytes -= entry.size
+
+    def _evict_over_budget(self):
+        """上限を超えている間、最も長く使われていないセッションから破棄（直前に保存したものは残す）"""
+        while len(self._entries) > 1:
+            if len(self._entries) > self.max_sessions:
+                reason = "evicted_count"
+            elif self._bytes > self.max_bytes:
+                reason = "evicted_bytes"
+            else:
+                break
+            session_id = next(iter(self._entries))
+            self._remove(session_id)
+            self._stats[reason] += 1
+
+
+class SQLiteSessionStore(SessionStore):
+    """SQLiteファイルのセッションストア
+
+    複数のuvicornワーカー（プロセス）から同じファイルを共有できる。
+    破棄の方針はMemorySessionStoreと同じで、最終アクセス時刻（time.time）の古い順に破棄する。
+    統計の保持数・サイズはファイル全体、ヒット数・破棄数はこのプロセスの分。
+    """
+
+    def __init__(
+        self,
+        path: str = SESSION_DB_FILE,
+        idle_ttl: float = SESSION_IDLE_TTL_SECONDS,
+        max_sessions: int = SESSION_MAX_COUNT,
+        max_bytes: int = SESSION_MAX_BYTES,
+        clock=time.time
+    ):
+        self.path = path
+        self.idle_ttl = idle_ttl
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._stats: Dict[str, int] = {
+            "hits": 0,
+            "misses": 0,
+            "evicted_ttl": 0,
+            "evicted_count": 0,
+            "evicted_bytes": 0,
+        }
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=10, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "session_id TEXT PRIMARY KEY, data TEXT NOT NULL, "
+            "size INTEGER NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS sessions_last_access ON sessions (last_access)")
+
+    def get(self, session_id: str) -> Optional[InferenceEngine]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data, last_access FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            if row is None:
+                self._stats["misses"] += 1
+                return None
+
+            data, last_access = row
+            now = self._clock()
+            if now - last_access > self.idle_ttl:
+                self._conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+                self._stats["evicted_ttl"] += 1
+                self._stats["misses"] += 1
+                return None
+
+            self._conn.execute(
+                "UPDATE sessions SET last_access = ? WHERE session_id = ?", (now, session_id)
+            )
+            self._stats["hits"] += 1
+        return decode_engine(data)
+
+    def put(self, session_id: str, engine: InferenceEngine) -> None:
+        data = encode_engine(engine)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sessions (session_id, data, size, last_access) VALUES (?, ?, ?, ?)",
+                (session_id, data, len(data.encode("utf-8")), self._clock())
+            )
+            self._evict_over_budget(session_id)
+
+    def delete(self, session_id: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+    def sweep(self) -> int:
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM sessions WHERE last_access < ?", (self._clock() - self.idle_ttl,)
+            )
+            self._stats["evicted_ttl"] += cursor.rowcount
+            return cursor.rowcount
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            count, total = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM sessions"
+            ).fetchone()
+            return {
+                "sessions": count,
+                "bytes": total,
+                **self._stats
+            }
+
+    def _evict_over_budget(self, keep: str):
+        """上限を超えている間、最終アクセスの古いセッションから破棄（keepは残す）"""
+        count, total = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM sessions"
+        ).fetchone()
+        if count <= self.max_sessions and total <= self.max_bytes:
+            return
+
+        rows = self._conn.execute(
+            "SELECT session_id, size FROM sessions WHERE session_id != ? ORDER BY last_access",
+            (keep,)
+        )
+        evicted = []
+        for session_id, size in rows:
+            if count > self.max_sessions:
+                reason = "evicted_count"
+            elif total > self.max_bytes:
+                reason = "evicted_bytes"
+            else:
+                break
+            evicted.append(session_id)
+            count -= 1
+            total -= size
+            self._stats[reason] += 1
+        self._conn.executemany(
+            "DELETE FROM sessions WHERE session_id = ?", [(session_id,) for session_id in evicted]
+        )
+
+
+# バックエンド名 → セッションストアの生成関数
+SESSION_STORE_BACKENDS: Dict[str, Callable[[], SessionStore]] = {
+    "memory": MemorySessionStore,
+    "sqlite": SQLiteSessionStore,
+}
+
+
+def create_session_store(backend: str) -> SessionStore:
+    """バックエンド名からセッションストアを生成"""
+    if backend not in SESSION_STORE_BACKENDS:
+        raise ValueError(f"未対応のセッションストアです: {backend}")
+    return SESSION_STORE_BACKENDS[backend]()
+
+
+# アプリケーション全体で共有するセッションストア
+# 複数ワーカーで動かす場合は環境変数 SESSION_STORE=sqlite を指定する
+session_store: SessionStore = create_session_store(
+    os.environ.get("SESSION_STORE", SESSION_STORE_BACKEND)
+)
@@ -0,0 +1,98 @@
+"""
+診断開始テンプレート - 初期事実ごとに評価済みの開始状態と応答を使い回す
+"""
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Tuple
+
+from core import FactStatus
+from core.constants import START_TEMPLATE_CACHE_SIZE
+from engine import InferenceEngine
+from knowledge import KnowledgeBase
+
+
+InitialFacts = Tuple[Tuple[str, bool], ...]
+
+
+def _dumps(content: Any) -> bytes:
+    """FastAPIのJSONResponseと同じ形式でJSONに変換"""
+    return json.dumps(
+        content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")
+    ).encode("utf-8")
+
+
+class StartTemplate:
+    """診断開始直後のエンジンの状態と、session_idを除いた応答本文"""
+
+    def __init__(self, initial_facts: InitialFacts):
+        engine = InferenceEngine()
+        for name, value in initial_facts:
+            engine.working_memory.put_finding(name, FactStatus.TRUE if value else FactStatus.FALSE)
+        first_question = engine.start_consultation()
+
+        self.knowledge_base_version = engine.knowledge_base.version
+        self.state: Dict[str, Any] = engine.to_state()
+        # 通常形式・簡易形式の応答本文の "{" 以降（session_idを先頭に差し込んで完成させる）
+        self._body_rests = {
+            compact: _dumps({
+                "current_question": engine.get_condition_ref(first_question, compact),
+                **engine.get_display_fields(compact),
+                "is_complete": first_question is None,
+                "knowledge_base_version": engine.knowledge_base.version,
+                "applied_initial_facts": [
+                    engine.get_condition_ref(name, compact) for name, _ in initial_facts
+                ],
+                "sequence": engine.sequence
+            })[1:]
+            for compact in (False, True)
+        }
+
+    def new_engine(self) -> InferenceEngine:
+        """テンプレートを複製してセッション用のエンジンを作成"""
+        return InferenceEngine.from_state(self.state)
+
+    def response_body(self, session_id: str, compact: bool = False) -> bytes:
+        """session_idを埋め込んだ応答本文（JSON）"""
+        return b'{"session_id":' + _dumps(session_id) + b"," + self._body_rests[compact]
+
+
+class StartTemplateCache:
+    """(知識ベースのバージョン, 初期事実) → 開始テンプレート のLRU
+
+    初期事実は問診票の回答の組み合わせで決まるため種類は有限で、ほとんどの開始はヒットする。
+    初期事実の順序は回答履歴の順序として残るため、順序も含めてキーにする。
+    """
+
+    def __init__(self, max_entries: int = START_TEMPLATE_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._templates: "OrderedDict[tuple, StartTemplate]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats: Dict[str, int] = {"hits": 0, "misses": 0}
+
+    def get(self, knowledge_base: KnowledgeBase, initial_facts: InitialFacts) -> StartTemplate:
+        """開始テンプレートを取得（なければ構築）"""
+        key = (knowledge_base.version, initial_facts)
+        with self._lock:
+            template = self._templates.get(key)
+            if template is not None:
+                self._templates.move_to_end(key)
+                self._stats["hits"] += 1
+                return template
+            self._stats["misses"] += 1
+
+        template = StartTemplate(initial_facts)
+        with self._lock:
+            self._templates[(template.knowledge_base_version, initial_facts)] = template
+            while len(self._templates) > self.max_entries:
+                self._templates.popitem(last=False)
+        return template
+
+    def stats(self) -> Dict[str, int]:
+        """保持数とヒット数を取得"""
+        with self._lock:
+            return {"templates": len(self._templates), **self._stats}
+
+
+# アプリケーション全体で共有する開始テンプレート
+start_templates = StartTemplateCache()
@@ -0,0 +1,169 @@
+"""
+ステートレス診断 - クライアントが保持する署名付きトークンからの再現
+"""
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+from core import FactStatus
+from core.constants import STATELESS_REPLAY_CACHE_SIZE
+from engine import InferenceEngine
+from knowledge import get_knowledge_base
+
+
+# 回答の1文字表現
+ANSWER_CODES = {"yes": "y", "no": "n", "unknown": "u"}
+CODE_ANSWERS = {code: answer for answer, code in ANSWER_CODES.items()}
+
+# トークンの署名鍵（複数ワーカー・再起動をまたぐ場合は環境変数 SESSION_TOKEN_SECRET で共有する）
+_SECRET = os.environ.get("SESSION_TOKEN_SECRET", "").encode("utf-8") or secrets.token_bytes(32)
+
+
+class InvalidTokenError(Exception):
+    """トークンが不正（改ざん・形式不正・再現不能）"""
+    pass
+
+
+class KnowledgeBaseMismatchError(Exception):
+    """トークン発行時と公開中の知識ベースのバージョンが異なる"""
+    pass
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def encode_token(version: str, initial_facts: Sequence[Tuple[str, bool]], answers: str) -> str:
+    """知識ベースのバージョン・問診票の初期事実・回答列を署名付きトークンにする"""
+    payload = json.dumps(
+        {"v": version, "f": [[name, int(value)] for name, value in initial_facts], "a": answers},
+        ensure_ascii=False,
+        separators=(",", ":")
+    ).encode("utf-8")
+    signature = hmac.new(_SECRET, payload, hashlib.sha256).digest()
+    return f"{_b64encode(payload)}.{_b64encode(signature)}"
+
+
+def decode_token(token: str) -> Tuple[str, Tuple[Tuple[str, bool], ...], str]:
+    """トークンを検証して (バージョン, 初期事実, 回答列) を取り出す
+
+    Raises:
+        InvalidTokenError: 署名が一致しない、または形式が不正な場合
+    """
+    try:
+        payload_part, signature_part = token.split(".")
+        payload = _b64decode(payload_part)
+        signature = _b64decode(signature_part)
+    except ValueError:
+        raise InvalidTokenError("トークンの形式が不正です")
+
+    expected = hmac.new(_SECRET, payload, hashlib.sha256).digest()
+    if not hmac.compare_digest(signature, expected):
+        raise InvalidTokenError("トークンの署名が一致しません")
+
+    try:
+        data = json.loads(payload.decode("utf-8"))
+        initial_facts = tuple((str(name), bool(value)) for name, value in data["f"])
+        answers = data["a"]
+        version = data["v"]
+    except (ValueError, KeyError, TypeError):
+        raise InvalidTokenError("トークンの内容が不正です")
+    if any(code not in CODE_ANSWERS for code in answers):
+        raise InvalidTokenError("トークンの回答が不正です")
+    return version, initial_facts, answers
+
+
+class ReplayCache:
+    """回答列の再現結果のキャッシュ
+
+    (知識ベースのバージョン, 初期事実, 回答列) → エンジンの直列化状態 をLRUで保持する。
+    再現時は最も長く一致する接頭辞の状態から残りの回答だけを適用するため、
+    同じ回答列を共有する診断（直前の回答までの状態など）は再計算しない。
+    """
+
+    def __init__(self, max_entries: int = STATELESS_REPLAY_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[tuple, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats: Dict[str, int] = {"hits": 0, "misses": 0, "replayed_answers": 0}
+
+    def replay(
+        self,
+        version: str,
+        initial_facts: Tuple[Tuple[str, bool], ...],
+        answers: str
+    ) -> InferenceEngine:
+        """回答列を公開中の知識ベースに適用したエンジンを返す
+
+        Raises:
+            KnowledgeBaseMismatchError: バージョンが公開中の知識ベースと異なる場合
+            InvalidTokenError: 回答列が質問の数より多い場合
+        """
+        current_version = get_knowledge_base().version
+        if version != current_version:
+            raise KnowledgeBaseMismatchError(current_version)
+
+        engine: Optional[InferenceEngine] = None
+        for length in range(len(answers), -1, -1):
+            state = self._lookup((version, initial_facts, answers[:length]))
+            if state is not None:
+                engine = InferenceEngine.from_state(state)
+                self._stats["hits"] += 1
+                break
+
+        if engine is None:
+            self._stats["misses"] += 1
+            engine = InferenceEngine()
+            for name, value in initial_facts:
+                engine.working_memory.put_finding(name, FactStatus.TRUE if value else FactStatus.FALSE)
+            engine.start_consultation()
+            length = 0
+            self.remember(engine, initial_facts, "")
+
+        for code in answers[length:]:
+            if not engine.current_question:
+                raise InvalidTokenError("回答の数が質問の数を超えています")
+            engine.answer_question(engine.current_question, CODE_ANSWERS[code])
+            self._stats["replayed_answers"] += 1
+        return engine
+
+    def remember(
+        self,
+        engine: InferenceEngine,
+        initial_facts: Tuple[Tuple[str, bool], ...],
+        answers: str
+    ):
+        """エンジンの現在の状態を回答列の再現結果として保存"""
+        key = (engine.knowledge_base.version, initial_facts, answers)
+        state = engine.to_state()
+        with self._lock:
+            self._entries[key] = state
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, int]:
+        """保持数とヒット数を取得"""
+        with self._lock:
+            return {"entries": len(self._entries), **self._stats}
+
+    def _lookup(self, key: tuple) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            state = self._entries.get(key)
+            if state is not None:
+                self._entries.move_to_end(key)
+            return state
+
+
+# アプリケーション全体で共有する再現キャッシュ
+replay_cache = ReplayCache()
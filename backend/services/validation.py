@@ -1,77 +1,296 @@
 """
 ルールの整合性チェック機能
 """
-from collections import Counter
-from typing import List
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
 
-from knowledge import RULES, get_all_rules
+from core import Rule
+from knowledge import KnowledgeBase, get_knowledge_base
+
+
+@dataclass(frozen=True)
+class ValidationState:
+    """知識ベース1バージョン分のチェック結果
+
+    問題のリストに加えて、1ルールの編集後に影響範囲だけを再チェックするための
+    中間結果（ゴールから到達可能なaction、他から参照されないaction、循環）を保持する。
+    """
+    knowledge_base: KnowledgeBase
+    reachable: FrozenSet[str]
+    unreferenced: FrozenSet[str]
+    cycles: Tuple[dict, ...]
+
+    @property
+    def issues(self) -> List[dict]:
+        """問題のリスト（到達不能・循環・孤立・action重複の順）"""
+        kb = self.knowledge_base
+        unreachable = []
+        orphans = []
+        for rule in kb.rules:
+            if _is_orphan(self, rule):
+                orphans.append({
+                    "type": "orphan",
+                    "action": rule.action,
+                    "message": f"THEN「{rule.action}」はどこからも参照されていません"
+                })
+            elif rule.action not in self.reachable:
+                unreachable.append({
+                    "type": "unreachable",
+                    "action": rule.action,
+                    "message": f"THEN「{rule.action}」はどのゴールルールからも到達できません"
+                })
+
+        duplicates = [
+            {
+                "type": "duplicate_action",
+                "action": action,
+                "count": len(rules),
+                "message": f"THEN「{action}」が{len(rules)}回使用されています"
+            }
+            for action, rules in kb.rules_by_action.items()
+            if len(rules) > 1
+        ]
+
+        # 循環はrules.json順で最初に現れるactionの順に並べる
+        position = {action: idx for idx, action in enumerate(kb.rules_by_action)}
+        cycles = sorted(self.cycles, key=lambda c: position[c["actions"][0]])
+
+        return unreachable + cycles + orphans + duplicates
+
+
+# 知識ベースのバージョンごとのチェック結果（最新バージョンの分だけ保持）
+_state_cache: Dict[str, ValidationState] = {}
 
 
 def find_rule_by_action(action: str):
     """actionでルールを検索"""
-    return next((r for r in RULES if r.action == action), None)
+    return next(iter(get_knowledge_base().get_deriving_rules(action)), None)
 
 
 def check_rules_integrity() -> List[dict]:
-    """ルールの整合性をチェックし、問題のリストを返す"""
-    rules = get_all_rules()
+    """ルールの整合性をチェックし、問題のリストを返す
 
-    issues = []
-    all_actions = {r.action for r in RULES}
+    結果は知識ベースのバージョンごとにキャッシュし、
+    ルールが変わらない限り再チェックしない。
+    """
+    return get_validation_state().issues
 
-    # 到達不能なルールをチェック
-    for rule in rules:
-        for cond in rule.conditions:
-            if cond in all_actions and not any(r.action == cond for r in RULES):
-                issues.append({
-                    "type": "unreachable",
-                    "action": rule.action,
-                    "message": f"条件「{cond}」を導出するルールがありません"
-                })
 
-    # 循環参照をチェック
-    def check_cycle(action: str, visited: set, path: list):
-        if action in visited:
-            return path + [action]
-        visited.add(action)
-        path.append(action)
-        rule = find_rule_by_action(action)
-        if rule:
-            for cond in rule.conditions:
-                if cond in all_actions:
-                    cycle = check_cycle(cond, visited.copy(), path.copy())
-                    if cycle:
-                        return cycle
-        return None
-
-    for rule in rules:
-        cycle = check_cycle(rule.action, set(), [])
-        if cycle and len(cycle) > 1:
+def get_validation_state(knowledge_base: Optional[KnowledgeBase] = None) -> ValidationState:
+    """知識ベース（省略時は公開中のもの）のチェック結果を取得"""
+    knowledge_base = knowledge_base or get_knowledge_base()
+    state = _state_cache.get(knowledge_base.version)
+    if state is None:
+        state = validate_knowledge_base(knowledge_base)
+        _remember(state)
+    return state
+
+
+def validate_knowledge_base(knowledge_base: KnowledgeBase) -> ValidationState:
+    """導出グラフ（action → 条件に含まれるaction）を一度ずつ走査して全体をチェック
+
+    計算量はルール数と条件数の和に比例する。
+    """
+    actions = list(knowledge_base.rules_by_action)
+    return ValidationState(
+        knowledge_base=knowledge_base,
+        reachable=frozenset(_find_reachable(knowledge_base, actions, _goal_actions(knowledge_base))),
+        unreferenced=frozenset(a for a in actions if _is_unreferenced(knowledge_base, a)),
+        cycles=tuple(_find_cycles(knowledge_base, actions))
+    )
+
+
+def validate_rule_edit(
+    previous: ValidationState,
+    old_rule: Optional[Rule],
+    new_rule: Optional[Rule],
+    knowledge_base: Optional[KnowledgeBase] = None
+) -> ValidationState:
+    """1ルールの作成・更新・削除後の知識ベースを、影響範囲だけ再チェック
+
+    old_ruleは編集前のルール（作成時はNone）、new_ruleは編集後のルール（削除時はNone）。
+    previousはpreviousの知識ベースにこの編集だけを加えたものが
+    knowledge_base（省略時は公開中のもの）であることを前提とする。
+
+    導出辺が変わるのは編集したルールのactionだけなので、
+    循環・到達可能性が変わりうるのはそのactionと旧条件から辿れる部分グラフに限られる。
+    """
+    knowledge_base = knowledge_base or get_knowledge_base()
+    cached = _state_cache.get(knowledge_base.version)
+    if cached is not None:
+        return cached
+
+    edited = [r for r in (old_rule, new_rule) if r is not None]
+    derived = knowledge_base.derived_conditions
+
+    # 編集したaction・旧条件から辿れる部分グラフ（後続について閉じている）
+    roots = {r.action for r in edited}
+    if old_rule is not None:
+        roots.update(old_rule.conditions)
+    affected = _find_reachable(knowledge_base, [a for a in roots if a in derived])
+
+    # 影響範囲の外から到達可能な前任がいるか、ゴールであるactionを起点に到達可能性を再計算
+    goal_actions = _goal_actions(knowledge_base)
+    seeds = [
+        action for action in affected
+        if action in goal_actions or any(
+            r.action not in affected and r.action in previous.reachable
+            for r in knowledge_base.get_dependent_rules(action)
+        )
+    ]
+    reachable = (previous.reachable - affected) | _find_reachable(knowledge_base, seeds)
+    reachable &= derived
+
+    # 参照元が変わりうるのは編集したルールのactionと条件だけ
+    touched = {r.action for r in edited} | {c for r in edited for c in r.conditions}
+    unreferenced = set(previous.unreferenced) - touched
+    unreferenced.update(a for a in touched if a in derived and _is_unreferenced(knowledge_base, a))
+    unreferenced &= derived
+
+    # 削除されたactionを通る循環も取り除く
+    cycles = [c for c in previous.cycles if not (affected | roots).intersection(c["actions"])]
+    cycles.extend(_find_cycles(knowledge_base, affected))
+
+    state = ValidationState(
+        knowledge_base=knowledge_base,
+        reachable=frozenset(reachable),
+        unreferenced=frozenset(unreferenced),
+        cycles=tuple(cycles)
+    )
+    _remember(state)
+    return state
+
+
+def _remember(state: ValidationState):
+    """チェック結果をキャッシュ（最新バージョンの分だけ保持）"""
+    _state_cache.clear()
+    _state_cache[state.knowledge_base.version] = state
+
+
+def _goal_actions(knowledge_base: KnowledgeBase) -> Set[str]:
+    """ゴールルールのactionを取得"""
+    return {goal.action for goal in knowledge_base.goal_rules}
+
+
+def _derived_successors(knowledge_base: KnowledgeBase, action: str) -> List[str]:
+    """actionを導出するルールの条件のうち、導出条件であるものを取得"""
+    return [
+        cond
+        for rule in knowledge_base.get_deriving_rules(action)
+        for cond in rule.conditions
+        if cond in knowledge_base.derived_conditions
+    ]
+
+
+def _find_reachable(
+    knowledge_base: KnowledgeBase,
+    roots: Iterable[str],
+    seeds: Optional[Iterable[str]] = None
+) -> Set[str]:
+    """起点から導出辺を辿って到達できるactionを取得
+
+    seedsを指定した場合はrootsのうちseedsに含まれるものだけを起点にする。
+    """
+    if seeds is not None:
+        seeds = set(seeds)
+        roots = [a for a in roots if a in seeds]
+    reachable = set()
+    stack = list(roots)
+    while stack:
+        action = stack.pop()
+        if action in reachable:
+            continue
+        reachable.add(action)
+        stack.extend(_derived_successors(knowledge_base, action))
+    return reachable
+
+
+def _is_unreferenced(knowledge_base: KnowledgeBase, action: str) -> bool:
+    """actionが他のactionのルールから参照されていないか"""
+    return all(r.action == action for r in knowledge_base.get_dependent_rules(action))
+
+
+def _is_orphan(state: ValidationState, rule: Rule) -> bool:
+    """孤立ルールか（THENが他で使われていない + ゴールでもない）"""
+    return not rule.is_goal_action and rule.action in state.unreferenced
+
+
+def _find_cycles(knowledge_base: KnowledgeBase, roots: Iterable[str]) -> List[dict]:
+    """強連結成分（Tarjan法・非再帰）で循環参照を検出し、成分ごとに1件報告"""
+    index_of: Dict[str, int] = {}
+    lowlink: Dict[str, int] = {}
+    on_stack = set()
+    stack: List[str] = []
+    components: List[List[str]] = []
+
+    for root in roots:
+        if root in index_of:
+            continue
+        index_of[root] = lowlink[root] = len(index_of)
+        stack.append(root)
+        on_stack.add(root)
+        work = [(root, iter(_derived_successors(knowledge_base, root)))]
+
+        while work:
+            node, successors = work[-1]
+            advanced = False
+            for succ in successors:
+                if succ not in index_of:
+                    index_of[succ] = lowlink[succ] = len(index_of)
+                    stack.append(succ)
+                    on_stack.add(succ)
+                    work.append((succ, iter(_derived_successors(knowledge_base, succ))))
+                    advanced = True
+                    break
+                if succ in on_stack:
+                    lowlink[node] = min(lowlink[node], index_of[succ])
+            if advanced:
+                continue
+
+            work.pop()
+            if work:
+                parent = work[-1][0]
+                lowlink[parent] = min(lowlink[parent], lowlink[node])
+            if lowlink[node] == index_of[node]:
+                component = []
+                while True:
+                    member = stack.pop()
+                    on_stack.discard(member)
+                    component.append(member)
+                    if member == node:
+                        break
+                components.append(component)
+
+    issues = []
+    for component in components:
+        cycle = _find_cycle_path(knowledge_base, set(component))
+        if cycle:
             issues.append({
                 "type": "cycle",
                 "actions": cycle,
                 "message": f"ルールに循環参照があります: {' -> '.join(cycle)}"
             })
+    return issues
 
-    # 孤立ルールをチェック（THENが他で使われていない + ゴールでもない）
-    for rule in rules:
-        if not rule.is_goal_action:
-            if not any(rule.action in r.conditions for r in RULES if r.action != rule.action):
-                issues.append({
-                    "type": "orphan",
-                    "action": rule.action,
-                    "message": f"THEN「{rule.action}」はどこからも参照されていません"
-                })
-
-    # actionの一意性をチェック
-    action_counts = Counter(r.action for r in RULES)
-    for action, count in action_counts.items():
-        if count > 1:
-            issues.append({
-                "type": "duplicate_action",
-                "action": action,
-                "count": count,
-                "message": f"THEN「{action}」が{count}回使用されています"
-            })
 
-    return issues
+def _find_cycle_path(knowledge_base: KnowledgeBase, component: set) -> Optional[List[str]]:
+    """強連結成分内で、rules.json順で最初のactionから戻ってくる最短の循環を取得"""
+    start = next(r.action for r in knowledge_base.rules if r.action in component)
+    parent: Dict[str, str] = {}
+    frontier = [start]
+    while frontier:
+        next_frontier = []
+        for node in frontier:
+            for succ in _derived_successors(knowledge_base, node):
+                if succ not in component:
+                    continue
+                if succ == start:
+                    path = [node]
+                    while path[-1] != start:
+                        path.append(parent[path[-1]])
+                    return list(reversed(path)) + [start]
+                if succ not in parent:
+                    parent[succ] = node
+                    next_frontier.append(succ)
+        frontier = next_frontier
+    return None
@@ -0,0 +1,53 @@
+"""
+仮定分析 - 回答を1つ変えた場合に該当するビザを調べる
+"""
+from typing import Any, Dict, List, Optional
+
+from core import FactStatus, RuleStatus
+from engine import InferenceEngine
+
+
+def find_answer_changes(engine: InferenceEngine, visa: Optional[str] = None) -> List[Dict[str, Any]]:
+    """回答を1つだけ変えると新たに該当するビザを、変える回答ごとに返す
+
+    回答履歴を先頭から辿りながら、各回答の直前の状態を分岐させて別の回答と
+    それ以降の回答を伝播する。分岐はコピーオンライトのため、回答ごとに
+    履歴全体を再現し直す必要はない。問診票の初期事実は対象にしない。
+    visaを指定した場合はそのビザが該当するようになる変更だけを返す。
+    """
+    history = list(engine.working_memory.answer_history)
+    goals = [
+        goal for goal in engine.knowledge_base.goal_rules
+        if engine.rule_states.status(goal.id) != RuleStatus.FIRED
+        and (visa is None or goal.action == visa)
+    ]
+    if not goals:
+        return []
+
+    # 回答履歴の先頭（診断開始時点）まで戻したエンジンで、回答を1つずつ適用し直しながら分岐する
+    walker = InferenceEngine.from_state(engine.to_state())
+    walker.go_back(len(history) - (walker.initial_length or 0))
+    start = len(walker.working_memory.answer_history)
+
+    changes = []
+    for index in range(start, len(history)):
+        condition, status = history[index]
+        for alternative in (FactStatus.TRUE, FactStatus.FALSE, FactStatus.UNKNOWN):
+            if alternative == status:
+                continue
+            child = walker.fork()
+            child.assume([(condition, alternative)] + history[index + 1:])
+            visas = [
+                goal.action for goal in goals
+                if child.rule_states.status(goal.id) == RuleStatus.FIRED
+            ]
+            if visas:
+                changes.append({
+                    "condition": condition,
+                    "answer": InferenceEngine.STATUS_ANSWERS[alternative],
+                    "previous_answer": InferenceEngine.STATUS_ANSWERS[status],
+                    "visas": visas
+                })
+        walker.answer_question(condition, InferenceEngine.STATUS_ANSWERS[status])
+
+    return changes
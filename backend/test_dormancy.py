@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""休眠ルールのテスト
+
+休眠ルール（結論の確定したゴールだけを支え、ステータスも確定したルール）を評価しなくても、
+質問・ルールステータス・導出された事実が休眠させない場合と一致することを確認する。
+サーバーは不要（推論エンジンを直接使う）。
+
+使い方:
+  python test_dormancy.py [ランダムなルールの組の数]
+"""
+import random
+import sys
+from contextlib import contextmanager
+
+import knowledge.store as store
+from core import Rule
+from engine import InferenceEngine
+from engine.dormancy import DormantRules
+from knowledge import KnowledgeBase
+
+ANSWERS = ["yes", "no", "unknown"]
+ANSWER_WEIGHTS = [3, 3, 4]
+
+
+@contextmanager
+def knowledge_base_of(rules):
+    """rulesの知識ベースを公開中のものとして推論エンジンを作る"""
+    saved = store._knowledge_base
+    store._knowledge_base = KnowledgeBase(rules)
+    try:
+        yield store._knowledge_base
+    finally:
+        store._knowledge_base = saved
+
+
+@contextmanager
+def without_dormancy():
+    """休眠ルールを作らない（比較の基準）"""
+    update = DormantRules.update
+    DormantRules.update = lambda self: []
+    try:
+        yield
+    finally:
+        DormantRules.update = update
+
+
+def snapshot(engine):
+    state = engine.get_current_state()
+    return (
+        state["current_question"],
+        state["is_complete"],
+        state["derived_facts"],
+        [(r["id"], r["status"], [c["status"] for c in r["conditions"]]) for r in state["rules_status"]],
+        state.get("diagnosis_result")
+    )
+
+
+def run(answers_by_question, seed, dormancy=True):
+    """質問ごとの回答（なければseedの乱数）で完了まで回答し、各時点の状態を返す"""
+    rng = random.Random(seed)
+    engine = InferenceEngine(use_transposition=False)
+    question = engine.start_consultation()
+    trace = [snapshot(engine)]
+    while question:
+        answer = answers_by_question.get(question) or rng.choices(ANSWERS, ANSWER_WEIGHTS)[0]
+        result = engine.answer_question(question, answer)
+        trace.append(snapshot(engine))
+        if result["is_complete"]:
+            break
+        question = result["next_question"]
+    return trace, engine
+
+
+def test_dormant_rule_condition_answered_for_another_goal():
+    """G1=AND(x,S), S=AND(a,b), G2=AND(a,y): x=no の後の a=no でSがブロックされ、Sが導出される"""
+    rules = [
+        Rule(["x", "S"], "G1", is_goal_action=True),
+        Rule(["a", "b"], "S"),
+        Rule(["a", "y"], "G2", is_goal_action=True),
+    ]
+    with knowledge_base_of(rules):
+        trace, engine = run({"x": "no", "a": "no"}, 0)
+        with without_dormancy():
+            expected, _ = run({"x": "no", "a": "no"}, 0)
+
+    assert trace == expected
+    statuses = {rule_id: status for rule_id, status, _ in trace[-1][3]}
+    assert statuses == {"G1": "blocked", "S": "blocked", "G2": "blocked"}
+    assert "S" in trace[-1][2]
+    assert "S" in engine.dormant_rules
+
+
+def random_rules(rng):
+    """基本条件・導出条件・ゴールからなる非循環のルールの組"""
+    conditions = [f"b{i}" for i in range(rng.randint(4, 8))]
+    rules = []
+    for i in range(rng.randint(2, 7)):
+        action = f"d{i}"
+        for _ in range(rng.choice([1, 1, 2])):
+            rules.append(Rule(rng.sample(conditions, rng.randint(1, 3)), action, is_or_rule=rng.random() < 0.3))
+        conditions.append(action)
+    for i in range(rng.randint(2, 4)):
+        rules.append(Rule(
+            rng.sample(conditions, rng.randint(1, 3)), f"g{i}",
+            is_or_rule=rng.random() < 0.3, is_goal_action=True
+        ))
+    return rules
+
+
+def test_random_rule_sets(count=300):
+    """ランダムなルールの組で、休眠させない場合と状態が一致する"""
+    mismatches = 0
+    dormant = 0
+    for seed in range(count):
+        rng = random.Random(seed)
+        with knowledge_base_of(random_rules(rng)):
+            trace, engine = run({}, seed)
+            with without_dormancy():
+                expected, _ = run({}, seed)
+        dormant += len(engine.dormant_rules)
+        if trace != expected:
+            mismatches += 1
+            print(f"[NG] seed={seed}")
+    print(f"ランダムなルールの組: {count} / 不一致: {mismatches} / 休眠ルール: {dormant}")
+    assert mismatches == 0
+
+
+if __name__ == "__main__":
+    test_dormant_rule_condition_answered_for_another_goal()
+    print("[OK] 別のゴールのために回答された条件で休眠ルールが更新される")
+    test_random_rule_sets(int(sys.argv[1]) if len(sys.argv) > 1 else 300)
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""戻る（go_back）のテスト
+
+チェックポイントから戻した推論エンジンの状態が、戻った後の回答列を最初から
+処理し直した推論エンジンの状態と一致することを確認する。
+問診票の初期事実・状態の復元・置換表の有無も組み合わせる。
+サーバーは不要（推論エンジンを直接使う）。
+
+使い方:
+  python test_go_back.py [回答列の数]
+"""
+import json
+import random
+import sys
+
+from core import FactStatus
+from engine import InferenceEngine
+from services.question_dag import questionnaire_roots
+
+MAX_STEPS = 40
+
+
+def replay(initial_facts, answers, use_transposition):
+    """初期事実と回答列を最初から処理した推論エンジン"""
+    engine = InferenceEngine(use_transposition=use_transposition)
+    for name, value in initial_facts:
+        engine.working_memory.put_finding(name, FactStatus.TRUE if value else FactStatus.FALSE)
+    engine.start_consultation()
+    for answer in answers:
+        engine.answer_question(engine.current_question, answer)
+    return engine
+
+
+def snapshot(engine):
+    state = engine.get_current_state()
+    return (
+        state["current_question"],
+        state["is_complete"],
+        sorted(state["derived_facts"]),
+        [(r["id"], r["status"], [c["status"] for c in r["conditions"]]) for r in state["rules_status"]],
+        state.get("diagnosis_result"),
+        list(engine.working_memory.answer_history),
+        sorted(engine.working_memory.hypotheses.items())
+    )
+
+
+def test_go_back_matches_replay(count=600):
+    """戻った後の状態が、回答列を処理し直した状態と一致する"""
+    roots = questionnaire_roots()
+    backs = 0
+    mismatches = 0
+    for seed in range(count):
+        rng = random.Random(seed)
+        initial_facts = rng.choice(roots)
+        use_transposition = rng.random() < 0.5
+        engine = replay(initial_facts, [], use_transposition)
+        answers = []
+        for _ in range(MAX_STEPS):
+            if rng.random() < 0.1:
+                engine = InferenceEngine.from_state(json.loads(json.dumps(engine.to_state())))
+            if answers and rng.random() < 0.25:
+                steps = rng.randint(1, min(6, len(answers)))
+                engine.go_back(steps)
+                del answers[-steps:]
+                backs += 1
+                if snapshot(engine) != snapshot(replay(initial_facts, answers, use_transposition)):
+                    mismatches += 1
+                    print(f"[NG] seed={seed} answers={answers}")
+                continue
+            if not engine.current_question or engine._is_diagnosis_complete():
+                break
+            answer = rng.choice(["yes", "no", "unknown"])
+            answers.append(answer)
+            engine.answer_question(engine.current_question, answer)
+    print(f"戻る: {backs} 回 / 不一致: {mismatches}")
+    assert mismatches == 0
+
+
+if __name__ == "__main__":
+    test_go_back_matches_replay(int(sys.argv[1]) if len(sys.argv) > 1 else 600)
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""質問の決定DAGのテスト
+
+DAGが返す応答が、同じ初期事実と回答列を推論エンジンで処理し直した応答と一致することを確認する。
+回答の順序だけが異なる経路はDAGのノードを共有するため、診断結果の「わからない」と回答された
+質問の並び（回答順）も経路ごとに一致させる。
+サーバーは不要（推論エンジンを直接使う）。
+
+使い方:
+  python test_question_dag.py [ランダムなルールの組の数]
+"""
+import itertools
+import random
+import sys
+from contextlib import contextmanager
+
+import knowledge.store as store
+from core import FactStatus, Rule
+from engine import InferenceEngine
+from knowledge import KnowledgeBase
+from services.question_dag import ANSWER_CODES, QuestionDag, compile_question_dag
+
+CODE_ANSWERS = {"y": "yes", "n": "no", "u": "unknown"}
+RESULT_KEYS = ("next_question", "is_complete", "derived_facts", "rules_status", "diagnosis_result")
+
+
+@contextmanager
+def knowledge_base_of(rules):
+    """rulesの知識ベースを公開中のものとして推論エンジンを作る"""
+    saved = store._knowledge_base
+    store._knowledge_base = KnowledgeBase(rules)
+    try:
+        yield store._knowledge_base
+    finally:
+        store._knowledge_base = saved
+
+
+def replay(initial_facts, answers):
+    """初期事実と回答列を推論エンジンで処理し、最後の回答の結果を返す"""
+    engine = InferenceEngine(use_transposition=False)
+    for name, value in initial_facts:
+        engine.working_memory.put_finding(name, FactStatus.TRUE if value else FactStatus.FALSE)
+    engine.start_consultation()
+    result = None
+    for code in answers:
+        result = engine.answer_question(engine.current_question, CODE_ANSWERS[code])
+    return result
+
+
+def completed_paths(dag, initial_facts, limit):
+    """DAGを辿って診断完了に至る回答列を列挙"""
+    paths = []
+    stack = [""]
+    while stack and len(paths) < limit:
+        answers = stack.pop()
+        index = dag.find(initial_facts, answers)
+        if index is None:
+            continue
+        if dag.is_complete(index):
+            if answers:
+                paths.append(answers)
+            continue
+        stack.extend(answers + code for code in ANSWER_CODES)
+    return paths
+
+
+def compare(dag, roots, limit=200):
+    """DAGの応答と推論エンジンの応答が異なる経路の数と、比べた経路の数を返す"""
+    mismatches = 0
+    compared = 0
+    for initial_facts in roots:
+        for answers in completed_paths(dag, initial_facts, limit):
+            served = dag.answer_result(dag.find(initial_facts, answers), initial_facts, answers, False)
+            expected = replay(initial_facts, answers)
+            compared += 1
+            if any(served[key] != expected.get(key) for key in RESULT_KEYS):
+                mismatches += 1
+                print(f"[NG] initial_facts={initial_facts} answers={answers}")
+    return mismatches, compared
+
+
+def test_unknown_conditions_in_answer_order():
+    """初期事実によって「わからない」の回答順が異なる経路が同じノードに至っても、回答順で返す"""
+    rules = [
+        Rule(["q", "y", "p"], "G0", is_goal_action=True),
+        Rule(["x", "y"], "G1", is_goal_action=True),
+        Rule(["q", "w"], "G2", is_goal_action=True),
+    ]
+    roots = [(("p", False),), (("q", True),)]
+    with knowledge_base_of(rules) as knowledge_base:
+        dag = QuestionDag(knowledge_base, compile_question_dag(roots))
+        # p=いいえ から: q, x, y, w の順 / q=はい から: y, p, x, w の順
+        first = dag.find(roots[0], "yuun")
+        second = dag.find(roots[1], "unun")
+        assert first == second
+        assert dag.answer_result(first, roots[0], "yuun", False)["diagnosis_result"]["unknown_conditions"] == ["x", "y"]
+        assert dag.answer_result(second, roots[1], "unun", False)["diagnosis_result"]["unknown_conditions"] == ["y", "x"]
+        assert compare(dag, roots)[0] == 0
+
+
+def random_rules(rng):
+    """基本条件・導出条件・ゴールからなる非循環のルールの組"""
+    conditions = [f"b{i}" for i in range(rng.randint(4, 7))]
+    rules = []
+    for i in range(rng.randint(1, 4)):
+        rules.append(Rule(rng.sample(conditions, rng.randint(1, 3)), f"d{i}", is_or_rule=rng.random() < 0.3))
+        conditions.append(f"d{i}")
+    for i in range(rng.randint(2, 4)):
+        rules.append(Rule(
+            rng.sample(conditions, rng.randint(1, 3)), f"g{i}",
+            is_or_rule=rng.random() < 0.3, is_goal_action=True
+        ))
+    return rules
+
+
+def test_random_rule_sets(count=50):
+    """ランダムなルールと初期事実の組（事実の順序を入れ替えたものを含む）で、DAGの応答が推論エンジンと一致する"""
+    mismatches = 0
+    compared = 0
+    for seed in range(count):
+        rng = random.Random(seed)
+        rules = random_rules(rng)
+        base = sorted({c for rule in rules for c in rule.conditions} - {rule.action for rule in rules})
+        facts = [(name, rng.random() < 0.5) for name in rng.sample(base, 2)]
+        roots = [()] + [(fact,) for fact in facts] + list(itertools.permutations(facts))
+        with knowledge_base_of(rules) as knowledge_base:
+            dag = QuestionDag(knowledge_base, compile_question_dag(roots))
+            result = compare(dag, roots)
+        mismatches += result[0]
+        compared += result[1]
+    print(f"ランダムなルールの組: {count} / 経路: {compared} / 不一致: {mismatches}")
+    assert mismatches == 0
+
+
+if __name__ == "__main__":
+    test_unknown_conditions_in_answer_order()
+    print("[OK] 「わからない」と回答された質問を経路の回答順で返す")
+    test_random_rule_sets(int(sys.argv[1]) if len(sys.argv) > 1 else 50)
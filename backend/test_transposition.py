@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""置換表のテスト
+
+同じ回答列（戻る・状態の復元を含む）を置換表を使う推論エンジンと使わない推論エンジンで処理し、
+応答と状態が一致することを確認する。置換表にヒットするよう、回答列は2回ずつ処理する。
+サーバーは不要（推論エンジンを直接使う）。
+
+使い方:
+  python test_transposition.py [回答列の数]
+"""
+import json
+import random
+import sys
+
+from core import FactStatus
+from engine import InferenceEngine, transposition_cache
+
+MAX_STEPS = 40
+
+
+def run(seed, use_transposition, incremental):
+    """seedの乱数で回答・戻る・状態の復元を行い、各時点の応答と状態を返す"""
+    rng = random.Random(seed)
+    engine = InferenceEngine(incremental=incremental, use_transposition=use_transposition)
+    if seed % 3 == 0:
+        engine.working_memory.put_finding("申請者と会社の国籍が同じです", FactStatus.TRUE)
+    question = engine.start_consultation()
+    trace = [(question, engine.get_current_state())]
+    for _ in range(MAX_STEPS):
+        if not question:
+            break
+        if rng.random() < 0.12 and engine.working_memory.answer_history:
+            trace.append(engine.go_back(rng.randint(1, 3)))
+            question = engine.current_question
+            if rng.random() < 0.3:
+                engine = InferenceEngine.from_state(json.loads(json.dumps(engine.to_state())))
+            trace.append(engine.get_current_state())
+            continue
+        result = engine.answer_question(question, rng.choice(["yes", "no", "unknown"]))
+        # 評価したルール数は置換表にヒットすると0になる
+        result.pop("rule_visits")
+        trace.append(result)
+        question = result["next_question"]
+    trace.append(engine.get_current_state())
+    return trace
+
+
+def test_transposition_matches_engine(count=150):
+    """置換表を使っても応答・状態が変わらない"""
+    mismatches = 0
+    for incremental in (True, False):
+        transposition_cache.clear()
+        for seed in list(range(count)) * 2:
+            if run(seed, True, incremental) != run(seed, False, incremental):
+                mismatches += 1
+                print(f"[NG] seed={seed} incremental={incremental}")
+        stats = transposition_cache.stats()
+        print(f"差分伝播={incremental}: {count * 2} 回答列 / 不一致: {mismatches} / ヒット率: {stats['hit_rate']:.2f}")
+        assert stats["hits"] > 0
+    assert mismatches == 0
+
+
+if __name__ == "__main__":
+    test_transposition_matches_engine(int(sys.argv[1]) if len(sys.argv) > 1 else 150)
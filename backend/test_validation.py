@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""ルールの差分チェックのテスト
+
+公開中のルールにランダムな作成・更新・削除を重ね、1ルールの編集ごとに
+差分チェック（validate_rule_edit）の結果が全体チェック（validate_knowledge_base）と一致することを確認する。
+サーバーは不要（知識ベースを直接使う）。
+
+使い方:
+  python test_validation.py [編集の連鎖の数]
+"""
+import random
+import sys
+
+import services.validation as validation
+from core import Rule
+from knowledge import KnowledgeBase, get_all_rules
+from services.validation import validate_knowledge_base, validate_rule_edit
+
+EDITS_PER_CHAIN = 15
+
+
+def copy_rule(rule):
+    return Rule(
+        conditions=list(rule.conditions),
+        action=rule.action,
+        is_or_rule=rule.is_or_rule,
+        is_goal_action=rule.is_goal_action
+    )
+
+
+def random_edit(rng, rules, conditions):
+    """rulesに1ルールの編集を加え、(編集前のルール, 編集後のルール) を返す"""
+    kind = rng.random()
+    if kind < 0.3 or not rules:
+        new_rule = Rule(
+            conditions=rng.sample(conditions, rng.randint(1, 3)),
+            action=rng.choice(conditions),
+            is_goal_action=rng.random() < 0.1
+        )
+        rules.insert(rng.randint(0, len(rules)), new_rule)
+        return None, new_rule
+    index = rng.randrange(len(rules))
+    if kind < 0.55:
+        return rules.pop(index), None
+
+    old_rule = rules[index]
+    new_rule = copy_rule(old_rule)
+    change = rng.random()
+    if change < 0.3:
+        new_rule.conditions = rng.sample(conditions, rng.randint(1, 3))
+    elif change < 0.6:
+        # 循環・到達不能・action重複を作りうる
+        new_rule.action = rng.choice(conditions)
+    elif change < 0.8:
+        new_rule.is_goal_action = not new_rule.is_goal_action
+    else:
+        new_rule.conditions.append(rng.choice(conditions))
+    rules[index] = new_rule
+    return old_rule, new_rule
+
+
+def test_incremental_matches_full(chains=200):
+    """差分チェックの問題・中間結果が全体チェックと一致する"""
+    rng = random.Random(5)
+    base = [copy_rule(rule) for rule in get_all_rules()]
+    conditions = sorted({c for rule in base for c in rule.conditions} | {rule.action for rule in base})
+    conditions += ["新しい条件1", "新しい条件2"]
+
+    edits = 0
+    mismatches = 0
+    for _ in range(chains):
+        rules = [copy_rule(rule) for rule in base]
+        state = validate_knowledge_base(KnowledgeBase(rules))
+        for _ in range(EDITS_PER_CHAIN):
+            rules = [copy_rule(rule) for rule in rules]
+            old_rule, new_rule = random_edit(rng, rules, conditions)
+            if not rules:
+                break
+            knowledge_base = KnowledgeBase(rules)
+            # 同じバージョンのキャッシュ済みの結果ではなく、差分チェックの結果を比べる
+            validation._state_cache.clear()
+            incremental = validate_rule_edit(state, old_rule, new_rule, knowledge_base)
+            full = validate_knowledge_base(knowledge_base)
+            edits += 1
+            if (
+                incremental.issues != full.issues
+                or incremental.reachable != full.reachable
+                or incremental.unreferenced != full.unreferenced
+            ):
+                mismatches += 1
+                print(f"[NG] {old_rule} -> {new_rule}")
+            state = incremental
+    print(f"編集: {edits} / 不一致: {mismatches}")
+    assert mismatches == 0
+
+
+if __name__ == "__main__":
+    test_incremental_matches_full(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""ベクトル化評価・一括診断のテスト
+
+VectorizedRuleEvaluatorと一括診断（diagnose_batch）の結果が、同じ事実を与えた
+推論エンジン（FixpointSolver）のルールステータス・仮説・次の質問と一致することを確認する。
+サーバーは不要（推論エンジンを直接使う）。
+
+使い方:
+  python test_vectorized.py [ランダムな事実の組の数]
+"""
+import random
+import sys
+
+from core import FactStatus
+from engine import InferenceEngine, VectorizedRuleEvaluator, diagnose_batch
+from knowledge import get_knowledge_base
+
+FACT_VALUES = [FactStatus.TRUE, FactStatus.FALSE, FactStatus.UNKNOWN]
+
+
+def random_fact_sets(count, seed=0):
+    """条件（導出条件を含む）の一部に値を与えた事実の組"""
+    knowledge_base = get_knowledge_base()
+    conditions = sorted(knowledge_base.rules_by_condition)
+    rng = random.Random(seed)
+    fact_sets = []
+    for _ in range(count):
+        ratio = rng.choice([0.05, 0.2, 0.5])
+        fact_sets.append({
+            condition: rng.choice(FACT_VALUES)
+            for condition in conditions if rng.random() < ratio
+        })
+    return fact_sets
+
+
+def solve_with_engine(facts):
+    """推論エンジンで事実から不動点まで評価する"""
+    engine = InferenceEngine(use_transposition=False)
+    for condition, value in facts.items():
+        engine.working_memory.put_finding(condition, value)
+    engine.solver.solve()
+    return engine
+
+
+def test_vectorized_solve(count=500):
+    """ベクトル化評価のステータス・仮説が推論エンジンと一致する"""
+    knowledge_base = get_knowledge_base()
+    vectorized = VectorizedRuleEvaluator(knowledge_base)
+    fact_sets = random_fact_sets(count)
+    statuses, hypotheses = vectorized.solve(vectorized.encode_facts(fact_sets))
+
+    mismatches = 0
+    for row, facts in enumerate(fact_sets):
+        engine = solve_with_engine(facts)
+        differing = {
+            rule_id: status for rule_id, status in vectorized.decode_statuses(statuses, row).items()
+            if status != engine.rule_states.status(rule_id)
+        }
+        if differing or vectorized.decode_facts(hypotheses, row) != engine.working_memory.hypotheses:
+            mismatches += 1
+            print(f"[NG] row={row}")
+    print(f"ベクトル化評価: {count} ケース / 不一致: {mismatches}")
+    assert mismatches == 0
+
+
+def test_diagnose_batch(count=300):
+    """一括診断のゴールの状態・導出された事実・次の質問が推論エンジンと一致する"""
+    knowledge_base = get_knowledge_base()
+    fact_sets = random_fact_sets(count, seed=1)
+    results = diagnose_batch(knowledge_base, fact_sets)
+
+    mismatches = 0
+    for row, (facts, result) in enumerate(zip(fact_sets, results)):
+        engine = solve_with_engine(facts)
+        next_question = engine._get_next_question()
+        goal_statuses = [engine.rule_states.status(goal.id).value for goal in knowledge_base.goal_rules]
+        if (
+            result["next_question"] != next_question
+            or [g["status"] for g in result["goal_statuses"]] != goal_statuses
+            or sorted(result["derived_facts"]) != sorted(engine.working_memory.hypotheses)
+        ):
+            mismatches += 1
+            print(f"[NG] row={row}")
+    print(f"一括診断: {count} ケース / 不一致: {mismatches}")
+    assert mismatches == 0
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    test_vectorized_solve(count)
+    test_diagnose_batch(count)
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""仮定分析のテスト
+
+find_answer_changesの結果が、変える回答の直前まで最初から回答し直したエンジンに
+別の回答とそれ以降の回答を与えた結果と一致することを確認する。
+問診票の初期事実より前まで戻った後の診断も含め、初期事実は変える対象にしない。
+サーバーは不要（推論エンジンを直接使う）。
+
+使い方:
+  python test_whatif.py [回答列の数]
+"""
+import json
+import random
+import sys
+from contextlib import contextmanager
+
+import knowledge.store as store
+from core import FactStatus, Rule, RuleStatus
+from engine import InferenceEngine
+from knowledge import KnowledgeBase
+from services.question_dag import questionnaire_roots
+from services.whatif import find_answer_changes
+
+MAX_ANSWERS = 40
+
+
+@contextmanager
+def knowledge_base_of(rules):
+    """rulesの知識ベースを公開中のものとして推論エンジンを作る"""
+    saved = store._knowledge_base
+    store._knowledge_base = KnowledgeBase(rules)
+    try:
+        yield store._knowledge_base
+    finally:
+        store._knowledge_base = saved
+
+
+def replay(initial_facts, answers):
+    """初期事実（所見の組）と回答列を最初から処理した推論エンジン"""
+    engine = InferenceEngine(use_transposition=False)
+    for condition, status in initial_facts:
+        engine.working_memory.put_finding(condition, status)
+    engine.start_consultation()
+    for condition, status in answers:
+        engine.answer_question(condition, InferenceEngine.STATUS_ANSWERS[status])
+    return engine
+
+
+def expected_changes(engine, initial_length):
+    """回答を1つずつ変えて最初から処理し直した場合の、新たに該当するビザ"""
+    history = list(engine.working_memory.answer_history)
+    initial_facts, answers = history[:initial_length], history[initial_length:]
+    goals = [
+        goal for goal in engine.knowledge_base.goal_rules
+        if engine.rule_states.status(goal.id) != RuleStatus.FIRED
+    ]
+    changes = []
+    for index, (condition, status) in enumerate(answers):
+        for alternative in (FactStatus.TRUE, FactStatus.FALSE, FactStatus.UNKNOWN):
+            if alternative == status:
+                continue
+            child = replay(initial_facts, answers[:index]).fork()
+            child.assume([(condition, alternative)] + answers[index + 1:])
+            visas = [
+                goal.action for goal in goals
+                if child.rule_states.status(goal.id) == RuleStatus.FIRED
+            ]
+            if visas:
+                changes.append({
+                    "condition": condition,
+                    "answer": InferenceEngine.STATUS_ANSWERS[alternative],
+                    "previous_answer": InferenceEngine.STATUS_ANSWERS[status],
+                    "visas": visas
+                })
+    return changes
+
+
+def answer_until_complete(engine, rng):
+    while engine.current_question and not engine._is_diagnosis_complete():
+        if len(engine.working_memory.answer_history) >= MAX_ANSWERS:
+            break
+        engine.answer_question(engine.current_question, rng.choice(["yes", "no", "unknown"]))
+
+
+def test_initial_fact_not_changed_after_going_back_past_start():
+    """G1=AND(a,b), G2=AND(b,c): 初期事実 a=いいえ, c=はい から c まで取り消した後も a は変えない"""
+    rules = [
+        Rule(["a", "b"], "G1", is_goal_action=True),
+        Rule(["b", "c"], "G2", is_goal_action=True),
+    ]
+    with knowledge_base_of(rules):
+        engine = replay([("a", FactStatus.FALSE), ("c", FactStatus.TRUE)], [])
+        engine.answer_question("b", "yes")
+        engine.go_back(2)
+        assert engine.initial_length == 1
+        engine.answer_question(engine.current_question, "yes")
+        engine.answer_question(engine.current_question, "no")
+        assert engine.working_memory.answer_history == [
+            ("a", FactStatus.FALSE), ("b", FactStatus.TRUE), ("c", FactStatus.FALSE)
+        ]
+        # a を「はい」にすればG1が該当するが、a は初期事実なので対象にしない
+        for restored in (engine, InferenceEngine.from_state(json.loads(json.dumps(engine.to_state())))):
+            changes = find_answer_changes(restored)
+            assert [change["condition"] for change in changes] == ["c"]
+            assert changes == expected_changes(restored, 1)
+
+
+def test_whatif_after_going_back_past_start(count=60):
+    """初期事実より前まで戻った後も、初期事実を除く回答だけを変える"""
+    roots = [facts for facts in questionnaire_roots() if len(facts) >= 2]
+    assert roots
+    mismatches = 0
+    for seed in range(count):
+        rng = random.Random(seed)
+        initial_facts = [
+            (name, FactStatus.TRUE if value else FactStatus.FALSE) for name, value in rng.choice(roots)
+        ]
+        engine = replay(initial_facts, [])
+        for _ in range(rng.randint(0, 3)):
+            if engine.current_question:
+                engine.answer_question(engine.current_question, rng.choice(["yes", "no", "unknown"]))
+        # 回答をすべて取り消し、さらに初期事実を1つ以上取り消す
+        answered = len(engine.working_memory.answer_history) - len(initial_facts)
+        engine.go_back(answered + rng.randint(1, len(initial_facts) - 1))
+        remaining = len(engine.working_memory.answer_history)
+        assert engine.initial_length == remaining
+
+        answer_until_complete(engine, rng)
+        if rng.random() < 0.5:
+            engine = InferenceEngine.from_state(json.loads(json.dumps(engine.to_state())))
+
+        changes = find_answer_changes(engine)
+        # 取り消した初期事実は、その後に質問されれば回答として変える対象になる
+        initial_conditions = {condition for condition, _ in engine.working_memory.answer_history[:remaining]}
+        if changes != expected_changes(engine, remaining) or any(
+            change["condition"] in initial_conditions for change in changes
+        ):
+            mismatches += 1
+            print(f"[NG] seed={seed}")
+    print(f"初期事実より前まで戻った診断: {count} / 不一致: {mismatches}")
+    assert mismatches == 0
+
+
+if __name__ == "__main__":
+    test_initial_fact_not_changed_after_going_back_past_start()
+    print("[OK] 初期事実より前まで戻った後も、残った初期事実は変えない")
+    test_whatif_after_going_back_past_start(int(sys.argv[1]) if len(sys.argv) > 1 else 60)